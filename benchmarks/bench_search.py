@@ -0,0 +1,90 @@
+"""Время построения индексов поиска, запросов фильтра и обновления индексов после правок на большом архиве"""
+import os
+import random
+import sys
+import time
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rpa_engine import ChunkIndex, ChunkSearch
+
+CHUNKS = 200_000
+FOLDERS = ["images", "images/bg", "images/characters/eileen", "audio/music", "audio/sfx", "gui", "video"]
+EXTENSIONS = [".png", ".webp", ".jpg", ".ogg", ".txt", ".mp4"]
+QUERIES = [
+    ("prefix 1 char", dict(name="f")),
+    ("prefix 6 chars", dict(name="file_0")),
+    ("folder", dict(name="eileen")),
+    ("exact name", dict(name="file_012345")),
+    ("type", dict(ext=".png")),
+    ("size range", dict(min_size=10_000, max_size=2_000_000)),
+    ("name+type+size", dict(name="eileen", ext=".png", min_size=1_000_000)),
+]
+# Правки архива, после которых фильтр запрашивается заново
+EDITS = [
+    ("замена 1", lambda chunks: replace_rows(chunks, [100_000])),
+    ("замена 1000", lambda chunks: replace_rows(chunks, range(0, CHUNKS, CHUNKS // 1000))),
+    ("удаление 1000", lambda chunks: delete_rows(chunks, range(0, CHUNKS, CHUNKS // 1000))),
+    ("перенос 100", lambda chunks: move_rows(chunks, range(500, 600), 150_000)),
+    ("добавление 1000", lambda chunks: add_rows(chunks, 1000)),
+]
+
+def make_index(count: int) -> ChunkIndex:
+    """Индекс без исходного файла: для поиска нужны только имена, типы и размеры"""
+    rng = random.Random(0)
+    names = [f"{rng.choice(FOLDERS)}/file_{i:06d}{rng.choice(EXTENSIONS)}" for i in range(count)]
+    lengths = array('Q', [rng.randrange(100, 5_000_000) for _ in range(count)])
+    chunks = ChunkIndex(None, array('Q', range(count)), lengths, names)
+    chunks.exts = [os.path.splitext(name)[1] for name in names]
+    return chunks
+
+def replace_rows(chunks: ChunkIndex, rows) -> list:
+    """Заменяет содержимое строк rows, как ReplaceCommand, и возвращает их"""
+    rows = list(rows)
+    for row in rows:
+        chunks[row] = b"\x89PNG\r\n\x1a\n" + bytes(row % 5000)
+    return rows
+
+def delete_rows(chunks: ChunkIndex, rows) -> list:
+    """Удаляет строки rows, как DeleteCommand; строки с новым содержимым не появляются"""
+    chunks.take_rows(rows)
+    return []
+
+def move_rows(chunks: ChunkIndex, rows, destination: int) -> list:
+    """Переносит строки rows перед строкой destination, как MoveCommand"""
+    chunks.reorder(chunks.move_order(list(rows), destination))
+    return []
+
+def add_rows(chunks: ChunkIndex, count: int) -> list:
+    """Добавляет count файлов в конец архива, как AddCommand"""
+    for i in range(count):
+        chunks.append(bytes(i), f"images/added/file_{i:06d}.txt", ".txt")
+    return []
+
+def main():
+    chunks = make_index(CHUNKS)
+    start = time.perf_counter()
+    search = ChunkSearch(chunks)
+    print(f"построение индексов на {CHUNKS} фрагментах: {(time.perf_counter() - start) * 1000:7.1f} мс")
+    for label, query in QUERIES:
+        start = time.perf_counter()
+        rows = search.query(**query)
+        print(f"{label:<15} {len(rows):7d} строк  {(time.perf_counter() - start) * 1000:7.1f} мс")
+    
+    # Правка и повторный запрос: обновление индексов против построения заново
+    label, query = QUERIES[-1]
+    for edit, apply in EDITS:
+        rows = apply(chunks)
+        start = time.perf_counter()
+        search.update(rows)
+        found = search.query(**query)
+        updated = time.perf_counter() - start
+        start = time.perf_counter()
+        expected = ChunkSearch(chunks).query(**query)
+        rebuilt = time.perf_counter() - start
+        assert found == expected
+        print(f"{edit:<15} + {label}: обновление {updated * 1000:7.1f} мс, построение заново {rebuilt * 1000:7.1f} мс")
+
+if __name__ == "__main__":
+    main()
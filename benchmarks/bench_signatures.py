@@ -0,0 +1,52 @@
+"""Сравнение линейного перебора сигнатур с предкомпилированной таблицей"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rpa_engine import SignatureMatcher, load_signatures
+
+SAMPLES = 100_000
+
+def linear_match(head: bytes, signatures: list):
+    """Прежний способ: разбор hex и startswith для каждой сигнатуры подряд"""
+    for sig in signatures:
+        magic_bytes = bytes.fromhex(sig["magic"])
+        if head.startswith(magic_bytes, sig.get("offset", 0)):
+            return sig["extension"]
+    return None
+
+def make_samples(signatures: list, count: int) -> list:
+    """Смесь заголовков известных форматов и случайных данных"""
+    rng = random.Random(0)
+    samples = []
+    for _ in range(count):
+        head = bytearray(rng.randbytes(64))
+        if rng.random() < 0.5:
+            sig = rng.choice(signatures)
+            magic = bytes.fromhex(sig["magic"])
+            offset = sig.get("offset", 0)
+            head[offset:offset + len(magic)] = magic
+        samples.append(bytes(head))
+    return samples
+
+def bench(name: str, func, samples: list):
+    start = time.perf_counter()
+    for head in samples:
+        func(head)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10} {elapsed:8.3f} s  {len(samples) / elapsed:12,.0f} заголовков/с")
+    return elapsed
+
+def main():
+    signatures = load_signatures()["signatures"]
+    samples = make_samples(signatures, SAMPLES)
+    linear = bench("linear", lambda head: linear_match(head, signatures), samples)
+    matcher = SignatureMatcher(signatures)
+    compiled = bench("matcher", matcher.match, samples)
+    print(f"ускорение: {linear / compiled:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Холодный запуск интерфейса: время от старта процесса до первого показанного окна.
+
+Каждый замер - новый процесс Python. Без дисплея запускайте с QT_QPA_PLATFORM=offscreen.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+RUNS = 10
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Код дочернего процесса: импорт main, создание окна и первый проход цикла событий
+CHILD = r"""
+import sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QTimer
+app = QApplication([])
+app.setStyle(main.get_config_data()["icon_style"])
+win = main.RPAExtractor()
+win.show()
+QTimer.singleShot(0, app.quit)
+app.exec()
+shown = time.perf_counter()
+print(f"{imported - start:.6f} {shown - start:.6f} {int('PyQt6.QtMultimedia' in sys.modules)}")
+"""
+
+def run_once():
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, capture_output=True, text=True, check=True)
+    total = time.perf_counter() - start
+    imported, shown, multimedia = result.stdout.split()
+    return float(imported), float(shown), total, multimedia == "1"
+
+def main():
+    runs = [run_once() for _ in range(RUNS)]
+    for label, column in (("import main", 0), ("first window", 1), ("process total", 2)):
+        values = [run[column] * 1000 for run in runs]
+        print(f"{label:<14} median {statistics.median(values):7.1f} ms  min {min(values):7.1f} ms")
+    print(f"QtMultimedia loaded at start: {any(run[3] for run in runs)}")
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,39 @@
 import os
-import io
 import json
-import hashlib
 import struct
-import shutil
+import time
+import bisect
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from PyQt6.QtWidgets import (
-    QApplication, QMainWindow, QFileDialog, QTreeWidget, QTreeWidgetItem,
+    QApplication, QMainWindow, QFileDialog, QTreeView,
     QVBoxLayout, QWidget, QPushButton, QHBoxLayout, QMessageBox,
     QSplitter, QLabel, QMenu, QDialog, QTextEdit, QTableWidget,
     QTableWidgetItem, QHeaderView, QAbstractItemView, QSizePolicy,
-    QSlider, QStyle, QComboBox, QDialogButtonBox, QFormLayout, QStyleFactory
+    QSlider, QStyle, QComboBox, QDialogButtonBox, QFormLayout, QStyleFactory, QToolBar,
+    QPlainTextEdit, QTableView, QLineEdit
+)
+from PyQt6.QtCore import (
+    Qt, QMimeData, QByteArray, QSize, QTranslator, QLibraryInfo, QLocale, QBuffer, QIODevice,
+    QObject, QThread, pyqtSignal, QAbstractTableModel, QModelIndex, QItemSelection, QItemSelectionModel
+)
+from PyQt6.QtGui import (
+    QPixmap, QImage, QImageReader, QFontDatabase, QDrag, QAction, QIcon, QFont, QColor, QPalette,
+    QKeySequence, QUndoStack, QUndoCommand
 )
-from PyQt6.QtCore import Qt, QMimeData, QByteArray, QSize, QTranslator, QLibraryInfo, QLocale, QBuffer, QIODevice
-from PyQt6.QtGui import QPixmap, QImage, QDrag, QAction, QIcon, QFont, QColor, QPalette
-from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
-from PyQt6.QtMultimediaWidgets import QVideoWidget
 import sys
-
-def split_by_magic(data: bytes, magic: bytes) -> list[bytes]:
-    result = []
-    start = 0
-    while True:
-        idx = data.find(magic, start)
-        if idx == -1:
-            result.append(data[start:])
-            break
-        result.append(data[start:idx])
-        start = idx + len(magic)
-    return result
+from rpa_engine import (
+    RENPY_MAGIC, INDEX_CACHE_LIMIT, OperationCancelled, ArchiveDiff, ChunkIndex, ChunkSearch, FileBlob, IndexCache,
+    apply_archive_patch, extract_chunks, find_archives, ingest_files, process_archives, read_replace_mapping,
+    resolve_replacements, compute_digests, guess_extension, format_size, parse_size
+)
 
 # Конфигурационные файлы
-SIGNATURES_FILE = "signatures.json"
 LANG_FILE = "lang.json"
 CONFIG_FILE = "config.json"
 
-# Стандартные сигнатуры файлов (если файл не существует)
-DEFAULT_SIGNATURES = {
-    "signatures": [
-        {"magic": "89504E47", "extension": ".png", "description": "PNG Image"},
-        {"magic": "FFD8FF", "extension": ".jpg", "description": "JPEG Image"},
-        {"magic": "4F676753", "extension": ".ogg", "description": "Ogg Vorbis Audio"},
-        {"magic": "52494646", "extension": ".wav", "description": "WAV Audio"},
-        {"magic": "494433", "extension": ".mp3", "description": "MP3 Audio"},
-        {"magic": "664C6143", "extension": ".flac", "description": "FLAC Audio"},
-        {"magic": "1A45DFA3", "extension": ".mkv", "description": "Matroska Video"},
-        {"magic": "0000002066747970", "extension": ".mp4", "description": "MP4 Video"},
-        {"magic": "25504446", "extension": ".pdf", "description": "PDF Document"},
-        {"magic": "7B5C727466", "extension": ".rtf", "description": "Rich Text Format"},
-        {"magic": "504B0304", "extension": ".zip", "description": "ZIP Archive"},
-        {"magic": "7F454C46", "extension": ".elf", "description": "ELF Executable"},
-        {"magic": "4D5A", "extension": ".exe", "description": "Windows Executable"},
-        {"magic": "2321", "extension": ".sh", "description": "Shell Script"},
-        {"magic": "47494638", "extension": ".gif", "description": "GIF Image"},
-        {"magic": "52617221", "extension": ".rar", "description": "RAR Archive"},
-        {"magic": "1F8B08", "extension": ".gz", "description": "GZIP Archive"}
-    ]
-}
-
 # Стандартные языковые настройки
 DEFAULT_LANGUAGES = {
     "languages": {
@@ -101,7 +77,56 @@ DEFAULT_LANGUAGES = {
             "about_text": "This is a powerful tool for working with Ren'Py RPA archives.\n\nVersion: 1.0\nDeveloped by Бюро переводов 'Феникс & Ко'",
             "play": "Play",
             "pause": "Pause",
-            "stop": "Stop"
+            "stop": "Stop",
+            "cancel": "Cancel",
+            "loading_progress": "Loading: {:.1f} of {:.1f} MB ({:.1f} MB/s)",
+            "loading_cancelled": "Loading cancelled",
+            "extracting_progress": "Extracting: {:.1f} of {:.1f} MB ({:.1f} MB/s)",
+            "extraction_cancelled": "Extraction cancelled",
+            "batch_process": "Batch processing...",
+            "batch_title": "Batch processing",
+            "batch_folder": "Archives folder:",
+            "batch_action": "Action:",
+            "batch_output": "Output folder:",
+            "batch_list": "List contents",
+            "batch_extract": "Extract",
+            "batch_verify": "Verify",
+            "batch_start": "Start",
+            "batch_searching": "Searching for archives...",
+            "batch_progress": "Archives: {0} of {1}, {2:.1f} MB ({3:.1f} MB/s)",
+            "batch_finished": "Done: {0} archives, {1} files, {2:.1f} MB in {3:.1f} s ({4:.1f} MB/s), errors: {5}",
+            "batch_cancelled": "Batch processing cancelled",
+            "filter_name": "Filter by name or folder...",
+            "filter_all_types": "All types",
+            "filter_min_size": "Min size (e.g. 10K)",
+            "filter_max_size": "Max size (e.g. 2M)",
+            "filter_found": "Found {0} of {1} files",
+            "filter_bad_size": "Invalid size: use a number with an optional K, M or G suffix",
+            "filter_hashing": "Computing checksums: {0} of {1} files",
+            "filter_hashing_cancelled": "Checksum computation cancelled",
+            "create_patch": "Create patch...",
+            "apply_patch": "Apply patch...",
+            "patch_progress": "Processing patch: {0}%",
+            "patch_created": "Patch saved: {0} ({1} added, {2} removed, {3} moved, {4} changed; {5:.2f} MB)",
+            "patch_applied": "Patched archive saved: {0} ({1} files)",
+            "patch_cancelled": "Patch cancelled",
+            "undo": "Undo",
+            "redo": "Redo",
+            "undo_replace": "replace {0}",
+            "undo_add": "add {0} files",
+            "undo_delete": "delete {0} files",
+            "undone": "Undone: {0}",
+            "redone": "Redone: {0}",
+            "undo_move": "move {0} files",
+            "add_folder": "Add Folder",
+            "ingest_scanning": "Scanning folders: {0} files found",
+            "ingest_progress": "Preparing files: {0} of {1}",
+            "ingest_cancelled": "Adding files cancelled",
+            "bulk_replace_folder": "Replace from Folder...",
+            "bulk_replace_manifest": "Replace from Manifest...",
+            "bulk_replace_confirm": "Replace {0} files? {1} of them change size ({2:+.2f} MB in total).",
+            "bulk_replaced": "Replaced {0} files from {1}",
+            "undo_bulk_replace": "replace {0} files"
         },
         "ru": {
             "app_title": "Ren'Py RPA Archiver",
@@ -143,7 +168,56 @@ DEFAULT_LANGUAGES = {
             "about_text": "Это мощный инструмент для работы с архивами Ren'Py RPA.\n\nВерсия: 1.0\nРазработано командой Бюро переводов 'Феникс & Ко'",
             "play": "Воспроизвести",
             "pause": "Пауза",
-            "stop": "Стоп"
+            "stop": "Стоп",
+            "cancel": "Отмена",
+            "loading_progress": "Загрузка: {:.1f} из {:.1f} МБ ({:.1f} МБ/с)",
+            "loading_cancelled": "Загрузка отменена",
+            "extracting_progress": "Извлечение: {:.1f} из {:.1f} МБ ({:.1f} МБ/с)",
+            "extraction_cancelled": "Извлечение отменено",
+            "batch_process": "Пакетная обработка...",
+            "batch_title": "Пакетная обработка",
+            "batch_folder": "Папка с архивами:",
+            "batch_action": "Действие:",
+            "batch_output": "Папка для извлечения:",
+            "batch_list": "Список содержимого",
+            "batch_extract": "Извлечь",
+            "batch_verify": "Проверить",
+            "batch_start": "Начать",
+            "batch_searching": "Поиск архивов...",
+            "batch_progress": "Архивов: {0} из {1}, {2:.1f} МБ ({3:.1f} МБ/с)",
+            "batch_finished": "Готово: архивов {0}, файлов {1}, {2:.1f} МБ за {3:.1f} с ({4:.1f} МБ/с), ошибок: {5}",
+            "batch_cancelled": "Пакетная обработка отменена",
+            "filter_name": "Фильтр по имени или папке...",
+            "filter_all_types": "Все типы",
+            "filter_min_size": "Мин. размер (напр. 10K)",
+            "filter_max_size": "Макс. размер (напр. 2M)",
+            "filter_found": "Найдено {0} из {1} файлов",
+            "filter_bad_size": "Неверный размер: укажите число с необязательным суффиксом K, M или G",
+            "filter_hashing": "Подсчёт контрольных сумм: {0} из {1} файлов",
+            "filter_hashing_cancelled": "Подсчёт контрольных сумм отменён",
+            "create_patch": "Создать обновление...",
+            "apply_patch": "Применить обновление...",
+            "patch_progress": "Обработка обновления: {0}%",
+            "patch_created": "Обновление сохранено: {0} (добавлено {1}, удалено {2}, перемещено {3}, изменено {4}; {5:.2f} МБ)",
+            "patch_applied": "Обновлённый архив сохранён: {0} (файлов: {1})",
+            "patch_cancelled": "Обновление отменено",
+            "undo": "Отменить",
+            "redo": "Повторить",
+            "undo_replace": "замена {0}",
+            "undo_add": "добавление файлов: {0}",
+            "undo_delete": "удаление файлов: {0}",
+            "undone": "Отменено: {0}",
+            "redone": "Повторено: {0}",
+            "undo_move": "перемещение файлов: {0}",
+            "add_folder": "Добавить папку",
+            "ingest_scanning": "Обход папок: найдено файлов: {0}",
+            "ingest_progress": "Подготовка файлов: {0} из {1}",
+            "ingest_cancelled": "Добавление файлов отменено",
+            "bulk_replace_folder": "Заменить из папки...",
+            "bulk_replace_manifest": "Заменить по манифесту...",
+            "bulk_replace_confirm": "Заменить файлов: {0}? Размер меняется у {1} ({2:+.2f} МБ в сумме).",
+            "bulk_replaced": "Заменено файлов: {0} из {1}",
+            "undo_bulk_replace": "замена файлов: {0}"
         },
         "uk": {
             "app_title": "Ren'Py RPA Archiver",
@@ -185,7 +259,56 @@ DEFAULT_LANGUAGES = {
             "about_text": "Це потужний інструмент для роботи з архівами Ren'Py RPA.\n\nВерсія: 1.0\nРозроблено командою Бюро переводов 'Феникс & Ко'",
             "play": "Відтворити",
             "pause": "Пауза",
-            "stop": "Стоп"
+            "stop": "Стоп",
+            "cancel": "Скасувати",
+            "loading_progress": "Завантаження: {:.1f} з {:.1f} МБ ({:.1f} МБ/с)",
+            "loading_cancelled": "Завантаження скасовано",
+            "extracting_progress": "Видобування: {:.1f} з {:.1f} МБ ({:.1f} МБ/с)",
+            "extraction_cancelled": "Видобування скасовано",
+            "batch_process": "Пакетна обробка...",
+            "batch_title": "Пакетна обробка",
+            "batch_folder": "Тека з архівами:",
+            "batch_action": "Дія:",
+            "batch_output": "Тека для видобування:",
+            "batch_list": "Список вмісту",
+            "batch_extract": "Видобути",
+            "batch_verify": "Перевірити",
+            "batch_start": "Почати",
+            "batch_searching": "Пошук архівів...",
+            "batch_progress": "Архівів: {0} з {1}, {2:.1f} МБ ({3:.1f} МБ/с)",
+            "batch_finished": "Готово: архівів {0}, файлів {1}, {2:.1f} МБ за {3:.1f} с ({4:.1f} МБ/с), помилок: {5}",
+            "batch_cancelled": "Пакетну обробку скасовано",
+            "filter_name": "Фільтр за назвою або текою...",
+            "filter_all_types": "Усі типи",
+            "filter_min_size": "Мін. розмір (напр. 10K)",
+            "filter_max_size": "Макс. розмір (напр. 2M)",
+            "filter_found": "Знайдено {0} з {1} файлів",
+            "filter_bad_size": "Неправильний розмір: вкажіть число з необов'язковим суфіксом K, M або G",
+            "filter_hashing": "Обчислення контрольних сум: {0} з {1} файлів",
+            "filter_hashing_cancelled": "Обчислення контрольних сум скасовано",
+            "create_patch": "Створити оновлення...",
+            "apply_patch": "Застосувати оновлення...",
+            "patch_progress": "Обробка оновлення: {0}%",
+            "patch_created": "Оновлення збережено: {0} (додано {1}, видалено {2}, переміщено {3}, змінено {4}; {5:.2f} МБ)",
+            "patch_applied": "Оновлений архів збережено: {0} (файлів: {1})",
+            "patch_cancelled": "Оновлення скасовано",
+            "undo": "Скасувати",
+            "redo": "Повторити",
+            "undo_replace": "заміна {0}",
+            "undo_add": "додавання файлів: {0}",
+            "undo_delete": "видалення файлів: {0}",
+            "undone": "Скасовано: {0}",
+            "redone": "Повторено: {0}",
+            "undo_move": "переміщення файлів: {0}",
+            "add_folder": "Додати теку",
+            "ingest_scanning": "Обхід тек: знайдено файлів: {0}",
+            "ingest_progress": "Підготовка файлів: {0} з {1}",
+            "ingest_cancelled": "Додавання файлів скасовано",
+            "bulk_replace_folder": "Замінити з теки...",
+            "bulk_replace_manifest": "Замінити за маніфестом...",
+            "bulk_replace_confirm": "Замінити файлів: {0}? Розмір змінюється у {1} ({2:+.2f} МБ загалом).",
+            "bulk_replaced": "Замінено файлів: {0} з {1}",
+            "undo_bulk_replace": "заміна файлів: {0}"
         },
         "ja": {
             "app_title": "Ren'Py RPA 解凍ツール",
@@ -227,7 +350,56 @@ DEFAULT_LANGUAGES = {
             "about_text": "Ren'Py RPA アーカイブを操作するための強力なツールです。\n\nバージョン: 1.0\nБюро переводов 「Феникс & Ко」 チーム開発",
             "play": "再生",
             "pause": "一時停止",
-            "stop": "停止"
+            "stop": "停止",
+            "cancel": "キャンセル",
+            "loading_progress": "読み込み中: {:.1f} / {:.1f} MB ({:.1f} MB/s)",
+            "loading_cancelled": "読み込みをキャンセルしました",
+            "extracting_progress": "抽出中: {:.1f} / {:.1f} MB ({:.1f} MB/s)",
+            "extraction_cancelled": "抽出をキャンセルしました",
+            "batch_process": "一括処理...",
+            "batch_title": "一括処理",
+            "batch_folder": "アーカイブのフォルダ:",
+            "batch_action": "操作:",
+            "batch_output": "出力フォルダ:",
+            "batch_list": "内容を一覧表示",
+            "batch_extract": "抽出",
+            "batch_verify": "検証",
+            "batch_start": "開始",
+            "batch_searching": "アーカイブを検索中...",
+            "batch_progress": "アーカイブ: {0} / {1}、{2:.1f} MB ({3:.1f} MB/s)",
+            "batch_finished": "完了: アーカイブ {0}、ファイル {1}、{2:.1f} MB、{3:.1f} 秒 ({4:.1f} MB/s)、エラー {5}",
+            "batch_cancelled": "一括処理をキャンセルしました",
+            "filter_name": "名前またはフォルダで絞り込み...",
+            "filter_all_types": "すべての種類",
+            "filter_min_size": "最小サイズ (例: 10K)",
+            "filter_max_size": "最大サイズ (例: 2M)",
+            "filter_found": "{1} 件中 {0} 件のファイルが見つかりました",
+            "filter_bad_size": "無効なサイズです: 数値に K、M、G の接尾辞を付けて指定してください",
+            "filter_hashing": "チェックサムを計算中: {1} 件中 {0} 件",
+            "filter_hashing_cancelled": "チェックサムの計算をキャンセルしました",
+            "create_patch": "パッチを作成...",
+            "apply_patch": "パッチを適用...",
+            "patch_progress": "パッチを処理中: {0}%",
+            "patch_created": "パッチを保存しました: {0} (追加 {1}、削除 {2}、移動 {3}、変更 {4}、{5:.2f} MB)",
+            "patch_applied": "パッチ適用済みアーカイブを保存しました: {0} ({1} ファイル)",
+            "patch_cancelled": "パッチ処理をキャンセルしました",
+            "undo": "元に戻す",
+            "redo": "やり直す",
+            "undo_replace": "{0} の置換",
+            "undo_add": "{0} ファイルの追加",
+            "undo_delete": "{0} ファイルの削除",
+            "undone": "元に戻しました: {0}",
+            "redone": "やり直しました: {0}",
+            "undo_move": "{0} ファイルの移動",
+            "add_folder": "フォルダを追加",
+            "ingest_scanning": "フォルダを走査中: {0} ファイル",
+            "ingest_progress": "ファイルを準備中: {0} / {1}",
+            "ingest_cancelled": "ファイルの追加をキャンセルしました",
+            "bulk_replace_folder": "フォルダから置換...",
+            "bulk_replace_manifest": "マニフェストから置換...",
+            "bulk_replace_confirm": "{0} ファイルを置換しますか? うち {1} ファイルのサイズが変わります (合計 {2:+.2f} MB)。",
+            "bulk_replaced": "{1} から {0} ファイルを置換しました",
+            "undo_bulk_replace": "{0} ファイルの置換"
         }
     }
 }
@@ -235,22 +407,20 @@ DEFAULT_LANGUAGES = {
 # Стандартная конфигурация
 DEFAULT_CONFIG = {
     "language": "en",
-    "icon_style": "Fusion"
+    "icon_style": "Fusion",
+    "index_cache_limit_mb": 64,
+    "thumbnail_cache_mb": 64
 }
 
 def load_json_file(filename, default_data):
-    """Загружает данные из JSON файла или создает новый со стандартными данными"""
+    """Загружает данные из JSON файла, а если его нет - возвращает стандартные, ничего не создавая"""
     try:
         if os.path.exists(filename):
             with open(filename, 'r', encoding='utf-8') as f:
                 return json.load(f)
-        else:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(default_data, f, ensure_ascii=False, indent=4)
-            return default_data
     except Exception as e:
         print(f"[ERROR] Failed to load {filename}: {str(e)}")
-        return default_data
+    return default_data
 
 def save_json_file(filename, data):
     """Сохраняет данные в JSON файл"""
@@ -262,28 +432,169 @@ def save_json_file(filename, data):
         print(f"[ERROR] Failed to save {filename}: {str(e)}")
         return False
 
-# Загрузка сигнатур и языков
-signatures_data = load_json_file(SIGNATURES_FILE, DEFAULT_SIGNATURES)
-lang_data = load_json_file(LANG_FILE, DEFAULT_LANGUAGES)
-config_data = load_json_file(CONFIG_FILE, DEFAULT_CONFIG)
+# Языки и конфигурация читаются при первом обращении, а не при импорте
+_lang_data = None
+_config_data = None
+
+def get_lang_data() -> dict:
+    """Возвращает языковые строки, загружая их при первом обращении"""
+    global _lang_data
+    if _lang_data is None:
+        _lang_data = load_json_file(LANG_FILE, DEFAULT_LANGUAGES)
+    return _lang_data
+
+def get_config_data() -> dict:
+    """Возвращает конфигурацию, загружая её при первом обращении"""
+    global _config_data
+    if _config_data is None:
+        _config_data = load_json_file(CONFIG_FILE, DEFAULT_CONFIG)
+    return _config_data
+
+class BackgroundCache(QObject):
+    """Вычисления над фрагментами в пуле потоков с LRU-кэшем результатов.
+    
+    Результаты запоминаются по ключу содержимого ChunkIndex.identity, пока их
+    суммарная стоимость (cost) не превышает budget. Готовый результат
+    приходит сигналом ready(ключ, значение) в потоке интерфейса.
+    """
+    ready = pyqtSignal(object, object)
+    # Передаёт результат из потока пула в поток интерфейса
+    computed = pyqtSignal(object, object)
+    
+    def __init__(self, budget: int, parent=None):
+        super().__init__(parent)
+        self.budget = budget
+        self.used = 0
+        self.pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+        self.values = OrderedDict()
+        self.pending = set()
+        self.computed.connect(self.on_computed)
+    
+    def compute(self, blob):
+        """Вычисляет значение для фрагмента (в потоке пула)"""
+        raise NotImplementedError
+    
+    def cost(self, value) -> int:
+        """Сколько бюджета занимает значение"""
+        return 1
+    
+    def has(self, key) -> bool:
+        """Проверяет, известно ли значение или уже поставлено в очередь"""
+        return key in self.values or key in self.pending
+    
+    def request(self, key, blob):
+        """Возвращает значение, если оно уже известно, иначе ставит вычисление в очередь и возвращает None"""
+        value = self.values.get(key)
+        if value is not None:
+            self.values.move_to_end(key)
+            return value
+        if key not in self.pending:
+            self.pending.add(key)
+            self.pool.submit(self.run, key, blob)
+        return None
+    
+    def run(self, key, blob):
+        """Вычисляет значение в потоке пула и передаёт его в поток интерфейса"""
+        try:
+            value = self.compute(blob)
+        except (ValueError, BufferError, OSError):
+            # Архив закрыли (или файл с диска пропал) раньше, чем дошла очередь
+            value = None
+        self.computed.emit(key, value)
+    
+    def on_computed(self, key, value):
+        """Запоминает результат, вытесняя давно не запрошенные, и сообщает о нём"""
+        self.pending.discard(key)
+        if value is None:
+            return
+        self.values[key] = value
+        self.used += self.cost(value)
+        while self.used > self.budget and len(self.values) > 1:
+            _, old = self.values.popitem(last=False)
+            self.used -= self.cost(old)
+        self.ready.emit(key, value)
+    
+    def shutdown(self):
+        """Отменяет ещё не начатые вычисления"""
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+class HashService(BackgroundCache):
+    """Фоновый подсчёт контрольных сумм фрагментов; hashlib отпускает GIL, так что суммы считаются параллельно"""
+    # Сколько результатов помнить
+    MAX_ENTRIES = 10000
+    
+    def __init__(self, parent=None):
+        super().__init__(self.MAX_ENTRIES, parent)
+    
+    def compute(self, blob):
+        return compute_digests(blob)
+
+# Расширения, которые предпросмотр показывает как изображения
+IMAGE_EXTENSIONS = (".png", ".jpg", ".gif", ".webp")
+# Размер миниатюры в предпросмотре
+THUMBNAIL_SIZE = QSize(400, 400)
 
-def guess_extension(blob: bytes) -> str:
-    """Определяет расширение файла на основе его сигнатуры"""
-    for sig in signatures_data["signatures"]:
-        magic_bytes = bytes.fromhex(sig["magic"])
-        if blob.startswith(magic_bytes):
-            return sig["extension"]
-    
-    # Эвристика для текстовых файлов
-    if all(0x20 <= b <= 0x7E or b in (0x09, 0x0A, 0x0D) for b in blob[:1024]):
-        return ".txt"
-    
-    return ".bin"
+class ThumbnailCache(BackgroundCache):
+    """Миниатюры изображений для предпросмотра, декодируемые в пуле потоков.
+    
+    QImageReader сразу декодирует картинку в размер миниатюры, не создавая
+    полноразмерного изображения. budget - предел памяти под миниатюры в байтах.
+    """
+    def compute(self, blob):
+        data = QByteArray(bytes(blob))
+        buffer = QBuffer(data)
+        buffer.open(QIODevice.OpenModeFlag.ReadOnly)
+        reader = QImageReader(buffer)
+        size = reader.size()
+        if size.isValid() and (size.width() > THUMBNAIL_SIZE.width() or size.height() > THUMBNAIL_SIZE.height()):
+            reader.setScaledSize(size.scaled(THUMBNAIL_SIZE, Qt.AspectRatioMode.KeepAspectRatio))
+        # Неудачно декодированная картинка тоже запоминается, чтобы не пробовать снова
+        return reader.read()
+    
+    def cost(self, image) -> int:
+        return max(image.sizeInBytes(), 1)
+
+class ChunkDevice(QIODevice):
+    """Устройство Qt только для чтения с произвольным доступом поверх данных фрагмента.
+    
+    Данные - результат ChunkIndex.view: memoryview на mmap архива, bytes
+    заменённого файла, FileBlob или PrefixedView. Байты копируются только по
+    мере чтения, так что воспроизведение начинается сразу, а память не
+    зависит от размера фрагмента.
+    """
+    def __init__(self, blob, parent=None):
+        super().__init__(parent)
+        self.data = blob
+    
+    def isSequential(self) -> bool:
+        return False
+    
+    def size(self) -> int:
+        return len(self.data)
+    
+    def readData(self, maxlen: int) -> bytes:
+        pos = self.pos()
+        try:
+            return bytes(self.data[pos:pos + maxlen])
+        except (ValueError, OSError):
+            # Архив закрыт или файл с диска пропал - для плеера это конец данных
+            return b""
+    
+    def writeData(self, data) -> int:
+        return -1
+    
+    def close(self):
+        super().close()
+        self.data = b""
 
 class MediaPlayerWidget(QWidget):
     """Виджет медиаплеера с элементами управления"""
     def __init__(self, parent=None):
         super().__init__(parent)
+        # QtMultimedia загружается долго, поэтому импортируется только при первом предпросмотре медиа
+        from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
+        from PyQt6.QtMultimediaWidgets import QVideoWidget
+        
         self.layout = QVBoxLayout(self)
         
         # Виджет для видео
@@ -339,9 +650,10 @@ class MediaPlayerWidget(QWidget):
         """Устанавливает медиа-контент для воспроизведения"""
         self.media_player.stop()
         
-        # Создаем QBuffer вместо BytesIO
-        self.buffer = QBuffer()
-        self.buffer.setData(blob)
+        # Плеер читает фрагмент прямо из отображённого архива, без копии в памяти
+        if hasattr(self, 'buffer'):
+            self.buffer.close()
+        self.buffer = ChunkDevice(blob)
         self.buffer.open(QIODevice.OpenModeFlag.ReadOnly)
         
         self.media_player.setSourceDevice(self.buffer)
@@ -365,11 +677,87 @@ class MediaPlayerWidget(QWidget):
             self.buffer.close()
         self.media_player.setSourceDevice(None)
 
+# Сколько байт текста декодируется и показывается за раз
+TEXT_PAGE_SIZE = 64 * 1024
+
+def utf8_boundary(blob, offset: int) -> int:
+    """Сдвигает offset вперёд на начало символа UTF-8 (пропускает не более 3 байт продолжения)"""
+    end = min(offset + 3, len(blob))
+    while offset < end and 0x80 <= blob[offset] <= 0xBF:
+        offset += 1
+    return offset
+
+def text_page_count(size: int) -> int:
+    """Число страниц текста размером size байт"""
+    return max(-(-size // TEXT_PAGE_SIZE), 1)
+
+def text_page(blob, page: int) -> str:
+    """Декодирует одну страницу текста.
+    
+    Границы страниц выровнены на начало символа UTF-8, поэтому многобайтовый
+    символ на стыке целиком попадает на одну страницу, а любую страницу можно
+    открыть, не декодируя предыдущие.
+    """
+    start = utf8_boundary(blob, page * TEXT_PAGE_SIZE)
+    end = utf8_boundary(blob, min((page + 1) * TEXT_PAGE_SIZE, len(blob)))
+    return bytes(blob[start:end]).decode('utf-8', errors='replace')
+
+class HexModel(QAbstractTableModel):
+    """Шестнадцатеричный дамп фрагмента: строки форматируются только при отрисовке"""
+    HEADERS = ["Offset", "Hex", "ASCII"]
+    BYTES_PER_ROW = 16
+    # Непечатные байты в столбце ASCII показываются точкой
+    ASCII_TABLE = bytes(b if 0x20 <= b <= 0x7E else 0x2E for b in range(256))
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.blob = b""
+    
+    def set_data(self, blob):
+        """Показывает другой фрагмент"""
+        self.beginResetModel()
+        self.blob = blob
+        self.endResetModel()
+    
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return -(-len(self.blob) // self.BYTES_PER_ROW)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+    
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
+            return None
+        offset = index.row() * self.BYTES_PER_ROW
+        column = index.column()
+        if column == 0:
+            return f"{offset:08X}"
+        row = bytes(self.blob[offset:offset + self.BYTES_PER_ROW])
+        if column == 1:
+            return row.hex(" ").upper()
+        return row.translate(self.ASCII_TABLE).decode('ascii')
+    
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
 class PreviewWidget(QWidget):
     """Виджет предпросмотра файлов"""
-    def __init__(self, tr, parent=None):
+    def __init__(self, tr, hash_service: HashService, thumbnails: ThumbnailCache, parent=None):
         super().__init__(parent)
         self.tr = tr
+        self.hash_service = hash_service
+        self.hash_service.ready.connect(self.on_hashed)
+        self.thumbnails = thumbnails
+        self.thumbnails.ready.connect(self.on_thumbnail)
+        # Ключ и размер фрагмента, сумму которого ждёт предпросмотр
+        self.hash_key = None
+        self.hash_size = 0
+        # Ключ изображения, миниатюру которого ждёт предпросмотр
+        self.image_key = None
         self.layout = QVBoxLayout(self)
         
         # Заголовок
@@ -394,10 +782,35 @@ class PreviewWidget(QWidget):
         self.stack_layout.addWidget(self.image_widget)
         self.image_widget.hide()
         
-        # Виджет медиаплеера
-        self.media_player = MediaPlayerWidget()
-        self.stack_layout.addWidget(self.media_player)
-        self.media_player.hide()
+        # Постраничный просмотр текста
+        self.text_blob = b""
+        self.text_page_index = 0
+        self.text_pager = QWidget()
+        pager_layout = QVBoxLayout(self.text_pager)
+        pager_layout.setContentsMargins(0, 0, 0, 0)
+        self.text_view = QPlainTextEdit()
+        self.text_view.setReadOnly(True)
+        pager_layout.addWidget(self.text_view)
+        self.page_bar = QWidget()
+        page_bar_layout = QHBoxLayout(self.page_bar)
+        page_bar_layout.setContentsMargins(0, 0, 0, 0)
+        self.prev_page_button = QPushButton()
+        self.prev_page_button.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_ArrowBack))
+        self.prev_page_button.clicked.connect(lambda: self.show_text_page(self.text_page_index - 1))
+        self.page_label = QLabel()
+        self.page_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.next_page_button = QPushButton()
+        self.next_page_button.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_ArrowForward))
+        self.next_page_button.clicked.connect(lambda: self.show_text_page(self.text_page_index + 1))
+        page_bar_layout.addWidget(self.prev_page_button)
+        page_bar_layout.addWidget(self.page_label, 1)
+        page_bar_layout.addWidget(self.next_page_button)
+        pager_layout.addWidget(self.page_bar)
+        self.stack_layout.addWidget(self.text_pager)
+        self.text_pager.hide()
+        
+        # Виджет медиаплеера создаётся при первом предпросмотре аудио или видео
+        self.media_player = None
         
         # Виджет для бинарных файлов
         self.binary_widget = QLabel()
@@ -406,6 +819,23 @@ class PreviewWidget(QWidget):
         self.stack_layout.addWidget(self.binary_widget)
         self.binary_widget.hide()
         
+        # Шестнадцатеричный просмотр бинарных файлов
+        self.hex_model = HexModel(self)
+        self.hex_view = QTableView()
+        self.hex_view.setModel(self.hex_model)
+        self.hex_view.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        # Строки одной высоты, а ширины столбцов считаются по шрифту: представлению
+        # не нужно измерять миллионы строк
+        self.hex_view.verticalHeader().hide()
+        self.hex_view.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        metrics = self.hex_view.fontMetrics()
+        self.hex_view.setColumnWidth(0, metrics.horizontalAdvance("0" * 10))
+        self.hex_view.setColumnWidth(1, metrics.horizontalAdvance("00 " * HexModel.BYTES_PER_ROW + "0"))
+        self.hex_view.horizontalHeader().setStretchLastSection(True)
+        self.hex_view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.stack_layout.addWidget(self.hex_view)
+        self.hex_view.hide()
+        
         self.layout.addWidget(self.content_stack)
     
     def clear(self):
@@ -413,56 +843,111 @@ class PreviewWidget(QWidget):
         self.text_widget.show()
         self.text_widget.setText(self.tr["select_file"])
         self.image_widget.hide()
-        self.media_player.hide()
-        self.media_player.clear()
+        self.text_pager.hide()
+        self.text_view.clear()
+        self.text_blob = b""
+        self.hex_view.hide()
+        self.hex_model.set_data(b"")
+        self.hash_key = None
+        self.image_key = None
+        if self.media_player is not None:
+            self.media_player.hide()
+            self.media_player.clear()
         self.binary_widget.hide()
     
-    def set_data(self, blob: bytes, ext: str):
-        """Устанавливает данные для предпросмотра"""
+    def get_media_player(self) -> MediaPlayerWidget:
+        """Возвращает медиаплеер, создавая его при первом обращении"""
+        if self.media_player is None:
+            self.media_player = MediaPlayerWidget()
+            # Место плеера - перед виджетом бинарных файлов, как при создании всех виджетов сразу
+            self.stack_layout.insertWidget(self.stack_layout.indexOf(self.binary_widget), self.media_player)
+        return self.media_player
+    
+    def set_data(self, blob: bytes, ext: str, key):
+        """Устанавливает данные для предпросмотра; key - ключ содержимого для кэша сумм"""
         self.clear()
         
         try:
             # Изображения
-            if ext in (".png", ".jpg", ".gif"):
-                pixmap = QPixmap()
-                pixmap.loadFromData(blob)
-                if not pixmap.isNull():
-                    self.image_widget.setPixmap(pixmap.scaled(400, 400, Qt.AspectRatioMode.KeepAspectRatio))
-                    self.image_widget.show()
-                    self.text_widget.hide()
+            if ext in IMAGE_EXTENSIONS:
+                self.image_key = key
+                image = self.thumbnails.request(key, blob)
+                if image is not None:
+                    self.show_image(image)
                 else:
-                    self.text_widget.setText("Failed to load image")
+                    self.text_widget.setText("Loading image...")
             
             # Текстовые файлы
             elif ext in (".txt", ".sh", ".py", ".json", ".xml", ".html", ".csv", ".rtf"):
-                text = blob.decode('utf-8', errors='replace')[:5000]
-                if len(blob) > 5000:
-                    text += "\n\n... [first 5000 bytes shown]"
-                self.text_widget.setText(text)
+                self.text_blob = blob
+                self.show_text_page(0)
+                self.text_pager.show()
+                self.text_widget.hide()
             
             # Аудио и видео файлы
             elif ext in (".mp3", ".wav", ".ogg", ".flac", ".mp4", ".mkv", ".avi"):
-                self.media_player.set_source(blob)
-                self.media_player.show()
+                media_player = self.get_media_player()
+                media_player.set_source(blob)
+                media_player.show()
                 self.text_widget.hide()
             
             # Бинарные файлы
             else:
-                self.binary_widget.setText(
-                    f"Binary file: {len(blob)} bytes\n" +
-                    f"MD5: {hashlib.md5(blob).hexdigest()}"
-                )
+                self.hash_key = key
+                self.hash_size = len(blob)
+                digests = self.hash_service.request(key, blob)
+                self.show_binary_info(digests)
                 self.binary_widget.show()
+                self.hex_model.set_data(blob)
+                self.hex_view.show()
                 self.text_widget.hide()
         
         except Exception as e:
             self.text_widget.setText(f"Preview error: {str(e)}")
 
+    def show_text_page(self, page: int):
+        """Декодирует и показывает одну страницу текста"""
+        count = text_page_count(len(self.text_blob))
+        self.text_page_index = min(max(page, 0), count - 1)
+        self.text_view.setPlainText(text_page(self.text_blob, self.text_page_index))
+        self.page_label.setText(f"Page {self.text_page_index + 1} of {count}")
+        self.prev_page_button.setEnabled(self.text_page_index > 0)
+        self.next_page_button.setEnabled(self.text_page_index < count - 1)
+        self.page_bar.setVisible(count > 1)
+    
+    def show_image(self, image: QImage):
+        """Показывает готовую миниатюру"""
+        if not image.isNull():
+            self.image_widget.setPixmap(QPixmap.fromImage(image))
+            self.image_widget.show()
+            self.text_widget.hide()
+        else:
+            self.text_widget.setText("Failed to load image")
+    
+    def on_thumbnail(self, key, image):
+        """Показывает миниатюру, если она декодирована для выбранного изображения"""
+        if self.image_key is not None and key == self.image_key:
+            self.show_image(image)
+    
+    def show_binary_info(self, digests):
+        """Показывает размер и MD5 бинарного файла (или что сумма ещё считается)"""
+        md5 = digests["md5"] if digests is not None else "calculating..."
+        self.binary_widget.setText(f"Binary file: {self.hash_size} bytes\n" + f"MD5: {md5}")
+    
+    def on_hashed(self, key, digests):
+        """Подставляет сумму, если она посчитана для показанного фрагмента"""
+        if self.hash_key is not None and key == self.hash_key:
+            self.show_binary_info(digests)
+
 class FileInfoDialog(QDialog):
     """Диалог с информацией о файле"""
-    def __init__(self, items, tr, parent=None):
+    def __init__(self, entries, tr, hash_service: HashService, parent=None):
         super().__init__(parent)
         self.tr = tr
+        self.hash_service = hash_service
+        # Ячейки, ждущие сумм: ключ содержимого -> [(ячейка, алгоритм)]
+        self.pending_items = {}
+        self.hash_service.ready.connect(self.on_hashed)
         self.setWindowTitle(tr["info_title"])
         self.setGeometry(200, 200, 600, 500)
         
@@ -478,37 +963,45 @@ class FileInfoDialog(QDialog):
         self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
         
         layout.addWidget(self.table)
-        self.populate_info(items)
+        self.populate_info(entries)
     
-    def populate_info(self, items):
-        """Заполняет таблицу информацией о файле(ах)"""
-        if not items:
+    def populate_info(self, entries):
+        """Заполняет таблицу информацией о файле(ах): entries - список (имя, тип, данные, ключ содержимого).
+        
+        Данные - ChunkIndex.view: здесь читаются только заголовки, а
+        контрольные суммы считаются в фоне и подставляются по мере готовности.
+        """
+        if not entries:
             return
         
         # Для одного файла
-        if len(items) == 1:
-            item = items[0]
-            blob = item.data(0, Qt.ItemDataRole.UserRole)
-            ext = item.text(1)
+        if len(entries) == 1:
+            name, ext, blob, key = entries[0]
             size = len(blob)
             
             info = {
-                "File name": item.text(0),
+                "File name": name,
                 "Type": ext,
                 "Size": f"{size} bytes ({size / 1024:.2f} KB)",
-                "MD5": hashlib.md5(blob).hexdigest(),
-                "SHA-1": hashlib.sha1(blob).hexdigest(),
-                "First 4 bytes": str(blob[:4]) if len(blob) >= 4 else "N/A",
+                "MD5": (key, "md5"),
+                "SHA-1": (key, "sha1"),
+                "First 4 bytes": str(bytes(blob[:4])) if len(blob) >= 4 else "N/A",
                 "Magic number": guess_extension(blob),
             }
             
             # Информация об изображениях
             if ext in (".png", ".jpg", ".bmp", ".gif"):
-                img = QImage()
-                img.loadFromData(blob)
-                if not img.isNull():
-                    info["Resolution"] = f"{img.width()}x{img.height()}"
-                    info["Color depth"] = f"{img.depth()} bits"
+                # Размер и формат берутся из заголовка, картинка не декодируется
+                device = ChunkDevice(blob)
+                device.open(QIODevice.OpenModeFlag.ReadOnly)
+                reader = QImageReader(device)
+                image_size = reader.size()
+                image_format = reader.imageFormat()
+                if image_size.isValid():
+                    info["Resolution"] = f"{image_size.width()}x{image_size.height()}"
+                    if image_format != QImage.Format.Format_Invalid:
+                        info["Color depth"] = f"{QImage(1, 1, image_format).depth()} bits"
+                device.close()
             
             # Информация о исполняемых файлах
             elif ext == ".exe":
@@ -525,28 +1018,52 @@ class FileInfoDialog(QDialog):
             self.table.setRowCount(len(info))
             for i, (key, value) in enumerate(info.items()):
                 self.table.setItem(i, 0, QTableWidgetItem(key))
-                self.table.setItem(i, 1, QTableWidgetItem(str(value)))
+                if isinstance(value, tuple):
+                    self.table.setItem(i, 1, self.digest_item(blob, *value))
+                else:
+                    self.table.setItem(i, 1, QTableWidgetItem(str(value)))
         
         # Для нескольких файлов
         else:
             total_size = 0
             exts = {}
-            for item in items:
-                blob = item.data(0, Qt.ItemDataRole.UserRole)
-                ext = item.text(1)
+            for name, ext, blob, key in entries:
                 total_size += len(blob)
                 exts[ext] = exts.get(ext, 0) + 1
             
             info = {
-                "Number of files": str(len(items)),
+                "Number of files": str(len(entries)),
                 "Total size": f"{total_size} bytes ({total_size / (1024*1024):.2f} MB)",
                 "File types": ", ".join([f"{k} ({v})" for k, v in exts.items()])
             }
             
-            self.table.setRowCount(len(info))
+            # Под сводкой - MD5 каждого файла; суммы считаются параллельно
+            self.table.setRowCount(len(info) + len(entries))
             for i, (key, value) in enumerate(info.items()):
                 self.table.setItem(i, 0, QTableWidgetItem(key))
                 self.table.setItem(i, 1, QTableWidgetItem(value))
+            for i, (name, ext, blob, key) in enumerate(entries, len(info)):
+                self.table.setItem(i, 0, QTableWidgetItem(f"MD5: {name}"))
+                self.table.setItem(i, 1, self.digest_item(blob, key, "md5"))
+    
+    def digest_item(self, blob, key, algorithm: str) -> QTableWidgetItem:
+        """Создаёт ячейку с контрольной суммой, которая заполнится после подсчёта"""
+        digests = self.hash_service.request(key, blob)
+        if digests is not None:
+            return QTableWidgetItem(digests[algorithm])
+        item = QTableWidgetItem("calculating...")
+        self.pending_items.setdefault(key, []).append((item, algorithm))
+        return item
+    
+    def on_hashed(self, key, digests):
+        """Подставляет посчитанные суммы в ожидающие их ячейки"""
+        for item, algorithm in self.pending_items.pop(key, []):
+            item.setText(digests[algorithm])
+    
+    def done(self, result):
+        """Отключается от службы сумм при закрытии"""
+        self.hash_service.ready.disconnect(self.on_hashed)
+        super().done(result)
 
 class SettingsDialog(QDialog):
     """Диалог настроек программы"""
@@ -636,29 +1153,711 @@ class AboutDialog(QDialog):
         
         layout.addLayout(info_layout)
 
+class BatchDialog(QDialog):
+    """Диалог пакетной обработки всех архивов в дереве каталогов"""
+    ACTIONS = ("list", "extract", "verify")
+    
+    def __init__(self, tr, parent=None):
+        super().__init__(parent)
+        self.tr = tr
+        self.thread = None
+        self.processor = None
+        self.setWindowTitle(tr["batch_title"])
+        self.setGeometry(250, 250, 700, 500)
+        
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+        form = QFormLayout()
+        layout.addLayout(form)
+        
+        # Корневой каталог
+        self.root_edit = QLineEdit()
+        form.addRow(tr["batch_folder"], self.with_browse_button(self.root_edit))
+        
+        # Действие
+        self.action_combo = QComboBox()
+        for action in self.ACTIONS:
+            self.action_combo.addItem(tr[f"batch_{action}"], action)
+        self.action_combo.currentIndexChanged.connect(self.update_output_enabled)
+        form.addRow(tr["batch_action"], self.action_combo)
+        
+        # Каталог для извлечения
+        self.output_edit = QLineEdit()
+        self.output_row = self.with_browse_button(self.output_edit)
+        form.addRow(tr["batch_output"], self.output_row)
+        self.update_output_enabled()
+        
+        # Результаты по архивам
+        self.table = QTableWidget()
+        self.table.setColumnCount(4)
+        self.table.setHorizontalHeaderLabels(["Archive", "Files", "Size", "Status"])
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        layout.addWidget(self.table)
+        
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+        
+        # Кнопки
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        self.start_button = QPushButton(tr["batch_start"])
+        self.start_button.clicked.connect(self.start)
+        buttons.addWidget(self.start_button)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel)
+        buttons.addWidget(self.cancel_button)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.reject)
+        buttons.addWidget(close_button)
+        layout.addLayout(buttons)
+    
+    def with_browse_button(self, edit: QLineEdit) -> QWidget:
+        """Возвращает строку из поля пути и кнопки выбора каталога"""
+        row = QWidget()
+        row_layout = QHBoxLayout(row)
+        row_layout.setContentsMargins(0, 0, 0, 0)
+        row_layout.addWidget(edit)
+        browse_button = QPushButton("...")
+        browse_button.clicked.connect(lambda: self.browse(edit))
+        row_layout.addWidget(browse_button)
+        return row
+    
+    def browse(self, edit: QLineEdit):
+        """Выбирает каталог для поля edit"""
+        dir_path = QFileDialog.getExistingDirectory(self, "Select folder", edit.text())
+        if dir_path:
+            edit.setText(dir_path)
+    
+    def update_output_enabled(self):
+        """Каталог вывода нужен только для извлечения"""
+        self.output_row.setEnabled(self.action_combo.currentData() == "extract")
+    
+    def start(self):
+        """Запускает обработку архивов в фоновом потоке"""
+        root = self.root_edit.text()
+        action = self.action_combo.currentData()
+        output = self.output_edit.text() if action == "extract" else None
+        if not os.path.isdir(root):
+            QMessageBox.warning(self, "Warning", "Select a folder with archives")
+            return
+        if action == "extract" and not output:
+            QMessageBox.warning(self, "Warning", "Select an output folder")
+            return
+        
+        self.table.setRowCount(0)
+        self.files = self.failed = self.total_bytes = self.archive_count = 0
+        self.started = time.monotonic()
+        self.start_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.status_label.setText(self.tr["batch_searching"])
+        
+        self.thread = QThread(self)
+        self.processor = BatchProcessor(root, action, output)
+        self.processor.moveToThread(self.thread)
+        self.thread.started.connect(self.processor.run)
+        self.processor.archives_found.connect(self.on_archives_found)
+        self.processor.archive_done.connect(self.on_archive_done)
+        self.processor.finished.connect(self.on_finished)
+        self.processor.failed.connect(self.on_failed)
+        self.processor.cancelled.connect(self.on_cancelled)
+        for signal in (self.processor.finished, self.processor.failed, self.processor.cancelled):
+            signal.connect(self.thread.quit, Qt.ConnectionType.DirectConnection)
+        self.thread.finished.connect(self.on_thread_finished)
+        self.thread.start()
+    
+    def cancel(self):
+        """Просит фоновую обработку остановиться"""
+        if self.processor is not None:
+            self.processor.cancel()
+            self.cancel_button.setEnabled(False)
+    
+    def on_archives_found(self, count):
+        """Запоминает число найденных архивов"""
+        self.archive_count = count
+        self.show_progress()
+    
+    def on_archive_done(self, result):
+        """Добавляет строку с результатом обработки архива"""
+        path, count, size, types, error = result
+        self.files += count
+        self.total_bytes += size
+        self.failed += bool(error)
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+        status = f"Error: {error}" if error else ", ".join(f"{ext} {n}" for ext, n in sorted(types.items()))
+        for column, text in enumerate((path, str(count), format_size(size), status)):
+            self.table.setItem(row, column, QTableWidgetItem(text))
+        if error:
+            self.table.item(row, 3).setForeground(QColor("red"))
+        self.show_progress()
+    
+    def show_progress(self):
+        """Показывает общий прогресс и скорость обработки"""
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        mb = 1024 * 1024
+        self.status_label.setText(self.tr["batch_progress"].format(
+            self.table.rowCount(), self.archive_count, self.total_bytes / mb, self.total_bytes / mb / elapsed))
+    
+    def on_finished(self):
+        """Показывает итог обработки"""
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        mb = 1024 * 1024
+        self.status_label.setText(self.tr["batch_finished"].format(
+            self.table.rowCount(), self.files, self.total_bytes / mb, elapsed,
+            self.total_bytes / mb / elapsed, self.failed))
+    
+    def on_failed(self, message):
+        """Сообщает об ошибке обработки"""
+        QMessageBox.critical(self, "Error", f"Batch processing error:\n{message}")
+    
+    def on_cancelled(self):
+        """Сообщает об отмене обработки"""
+        self.status_label.setText(self.tr["batch_cancelled"])
+    
+    def on_thread_finished(self):
+        """Освобождает поток и возвращает кнопки в исходное состояние"""
+        self.thread.deleteLater()
+        self.processor.deleteLater()
+        self.thread = None
+        self.processor = None
+        self.start_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+    
+    def done(self, result):
+        """Останавливает обработку при закрытии диалога"""
+        if self.thread is not None:
+            self.processor.cancel()
+            self.thread.wait()
+        super().done(result)
+
+class BackgroundTask(QObject):
+    """Основа фоновых операций с архивом: прогресс, отмена и ошибки"""
+    progress = pyqtSignal('qint64', 'qint64')
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+    
+    # Минимальный интервал между отчётами о прогрессе (сек)
+    PROGRESS_INTERVAL = 0.1
+    
+    def __init__(self):
+        super().__init__()
+        self.cancel_requested = False
+        self.last_report = 0.0
+    
+    def cancel(self):
+        """Запрашивает остановку операции (вызывается из потока интерфейса)"""
+        self.cancel_requested = True
+    
+    def report(self, done: int, total: int):
+        """Сообщает о прогрессе не чаще PROGRESS_INTERVAL и проверяет отмену"""
+        if self.cancel_requested:
+            raise OperationCancelled()
+        now = time.monotonic()
+        if now - self.last_report >= self.PROGRESS_INTERVAL:
+            self.last_report = now
+            self.progress.emit(done, total)
+
+class ArchiveLoader(BackgroundTask):
+    """Открывает архив в фоновом потоке, определяет типы фрагментов пачками и строит индексы поиска"""
+    index_ready = pyqtSignal(object)
+    rows_ready = pyqtSignal(int)
+    search_ready = pyqtSignal(object)
+    finished = pyqtSignal()
+    
+    # Число фрагментов в одной пачке
+    BATCH_SIZE = 2000
+    
+    def __init__(self, path: str, magic: bytes, cache: IndexCache = None):
+        super().__init__()
+        self.path = path
+        self.magic = magic
+        self.cache = cache
+    
+    def run(self):
+        """Сканирует архив, затем определяет типы фрагментов и отдаёт их пачками"""
+        chunks = None
+        try:
+            size = os.path.getsize(self.path)
+            chunks = ChunkIndex.open(self.path, self.magic, progress=lambda done: self.report(done, size),
+                                     cache=self.cache, recover=True)
+            # Дальше индексом владеет окно
+            self.index_ready.emit(chunks)
+            
+            # Индекс из кэша уже классифицирован
+            cached = None not in chunks.exts
+            total = sum(chunks.length(i) for i in range(len(chunks)))
+            done = total if cached else 0
+            if not cached:
+                for i in range(len(chunks)):
+                    chunks.classify(i)
+                    done += chunks.length(i)
+                    if (i + 1) % self.BATCH_SIZE == 0:
+                        self.rows_ready.emit(i + 1)
+                    self.report(done, total)
+                if self.cache is not None:
+                    self.cache.store(chunks, self.magic)
+            self.rows_ready.emit(len(chunks))
+            self.progress.emit(done, total)
+            self.search_ready.emit(ChunkSearch(chunks))
+            self.finished.emit()
+        except OperationCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class ArchiveExtractor(BackgroundTask):
+    """Извлекает фрагменты в каталог пулом потоков, не блокируя интерфейс"""
+    finished = pyqtSignal(int)
+    
+    def __init__(self, chunks: ChunkIndex, rows: list, directory: str):
+        super().__init__()
+        self.chunks = chunks
+        self.rows = rows
+        self.directory = directory
+    
+    def run(self):
+        """Извлекает фрагменты и сообщает число записанных файлов"""
+        try:
+            count = extract_chunks(self.chunks, self.rows, self.directory, progress=self.report)
+            self.finished.emit(count)
+        except OperationCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class DigestIndexer(BackgroundTask):
+    """Считает контрольные суммы всех фрагментов для поиска по сумме"""
+    finished = pyqtSignal()
+    
+    def __init__(self, search: ChunkSearch):
+        super().__init__()
+        self.search = search
+    
+    def run(self):
+        """Строит словарь сумм индекса поиска"""
+        try:
+            self.search.index_digests(progress=self.report)
+            self.finished.emit()
+        except OperationCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class FileIngester(BackgroundTask):
+    """Обходит выбранные файлы и каталоги и определяет типы файлов пулом потоков, не читая их целиком"""
+    finished = pyqtSignal(object)
+    
+    def __init__(self, paths: list, add_extensions: bool):
+        super().__init__()
+        self.paths = paths
+        self.add_extensions = add_extensions
+    
+    def run(self):
+        """Отдаёт тройки (FileBlob, имя, тип) для AddCommand"""
+        try:
+            entries = ingest_files(self.paths, progress=self.report)
+            if self.add_extensions:
+                # Отдельно выбранным файлам без подходящего расширения дописываем найденное
+                entries = [(blob, name if name.endswith(ext) else name + ext, ext) for blob, name, ext in entries]
+            self.finished.emit(entries)
+        except OperationCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class PatchBuilder(BackgroundTask):
+    """Сравнивает текущий архив со старой версией и записывает файл обновления"""
+    finished = pyqtSignal(object, 'qint64')
+    
+    def __init__(self, base_path: str, chunks: ChunkIndex, patch_path: str, magic: bytes):
+        super().__init__()
+        self.base_path = base_path
+        self.chunks = chunks
+        self.patch_path = patch_path
+        self.magic = magic
+    
+    def run(self):
+        """Сопоставляет файлы по содержимому и пишет только отличающиеся байты"""
+        try:
+            base = ChunkIndex.open(self.base_path, self.magic)
+            try:
+                for i in range(len(base)):
+                    if base.names[i] is None:
+                        base.classify(i)
+                diff = ArchiveDiff(base, self.chunks, progress=self.report)
+                size = diff.write_patch(self.patch_path, progress=self.report)
+            finally:
+                base.close()
+            self.finished.emit(diff, size)
+        except OperationCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class PatchApplier(BackgroundTask):
+    """Собирает новую версию архива из старой и файла обновления"""
+    finished = pyqtSignal(int)
+    
+    def __init__(self, base_path: str, patch_path: str, output_path: str, magic: bytes):
+        super().__init__()
+        self.base_path = base_path
+        self.patch_path = patch_path
+        self.output_path = output_path
+        self.magic = magic
+    
+    def run(self):
+        """Применяет обновление и сообщает число файлов нового архива"""
+        try:
+            count = apply_archive_patch(self.base_path, self.patch_path, self.output_path, self.magic,
+                                        progress=self.report)
+            self.finished.emit(count)
+        except OperationCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class BatchProcessor(BackgroundTask):
+    """Обрабатывает все архивы дерева каталогов пулом процессов в фоновом потоке"""
+    archives_found = pyqtSignal(int)
+    archive_done = pyqtSignal(object)
+    finished = pyqtSignal()
+    
+    def __init__(self, root: str, action: str, output: str = None):
+        super().__init__()
+        self.root = root
+        self.action = action
+        self.output = output
+    
+    def run(self):
+        """Находит архивы и отдаёт результат по каждому по мере готовности"""
+        try:
+            paths = find_archives(self.root)
+            self.archives_found.emit(len(paths))
+            for result in process_archives(paths, self.action, root=self.root, output=self.output,
+                                           progress=lambda done, total, size: self.report(done, total)):
+                self.archive_done.emit(result)
+            self.finished.emit()
+        except OperationCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class ChunkModel(QAbstractTableModel):
+    """Виртуальная модель списка фрагментов поверх столбцов ChunkIndex.
+    
+    Модель не хранит ни элементов, ни данных: имя, тип и размер читаются из
+    индекса при отрисовке, а строки отдаются представлению порциями через
+    canFetchMore/fetchMore. available - сколько строк уже классифицировано.
+    При фильтре rows - возрастающий массив номеров показываемых фрагментов.
+    """
+    HEADERS = ["File", "Type", "Size"]
+    # Сколько строк отдаётся представлению за один fetchMore
+    FETCH_BATCH = 1000
+    # Формат перетаскиваемых строк: номера фрагментов в array('Q')
+    MIME_TYPE = "application/x-rpa-chunk-rows"
+    # Перетащенные фрагменты и номер фрагмента, перед которым их поставить
+    rows_moved = pyqtSignal(object, int)
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.chunks = ChunkIndex()
+        self.rows = None
+        self.available = 0
+        self.loaded = 0
+    
+    def set_chunks(self, chunks: ChunkIndex, available: int = None):
+        """Подменяет индекс; available=None означает, что все строки готовы"""
+        self.beginResetModel()
+        self.chunks = chunks
+        self.rows = None
+        self.available = len(chunks) if available is None else available
+        self.loaded = 0
+        self.endResetModel()
+        if self.canFetchMore(QModelIndex()):
+            self.fetchMore(QModelIndex())
+    
+    def set_filter(self, rows):
+        """Показывает только фрагменты rows; None снимает фильтр"""
+        self.beginResetModel()
+        self.rows = rows
+        self.available = len(self.chunks) if rows is None else len(rows)
+        self.loaded = 0
+        self.endResetModel()
+        if self.canFetchMore(QModelIndex()):
+            self.fetchMore(QModelIndex())
+    
+    def chunk_row(self, row: int) -> int:
+        """Возвращает номер фрагмента в строке row представления"""
+        return row if self.rows is None else self.rows[row]
+    
+    def view_row(self, row: int) -> int:
+        """Возвращает строку представления фрагмента row или -1, если он скрыт фильтром"""
+        if self.rows is None:
+            return row
+        position = bisect.bisect_left(self.rows, row)
+        return position if position < len(self.rows) and self.rows[position] == row else -1
+    
+    def set_available(self, available: int):
+        """Сообщает модели, что появились новые готовые строки"""
+        self.available = available
+        # Первую порцию показываем сразу, остальные подгружаются при прокрутке
+        if self.loaded < self.FETCH_BATCH and self.canFetchMore(QModelIndex()):
+            self.fetchMore(QModelIndex())
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+    
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
+            return None
+        row = self.chunk_row(index.row())
+        column = index.column()
+        if column == 0:
+            return self.chunks.names[row]
+        if column == 1:
+            return self.chunks.exts[row]
+        return format_size(self.chunks.length(row))
+    
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return None
+    
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self.loaded < self.available
+    
+    def fetchMore(self, parent):
+        count = min(self.FETCH_BATCH, self.available - self.loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + count - 1)
+        self.loaded += count
+        self.endInsertRows()
+    
+    def refresh_row(self, row: int):
+        """Перерисовывает строку после замены фрагмента"""
+        row = self.view_row(row)
+        if 0 <= row < self.loaded:
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.HEADERS) - 1))
+    
+    def refresh_all(self):
+        """Перерисовывает все показанные строки, не сбрасывая выделение"""
+        if self.loaded:
+            self.dataChanged.emit(self.index(0, 0), self.index(self.loaded - 1, len(self.HEADERS) - 1))
+    
+    def append_rows(self, count: int):
+        """Учитывает фрагменты, добавленные в конец индекса"""
+        if self.rows is not None:
+            # Подходят ли новые фрагменты под фильтр, решит его повторное применение
+            return
+        if self.loaded < self.available:
+            # Хвост ещё не показан - новые строки подгрузятся вместе с ним
+            self.available += count
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + count - 1)
+        self.available += count
+        self.loaded += count
+        self.endInsertRows()
+    
+    def restructure(self, change):
+        """Применяет к индексу структурное изменение change() одним сбросом модели.
+        
+        Строки под фильтром сохраняются по постоянным номерам фрагментов, а
+        число подгруженных строк - прежним, чтобы можно было вернуть прокрутку.
+        """
+        shown = None if self.rows is None else [self.chunks.ids[row] for row in self.rows]
+        loaded = self.loaded
+        self.beginResetModel()
+        result = change()
+        if shown is not None:
+            self.rows = array('Q', self.chunks.rows_of(shown))
+        self.available = len(self.chunks) if self.rows is None else len(self.rows)
+        self.loaded = min(max(loaded, self.FETCH_BATCH), self.available)
+        self.endResetModel()
+        return result
+    
+    def flags(self, index):
+        flags = super().flags(index)
+        # Строки перетаскиваются между строками, но не на них
+        return flags | Qt.ItemFlag.ItemIsDragEnabled if index.isValid() else flags | Qt.ItemFlag.ItemIsDropEnabled
+    
+    def supportedDropActions(self):
+        return Qt.DropAction.MoveAction
+    
+    def mimeTypes(self):
+        return [self.MIME_TYPE]
+    
+    def mimeData(self, indexes):
+        rows = array('Q', sorted({self.chunk_row(index.row()) for index in indexes}))
+        data = QMimeData()
+        data.setData(self.MIME_TYPE, QByteArray(rows.tobytes()))
+        return data
+    
+    def dropMimeData(self, data, action, row, column, parent):
+        """Сообщает, какие фрагменты перетащены и перед каким фрагментом их поставить"""
+        if action != Qt.DropAction.MoveAction or not data.hasFormat(self.MIME_TYPE):
+            return False
+        if row < 0:
+            row = parent.row() if parent.isValid() else self.loaded
+        if row < self.loaded:
+            destination = self.chunk_row(row)
+        else:
+            destination = len(self.chunks) if self.rows is None or not self.rows else self.rows[-1] + 1
+        rows = array('Q')
+        rows.frombytes(bytes(data.data(self.MIME_TYPE)))
+        self.rows_moved.emit(list(rows), destination)
+        # Перестановку выполняет окно; removeRows модели ничего не удаляет
+        return True
+
+class ReplaceCommand(QUndoCommand):
+    """Замена содержимого фрагментов; прежнее содержимое хранится ссылкой, а не копией"""
+    def __init__(self, window, replacements: dict, text: str):
+        super().__init__(text)
+        self.window = window
+        # {номер фрагмента: данные или FileBlob} до первого выполнения
+        self.replacements = replacements
+        self.before = {}
+        self.after = None
+    
+    def redo(self):
+        chunks = self.window.chunks
+        if self.after is None:
+            self.after = {}
+            for row, blob in self.replacements.items():
+                self.before[row] = chunks.content_state(row)
+                old_ext = chunks.exts[row]
+                chunks[row] = blob
+                # Сгенерированное имя следует за новым типом файла
+                if chunks.format is None and chunks.names[row] == f"chunk_{row}{old_ext}":
+                    chunks.names[row] = f"chunk_{row}{chunks.exts[row]}"
+                # Повтор после отмены возвращает тот же объект и ключ содержимого
+                self.after[row] = chunks.content_state(row)
+            self.replacements = None
+        else:
+            for row, state in self.after.items():
+                chunks.restore_content(row, state)
+        self.window.on_chunks_changed(list(self.after))
+    
+    def undo(self):
+        for row, state in self.before.items():
+            self.window.chunks.restore_content(row, state)
+        self.window.on_chunks_changed(list(self.before))
+
+class AddCommand(QUndoCommand):
+    """Добавление файлов в конец архива"""
+    def __init__(self, window, entries: list, text: str):
+        super().__init__(text)
+        self.window = window
+        # Тройки (данные или FileBlob, имя, тип) до первого выполнения, затем записи снятых отменой фрагментов
+        self.entries = entries
+        self.records = None
+        self.start = len(window.chunks)
+    
+    def redo(self):
+        chunks = self.window.chunks
+        if self.records is None:
+            for blob, name, ext in self.entries:
+                chunks.append(blob, name, ext)
+            self.window.model.append_rows(len(self.entries))
+            self.entries = None
+        else:
+            rows = range(self.start, self.start + len(self.records))
+            self.window.restructure(lambda: chunks.insert_rows(rows, self.records))
+        self.window.on_chunks_moved()
+    
+    def undo(self):
+        chunks = self.window.chunks
+        rows = range(self.start, len(chunks))
+        self.records = self.window.restructure(lambda: chunks.take_rows(rows))
+        self.window.on_chunks_moved()
+
+class DeleteCommand(QUndoCommand):
+    """Удаление фрагментов; отмена возвращает их записи на прежние места"""
+    def __init__(self, window, rows: list, text: str):
+        super().__init__(text)
+        self.window = window
+        self.rows = rows
+        self.records = None
+    
+    def redo(self):
+        chunks = self.window.chunks
+        self.records = self.window.restructure(lambda: chunks.take_rows(self.rows), select_ids=[])
+        self.window.on_chunks_moved()
+    
+    def undo(self):
+        chunks = self.window.chunks
+        restored = [record[0] for record in self.records]
+        self.window.restructure(lambda: chunks.insert_rows(self.rows, self.records), select_ids=restored)
+        self.records = None
+        self.window.on_chunks_moved()
+
+class MoveCommand(QUndoCommand):
+    """Перенос фрагментов перед другим фрагментом; история хранит только номера строк"""
+    def __init__(self, window, rows: list, destination: int, text: str):
+        super().__init__(text)
+        self.window = window
+        self.rows = rows
+        self.destination = destination
+    
+    def redo(self):
+        chunks = self.window.chunks
+        moved = [chunks.ids[row] for row in self.rows]
+        order = chunks.move_order(self.rows, self.destination)
+        self.window.restructure(lambda: chunks.reorder(order), select_ids=moved)
+        self.window.on_chunks_moved()
+    
+    def undo(self):
+        chunks = self.window.chunks
+        # Порядок зависит только от числа строк и параметров переноса - обращаем его
+        order = chunks.move_order(self.rows, self.destination)
+        inverse = array('Q', [0]) * len(order)
+        for new, old in enumerate(order):
+            inverse[old] = new
+        rows = set(self.rows)
+        moved = [chunks.ids[new] for new, old in enumerate(order) if old in rows]
+        self.window.restructure(lambda: chunks.reorder(inverse), select_ids=moved)
+        self.window.on_chunks_moved()
+
 class RPAExtractor(QMainWindow):
     """Главное окно приложения"""
     def __init__(self):
         super().__init__()
         
         # Загрузка конфигурации
-        self.config = config_data
-        self.lang = lang_data["languages"][self.config["language"]]
+        self.config = get_config_data()
+        self.lang = get_lang_data()["languages"][self.config["language"]]
         
         # Инициализация интерфейса
+        self.hash_service = HashService(self)
+        # Бюджет памяти миниатюр задаётся в config.json (МБ)
+        thumbnail_budget = self.config.get("thumbnail_cache_mb", DEFAULT_CONFIG["thumbnail_cache_mb"])
+        self.thumbnails = ThumbnailCache(thumbnail_budget * 1024 * 1024, self)
+        # История правок архива; сбрасывается при открытии и сохранении
+        self.undo_stack = QUndoStack(self)
+        self.undo_stack.cleanChanged.connect(self.on_clean_changed)
         self.init_ui()
         
         # Инициализация данных
         self.current_archive_path = ""
-        self.chunks = []
+        self.chunks = ChunkIndex()
         self.is_modified = False
-        self.magic = bytes([
-            0x4d, 0x61, 0x64, 0x65,
-            0x20, 0x77, 0x69, 0x74,
-            0x68, 0x20, 0x52, 0x65,
-            0x6e, 0x27, 0x50, 0x79,
-            0x2e
-        ])
+        self.load_thread = None
+        self.loader = None
+        # Фильтр по сумме ждёт, пока слот фоновой задачи освободится
+        self.filter_pending = False
+        self.magic = RENPY_MAGIC
+        # Индексы поиска обновляются после правок и строятся заново после сохранения; суммы запоминаются по ключу содержимого
+        self.search = None
+        self.digest_memo = {}
+        # Кэш индексов открывавшихся архивов; размер задаётся в config.json (МБ)
+        cache_limit = self.config.get("index_cache_limit_mb", INDEX_CACHE_LIMIT // (1024 * 1024))
+        self.index_cache = IndexCache(limit=cache_limit * 1024 * 1024)
     
     def init_ui(self):
         """Инициализация пользовательского интерфейса"""
@@ -676,27 +1875,45 @@ class RPAExtractor(QMainWindow):
         # Создание панели инструментов
         self.create_toolbar()
         
+        # Панель фильтра
+        self.create_filter_bar()
+        
         # Разделитель для дерева файлов и предпросмотра
         self.splitter = QSplitter(Qt.Orientation.Horizontal)
         self.main_layout.addWidget(self.splitter)
         
-        # Виджет дерева файлов
-        self.tree = QTreeWidget()
-        self.tree.setHeaderLabels(["File", "Type", "Size"])
-        self.tree.setSelectionMode(QTreeWidget.SelectionMode.ExtendedSelection)
+        # Список файлов: представление над виртуальной моделью
+        self.model = ChunkModel(self)
+        self.tree = QTreeView()
+        self.tree.setModel(self.model)
+        self.tree.setRootIsDecorated(False)
+        self.tree.setUniformRowHeights(True)
+        self.tree.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.tree.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        # Перетаскивание строк меняет порядок файлов в архиве
+        self.tree.setDragDropMode(QAbstractItemView.DragDropMode.InternalMove)
+        self.tree.setDefaultDropAction(Qt.DropAction.MoveAction)
+        self.tree.setDropIndicatorShown(True)
+        self.model.rows_moved.connect(self.move_rows)
         self.tree.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.tree.customContextMenuRequested.connect(self.show_context_menu)
-        self.tree.itemSelectionChanged.connect(self.update_preview)
+        self.tree.selectionModel().selectionChanged.connect(self.update_preview)
         self.splitter.addWidget(self.tree)
         
         # Виджет предпросмотра
-        self.preview = PreviewWidget(self.lang)
+        self.preview = PreviewWidget(self.lang, self.hash_service, self.thumbnails)
         self.splitter.addWidget(self.preview)
         self.splitter.setSizes([600, 400])
         
         # Строка состояния
         self.status_bar = self.statusBar()
         self.status_bar.showMessage(self.lang["ready"])
+        
+        # Кнопка отмены фоновой загрузки
+        self.cancel_button = QPushButton(self.lang["cancel"])
+        self.cancel_button.clicked.connect(self.cancel_loading)
+        self.status_bar.addPermanentWidget(self.cancel_button)
+        self.cancel_button.hide()
     
     def create_menus(self):
         """Создает меню приложения"""
@@ -727,6 +1944,30 @@ class RPAExtractor(QMainWindow):
         add_action.triggered.connect(self.add_files)
         file_menu.addAction(add_action)
         
+        add_folder_action = QAction(self.lang["add_folder"], self)
+        add_folder_action.triggered.connect(self.add_folder)
+        file_menu.addAction(add_folder_action)
+        
+        bulk_folder_action = QAction(self.lang["bulk_replace_folder"], self)
+        bulk_folder_action.triggered.connect(self.bulk_replace_from_folder)
+        file_menu.addAction(bulk_folder_action)
+        
+        bulk_manifest_action = QAction(self.lang["bulk_replace_manifest"], self)
+        bulk_manifest_action.triggered.connect(self.bulk_replace_from_manifest)
+        file_menu.addAction(bulk_manifest_action)
+        
+        batch_action = QAction(self.lang["batch_process"], self)
+        batch_action.triggered.connect(self.show_batch_dialog)
+        file_menu.addAction(batch_action)
+        
+        create_patch_action = QAction(self.lang["create_patch"], self)
+        create_patch_action.triggered.connect(self.create_patch)
+        file_menu.addAction(create_patch_action)
+        
+        apply_patch_action = QAction(self.lang["apply_patch"], self)
+        apply_patch_action.triggered.connect(self.apply_patch)
+        file_menu.addAction(apply_patch_action)
+        
         file_menu.addSeparator()
         
         exit_action = QAction(self.lang["exit"], self)
@@ -736,6 +1977,22 @@ class RPAExtractor(QMainWindow):
         # Меню Правка
         edit_menu = menu_bar.addMenu(self.lang["edit_menu"])
         
+        undo_action = QAction(self.lang["undo"], self)
+        undo_action.setShortcut(QKeySequence.StandardKey.Undo)
+        undo_action.setEnabled(False)
+        undo_action.triggered.connect(self.undo)
+        self.undo_stack.canUndoChanged.connect(undo_action.setEnabled)
+        edit_menu.addAction(undo_action)
+        
+        redo_action = QAction(self.lang["redo"], self)
+        redo_action.setShortcut(QKeySequence.StandardKey.Redo)
+        redo_action.setEnabled(False)
+        redo_action.triggered.connect(self.redo)
+        self.undo_stack.canRedoChanged.connect(redo_action.setEnabled)
+        edit_menu.addAction(redo_action)
+        
+        edit_menu.addSeparator()
+        
         extract_action = QAction(self.lang["extract_selected"], self)
         extract_action.triggered.connect(self.extract_selected)
         edit_menu.addAction(extract_action)
@@ -769,6 +2026,39 @@ class RPAExtractor(QMainWindow):
         about_action.triggered.connect(self.show_about)
         help_menu.addAction(about_action)
     
+    def create_filter_bar(self):
+        """Создает панель фильтра списка файлов"""
+        self.filter_bar = QWidget()
+        layout = QHBoxLayout(self.filter_bar)
+        layout.setContentsMargins(0, 0, 0, 0)
+        
+        self.name_filter = QLineEdit()
+        self.name_filter.setPlaceholderText(self.lang["filter_name"])
+        self.name_filter.setClearButtonEnabled(True)
+        layout.addWidget(self.name_filter, 3)
+        
+        self.type_filter = QComboBox()
+        self.type_filter.addItem(self.lang["filter_all_types"], None)
+        layout.addWidget(self.type_filter)
+        
+        self.min_size_filter = QLineEdit()
+        self.min_size_filter.setPlaceholderText(self.lang["filter_min_size"])
+        layout.addWidget(self.min_size_filter, 1)
+        
+        self.max_size_filter = QLineEdit()
+        self.max_size_filter.setPlaceholderText(self.lang["filter_max_size"])
+        layout.addWidget(self.max_size_filter, 1)
+        
+        self.hash_filter = QLineEdit()
+        self.hash_filter.setPlaceholderText("MD5 / SHA-1")
+        self.hash_filter.setClearButtonEnabled(True)
+        layout.addWidget(self.hash_filter, 2)
+        
+        for edit in (self.name_filter, self.min_size_filter, self.max_size_filter, self.hash_filter):
+            edit.textChanged.connect(self.apply_filter)
+        self.type_filter.currentIndexChanged.connect(self.apply_filter)
+        self.main_layout.addWidget(self.filter_bar)
+    
     def create_toolbar(self):
         """Создает панель инструментов"""
         toolbar = self.addToolBar(self.lang["tools"])
@@ -840,12 +2130,21 @@ class RPAExtractor(QMainWindow):
             if reply != QMessageBox.StandardButton.Yes:
                 return
         
-        self.chunks = []
+        self.clear_archive()
+        self.status_bar.showMessage(self.lang["new_archive_created"])
+    
+    def clear_archive(self):
+        """Закрывает текущий архив и очищает дерево"""
+        self.chunks.close()
+        self.chunks = ChunkIndex()
+        self.model.set_chunks(self.chunks)
+        self.undo_stack.clear()
+        self.search = None
+        self.digest_memo = {}
+        self.update_type_filter()
         self.current_archive_path = ""
-        self.tree.clear()
         self.preview.clear()
         self.is_modified = False
-        self.status_bar.showMessage(self.lang["new_archive_created"])
     
     def open_archive(self):
         """Открывает архив"""
@@ -863,29 +2162,111 @@ class RPAExtractor(QMainWindow):
         if not path:
             return
         
-        try:
-            with open(path, 'rb') as f:
-                data = f.read()
-            
-            self.chunks = split_by_magic(data, self.magic)
-            self.current_archive_path = path
-            self.tree.clear()
-            self.preview.clear()
-            self.is_modified = False
-            
-            for i, blob in enumerate(self.chunks):
-                ext = guess_extension(blob)
-                size = len(blob)
-                size_str = f"{size} bytes" if size < 1024 else f"{size/1024:.1f} KB"
-                
-                item = QTreeWidgetItem([f"chunk_{i}{ext}", ext, size_str])
-                item.setData(0, Qt.ItemDataRole.UserRole, blob)
-                self.tree.addTopLevelItem(item)
-            
-            self.status_bar.showMessage(self.lang["archive_loaded"].format(len(self.chunks)))
-        
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to open archive:\n{str(e)}")
+        self.start_loading(path)
+    
+    def start_loading(self, path: str):
+        """Запускает фоновую загрузку архива"""
+        self.cancel_loading()
+        
+        self.load_path = path
+        self.load_swapped = False
+        self.load_started = time.monotonic()
+        
+        self.load_thread = QThread(self)
+        self.loader = ArchiveLoader(path, self.magic, self.index_cache)
+        self.loader.moveToThread(self.load_thread)
+        self.load_thread.started.connect(self.loader.run)
+        self.loader.index_ready.connect(self.on_index_ready)
+        self.loader.rows_ready.connect(self.on_rows_ready)
+        self.loader.search_ready.connect(self.on_search_ready)
+        self.loader.progress.connect(self.on_load_progress)
+        self.loader.finished.connect(self.on_load_finished)
+        self.loader.failed.connect(self.on_load_failed)
+        self.loader.cancelled.connect(self.on_load_cancelled)
+        # quit вызывается прямо из потока загрузчика: cancel_loading ждёт поток, блокируя цикл событий
+        for signal in (self.loader.finished, self.loader.failed, self.loader.cancelled):
+            signal.connect(self.load_thread.quit, Qt.ConnectionType.DirectConnection)
+        self.load_thread.finished.connect(self.on_load_thread_finished)
+        
+        self.set_busy(True)
+        self.load_thread.start()
+    
+    def cancel_loading(self):
+        """Отменяет фоновую загрузку или извлечение и дожидается остановки потока"""
+        if self.load_thread is None:
+            return
+        self.loader.cancel()
+        self.load_thread.wait()
+        # Доставляем сигналы остановленного загрузчика до продолжения
+        QApplication.processEvents()
+    
+    def set_busy(self, busy: bool):
+        """Блокирует изменяющие архив действия на время загрузки"""
+        self.menuBar().setEnabled(not busy)
+        for toolbar in self.findChildren(QToolBar):
+            toolbar.setEnabled(not busy)
+        self.filter_bar.setEnabled(not busy)
+        self.cancel_button.setVisible(busy)
+    
+    def on_index_ready(self, chunks):
+        """Подменяет текущий архив только что отсканированным"""
+        self.clear_archive()
+        self.chunks = chunks
+        self.model.set_chunks(chunks, 0)
+        self.current_archive_path = self.load_path
+        self.load_swapped = True
+        self.load_started = time.monotonic()
+    
+    def on_rows_ready(self, count):
+        """Показывает очередную пачку классифицированных фрагментов"""
+        self.model.set_available(count)
+        # Если список прокручен до конца, подгружаем следующую порцию сразу
+        scroll_bar = self.tree.verticalScrollBar()
+        if scroll_bar.value() == scroll_bar.maximum() and self.model.canFetchMore(QModelIndex()):
+            self.model.fetchMore(QModelIndex())
+    
+    def on_load_progress(self, done, total):
+        """Показывает прогресс и скорость загрузки"""
+        elapsed = max(time.monotonic() - self.load_started, 1e-6)
+        mb = 1024 * 1024
+        self.status_bar.showMessage(self.lang["loading_progress"].format(done / mb, total / mb, done / mb / elapsed))
+    
+    def on_search_ready(self, search):
+        """Принимает индексы поиска, построенные загрузчиком"""
+        self.search = search
+        self.digest_memo = search.digests
+        self.update_type_filter()
+    
+    def on_load_finished(self):
+        """Завершает загрузку архива"""
+        self.status_bar.showMessage(self.lang["archive_loaded"].format(len(self.chunks)))
+        # Фильтр, набранный до открытия, применяется к новому архиву
+        if self.filter_active():
+            self.apply_filter()
+    
+    def on_load_failed(self, message):
+        """Сообщает об ошибке загрузки"""
+        # Частично загруженный архив не должен остаться открытым
+        if self.load_swapped:
+            self.clear_archive()
+        QMessageBox.critical(self, "Error", f"Failed to open archive:\n{message}")
+    
+    def on_load_cancelled(self):
+        """Обрабатывает отмену загрузки"""
+        if self.load_swapped:
+            self.clear_archive()
+        self.status_bar.showMessage(self.lang["loading_cancelled"])
+    
+    def on_load_thread_finished(self):
+        """Освобождает поток загрузчика"""
+        self.load_thread.deleteLater()
+        self.loader.deleteLater()
+        self.load_thread = None
+        self.loader = None
+        self.set_busy(False)
+        if self.filter_pending:
+            self.filter_pending = False
+            self.apply_filter()
     
     def save_archive(self):
         """Сохраняет текущий архив"""
@@ -917,34 +2298,228 @@ class RPAExtractor(QMainWindow):
             return
         
         try:
-            # Сборка данных архива
-            data = self.magic.join(self.chunks)
-            
-            with open(path, 'wb') as f:
-                f.write(data)
+            self.chunks.save(path, self.magic)
+            # Сохранённый архив при следующем открытии не придётся сканировать
+            self.index_cache.store(self.chunks, self.magic)
             
+            # Имена могли измениться при устранении повторов
+            self.model.refresh_all()
+            # Архив теперь читается из нового файла - прежние ключи содержимого недействительны
+            self.digest_memo = {}
+            self.invalidate_search()
+            # Записи истории ссылаются на диапазоны прежнего файла
+            self.undo_stack.clear()
             self.is_modified = False
             self.status_bar.showMessage(self.lang["archive_saved"].format(path))
         
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to save archive:\n{str(e)}")
     
+    def undo(self):
+        """Отменяет последнюю правку архива"""
+        if self.load_thread is not None or not self.undo_stack.canUndo():
+            return
+        text = self.undo_stack.undoText()
+        self.undo_stack.undo()
+        self.status_bar.showMessage(self.lang["undone"].format(text))
+    
+    def redo(self):
+        """Повторяет отменённую правку архива"""
+        if self.load_thread is not None or not self.undo_stack.canRedo():
+            return
+        text = self.undo_stack.redoText()
+        self.undo_stack.redo()
+        self.status_bar.showMessage(self.lang["redone"].format(text))
+    
+    def on_clean_changed(self, clean: bool):
+        """Архив изменён, пока история не вернулась к сохранённому состоянию"""
+        self.is_modified = not clean
+    
+    def on_chunks_changed(self, rows: list):
+        """Обновляет строки, индексы поиска и предпросмотр после смены содержимого фрагментов"""
+        for row in rows:
+            self.model.refresh_row(row)
+        self.update_search(rows)
+        self.update_preview()
+    
+    def restructure(self, change, select_ids=None):
+        """Выполняет структурное изменение архива, сохраняя прокрутку и выделение.
+        
+        Выделение переносится по постоянным номерам фрагментов; select_ids
+        задаёт, какие фрагменты выделить после изменения.
+        """
+        if select_ids is None:
+            select_ids = [self.chunks.ids[row] for row in self.selected_rows()]
+        scroll = self.tree.verticalScrollBar().value()
+        result = self.model.restructure(change)
+        self.select_chunk_rows(self.chunks.rows_of(select_ids))
+        self.tree.verticalScrollBar().setValue(scroll)
+        return result
+    
+    def select_chunk_rows(self, rows: list):
+        """Выделяет показанные строки фрагментов rows, объединяя соседние в диапазоны"""
+        selection = QItemSelection()
+        last_column = self.model.columnCount() - 1
+        start = previous = None
+        view_rows = [row for row in map(self.model.view_row, rows) if 0 <= row < self.model.rowCount()]
+        for row in view_rows + [None]:
+            if start is not None and (row is None or row != previous + 1):
+                selection.select(self.model.index(start, 0), self.model.index(previous, last_column))
+                start = None
+            if start is None:
+                start = row
+            previous = row
+        self.tree.selectionModel().select(selection, QItemSelectionModel.SelectionFlag.ClearAndSelect)
+        if view_rows:
+            self.tree.selectionModel().setCurrentIndex(self.model.index(view_rows[0], 0),
+                                                       QItemSelectionModel.SelectionFlag.NoUpdate)
+    
+    def move_rows(self, rows: list, destination: int):
+        """Переносит перетащенные фрагменты перед фрагментом destination"""
+        if self.load_thread is not None or not rows:
+            return
+        # Перенос блока на его же место ничего не меняет
+        if rows == list(range(rows[0], rows[0] + len(rows))) and rows[0] <= destination <= rows[-1] + 1:
+            return
+        self.undo_stack.push(MoveCommand(self, rows, destination, self.lang["undo_move"].format(len(rows))))
+    
+    def on_chunks_moved(self):
+        """Обновляет индексы поиска и предпросмотр после добавления или удаления фрагментов"""
+        self.update_search()
+        self.update_preview()
+    
+    def selected_rows(self) -> list:
+        """Возвращает номера выбранных фрагментов по возрастанию"""
+        return sorted(self.model.chunk_row(index.row()) for index in self.tree.selectionModel().selectedRows())
+    
     def update_preview(self):
         """Обновляет предпросмотр при изменении выбора"""
-        selected = self.tree.selectedItems()
-        if not selected:
+        view_rows = [index.row() for index in self.tree.selectionModel().selectedRows()]
+        if not view_rows:
             self.preview.clear()
             return
         
-        item = selected[0]
-        blob = item.data(0, Qt.ItemDataRole.UserRole)
-        ext = item.text(1)
-        self.preview.set_data(blob, ext)
+        current = self.tree.selectionModel().currentIndex()
+        view_row = current.row() if current.isValid() and current.row() in view_rows else min(view_rows)
+        row = self.model.chunk_row(view_row)
+        self.preview.set_data(self.chunks.view(row), self.chunks.exts[row], self.chunks.identity(row))
+        
+        # Соседние изображения декодируются заранее, чтобы листание стрелками не ждало
+        for neighbour in (view_row + 1, view_row - 1):
+            if 0 <= neighbour < self.model.rowCount():
+                neighbour = self.model.chunk_row(neighbour)
+                key = self.chunks.identity(neighbour)
+                if self.chunks.exts[neighbour] in IMAGE_EXTENSIONS and not self.thumbnails.has(key):
+                    self.thumbnails.request(key, self.chunks.view(neighbour))
+    
+    def filter_active(self) -> bool:
+        """Проверяет, задано ли хоть одно условие фильтра"""
+        return bool(self.name_filter.text().strip() or self.type_filter.currentData()
+                    or self.min_size_filter.text().strip() or self.max_size_filter.text().strip()
+                    or self.hash_filter.text().strip())
+    
+    def get_search(self) -> ChunkSearch:
+        """Возвращает индексы поиска, при необходимости строя их заново"""
+        if self.search is None:
+            self.search = ChunkSearch(self.chunks, self.digest_memo)
+        return self.search
+    
+    def invalidate_search(self):
+        """Сбрасывает индексы поиска после сохранения архива и переприменяет фильтр"""
+        self.search = None
+        if self.filter_active():
+            self.apply_filter()
+        self.update_type_filter()
+    
+    def update_search(self, rows=()):
+        """Переносит правку архива в индексы поиска и переприменяет фильтр.
+        
+        rows - строки со сменившимся содержимым; добавленные, удалённые и
+        переставленные строки индекс находит сам.
+        """
+        if self.search is not None:
+            self.search.update(rows)
+        if self.filter_active():
+            self.apply_filter()
+        self.update_type_filter()
+    
+    def update_type_filter(self):
+        """Заполняет список типов фильтра типами фрагментов архива"""
+        current = self.type_filter.currentData()
+        # Индекс поиска хранит и удалённые фрагменты, поэтому типы берутся из самого архива
+        exts = sorted(set(self.chunks.exts) - {None})
+        self.type_filter.blockSignals(True)
+        self.type_filter.clear()
+        self.type_filter.addItem(self.lang["filter_all_types"], None)
+        for ext in exts:
+            self.type_filter.addItem(ext, ext)
+        index = self.type_filter.findData(current)
+        self.type_filter.setCurrentIndex(max(index, 0))
+        self.type_filter.blockSignals(False)
+    
+    def apply_filter(self):
+        """Показывает только фрагменты, подходящие под условия панели фильтра"""
+        if not self.filter_active():
+            if self.model.rows is not None:
+                self.model.set_filter(None)
+                self.status_bar.showMessage(self.lang["archive_loaded"].format(len(self.chunks)))
+            return
+        try:
+            min_size = parse_size(self.min_size_filter.text())
+            max_size = parse_size(self.max_size_filter.text())
+        except ValueError:
+            self.status_bar.showMessage(self.lang["filter_bad_size"])
+            return
+        digest = self.hash_filter.text().strip()
+        search = self.get_search()
+        if digest and search.by_digest is None:
+            # Слот занят загрузкой или добавлением файлов: подсчёт начнётся после их завершения
+            if self.load_thread is not None:
+                self.filter_pending = True
+                return
+            self.start_digest_indexing(search)
+            return
+        
+        rows = search.query(self.name_filter.text().strip(), self.type_filter.currentData(),
+                            min_size, max_size, digest)
+        self.model.set_filter(rows)
+        self.status_bar.showMessage(self.lang["filter_found"].format(len(rows), len(self.chunks)))
+    
+    def start_digest_indexing(self, search: ChunkSearch):
+        """Запускает фоновый подсчёт сумм всех фрагментов для поиска по сумме"""
+        self.load_started = time.monotonic()
+        
+        # Подсчёт занимает тот же слот фоновой задачи, что и загрузка
+        self.load_thread = QThread(self)
+        self.loader = DigestIndexer(search)
+        self.loader.moveToThread(self.load_thread)
+        self.load_thread.started.connect(self.loader.run)
+        self.loader.progress.connect(self.on_digest_progress)
+        self.loader.finished.connect(self.apply_filter)
+        self.loader.failed.connect(self.on_digest_failed)
+        self.loader.cancelled.connect(self.on_digest_cancelled)
+        for signal in (self.loader.finished, self.loader.failed, self.loader.cancelled):
+            signal.connect(self.load_thread.quit, Qt.ConnectionType.DirectConnection)
+        self.load_thread.finished.connect(self.on_load_thread_finished)
+        
+        self.set_busy(True)
+        self.load_thread.start()
+    
+    def on_digest_progress(self, done, total):
+        """Показывает прогресс подсчёта сумм"""
+        self.status_bar.showMessage(self.lang["filter_hashing"].format(done, total))
+    
+    def on_digest_failed(self, message):
+        """Сообщает об ошибке подсчёта сумм"""
+        QMessageBox.critical(self, "Error", f"Failed to compute checksums:\n{message}")
+    
+    def on_digest_cancelled(self):
+        """Обрабатывает отмену подсчёта сумм"""
+        self.status_bar.showMessage(self.lang["filter_hashing_cancelled"])
     
     def show_context_menu(self, position):
         """Показывает контекстное меню"""
-        selected_items = self.tree.selectedItems()
-        if not selected_items:
+        if not self.selected_rows() or self.load_thread is not None:
             return
         
         menu = QMenu()
@@ -980,26 +2555,25 @@ class RPAExtractor(QMainWindow):
     
     def copy_to_clipboard(self):
         """Копирует файл в буфер обмена"""
-        selected_items = self.tree.selectedItems()
-        if not selected_items:
+        rows = self.selected_rows()
+        if not rows:
             return
         
         clipboard = QApplication.clipboard()
         mime_data = QMimeData()
         
         # Для одного файла
-        if len(selected_items) == 1:
-            item = selected_items[0]
-            blob = item.data(0, Qt.ItemDataRole.UserRole)
-            mime_data.setData("application/octet-stream", QByteArray(blob))
+        if len(rows) == 1:
+            blob = self.chunks[rows[0]]
+            mime_data.setData("application/octet-stream", QByteArray(bytes(blob)))
             clipboard.setMimeData(mime_data)
             self.status_bar.showMessage(self.lang["file_copied"])
         
         # Для нескольких файлов
         else:
             file_list = []
-            for item in selected_items:
-                file_list.append(f"{item.text(0)} ({len(item.data(0, Qt.ItemDataRole.UserRole))} bytes)")
+            for row in rows:
+                file_list.append(f"{self.chunks.names[row]} ({self.chunks.length(row)} bytes)")
             
             mime_data.setText("\n".join(file_list))
             clipboard.setMimeData(mime_data)
@@ -1007,25 +2581,24 @@ class RPAExtractor(QMainWindow):
     
     def overwrite_file(self):
         """Заменяет выбранный файл"""
-        selected_items = self.tree.selectedItems()
-        if not selected_items:
+        rows = self.selected_rows()
+        if not rows:
             return
         
-        if len(selected_items) > 1:
+        if len(rows) > 1:
             QMessageBox.warning(self, "Warning", "Select only one file to replace")
             return
         
-        item = selected_items[0]
-        old_blob = item.data(0, Qt.ItemDataRole.UserRole)
-        old_size = len(old_blob)
+        idx = rows[0]
+        old_size = self.chunks.length(idx)
         
         path, _ = QFileDialog.getOpenFileName(self, "Select replacement file")
         if not path:
             return
         
         try:
-            with open(path, 'rb') as f:
-                new_blob = f.read()
+            # Файл читается только при сохранении архива
+            new_blob = FileBlob(path)
             
             new_size = len(new_blob)
             size_diff = new_size - old_size
@@ -1044,27 +2617,56 @@ class RPAExtractor(QMainWindow):
                     return
             
             # Обновление данных
-            idx = self.tree.indexOfTopLevelItem(item)
             if 0 <= idx < len(self.chunks):
-                self.chunks[idx] = new_blob
-                self.is_modified = True
-                
-                # Обновление элемента дерева
-                ext = guess_extension(new_blob)
-                size_str = f"{new_size} bytes" if new_size < 1024 else f"{new_size/1024:.1f} KB"
-                
-                item.setText(0, f"chunk_{idx}{ext}")
-                item.setText(1, ext)
-                item.setText(2, size_str)
-                item.setData(0, Qt.ItemDataRole.UserRole, new_blob)
-                
+                text = self.lang["undo_replace"].format(self.chunks.names[idx])
+                self.undo_stack.push(ReplaceCommand(self, {idx: new_blob}, text))
                 self.status_bar.showMessage(self.lang["file_replaced"].format(path))
-            
-            self.update_preview()
         
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to replace file:\n{str(e)}")
     
+    def bulk_replace_from_folder(self):
+        """Заменяет фрагменты файлами каталога с теми же относительными путями"""
+        directory = QFileDialog.getExistingDirectory(self, self.lang["bulk_replace_folder"])
+        if directory:
+            self.bulk_replace(directory)
+    
+    def bulk_replace_from_manifest(self):
+        """Заменяет фрагменты по манифесту со строками ФРАГМЕНТ<TAB>ФАЙЛ"""
+        path, _ = QFileDialog.getOpenFileName(
+            self, self.lang["bulk_replace_manifest"], "", "Manifests (*.tsv *.txt);;All files (*.*)")
+        if path:
+            self.bulk_replace(path)
+    
+    def bulk_replace(self, source: str):
+        """Проверяет все замены заранее и применяет их одной командой отмены"""
+        try:
+            replacements = resolve_replacements(self.chunks, read_replace_mapping(source),
+                                                self.current_archive_path, extracted_first=os.path.isdir(source))
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to replace files:\n{str(e)}")
+            return
+        if not replacements:
+            QMessageBox.warning(self, "Warning", "No files to replace")
+            return
+        
+        resized = sum(len(blob) != self.chunks.length(row) for row, blob in replacements.items())
+        delta = sum(len(blob) - self.chunks.length(row) for row, blob in replacements.items())
+        reply = QMessageBox.question(
+            self, "Bulk replace",
+            self.lang["bulk_replace_confirm"].format(len(replacements), resized, delta / (1024 * 1024)),
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        
+        try:
+            text = self.lang["undo_bulk_replace"].format(len(replacements))
+            self.undo_stack.push(ReplaceCommand(self, replacements, text))
+            self.status_bar.showMessage(self.lang["bulk_replaced"].format(len(replacements), source))
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to replace files:\n{str(e)}")
+    
     def add_files(self):
         """Добавляет файлы в архив"""
         paths, _ = QFileDialog.getOpenFileNames(
@@ -1074,43 +2676,64 @@ class RPAExtractor(QMainWindow):
             "All files (*.*)"
         )
         
-        if not paths:
-            return
-        
-        try:
-            for path in paths:
-                with open(path, 'rb') as f:
-                    blob = f.read()
-                
-                self.chunks.append(blob)
-                ext = guess_extension(blob)
-                size = len(blob)
-                size_str = f"{size} bytes" if size < 1024 else f"{size/1024:.1f} KB"
-                
-                filename = os.path.basename(path)
-                if not filename.endswith(ext):
-                    filename += ext
-                
-                item = QTreeWidgetItem([filename, ext, size_str])
-                item.setData(0, Qt.ItemDataRole.UserRole, blob)
-                self.tree.addTopLevelItem(item)
-            
-            self.is_modified = True
-            self.status_bar.showMessage(self.lang["files_added"].format(len(paths)))
-        
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to add files:\n{str(e)}")
+        if paths:
+            self.start_ingest(paths, add_extensions=True)
+    
+    def add_folder(self):
+        """Добавляет в архив все файлы каталога с путями относительно него"""
+        directory = QFileDialog.getExistingDirectory(self, self.lang["add_folder"])
+        if directory:
+            self.start_ingest([directory], add_extensions=False)
+    
+    def start_ingest(self, paths: list, add_extensions: bool):
+        """Запускает фоновую подготовку добавляемых файлов в слоте фоновой задачи"""
+        self.load_started = time.monotonic()
+        self.load_thread = QThread(self)
+        self.loader = FileIngester(paths, add_extensions)
+        self.loader.moveToThread(self.load_thread)
+        self.load_thread.started.connect(self.loader.run)
+        self.loader.progress.connect(self.on_ingest_progress)
+        self.loader.finished.connect(self.on_ingest_finished)
+        self.loader.failed.connect(self.on_ingest_failed)
+        self.loader.cancelled.connect(self.on_ingest_cancelled)
+        for signal in (self.loader.finished, self.loader.failed, self.loader.cancelled):
+            signal.connect(self.load_thread.quit, Qt.ConnectionType.DirectConnection)
+        self.load_thread.finished.connect(self.on_load_thread_finished)
+        
+        self.set_busy(True)
+        self.load_thread.start()
+    
+    def on_ingest_progress(self, done, total):
+        """Показывает число найденных или обработанных файлов"""
+        if total:
+            self.status_bar.showMessage(self.lang["ingest_progress"].format(done, total))
+        else:
+            self.status_bar.showMessage(self.lang["ingest_scanning"].format(done))
+    
+    def on_ingest_finished(self, entries):
+        """Добавляет подготовленные файлы одной командой отмены и одной вставкой строк"""
+        if entries:
+            self.undo_stack.push(AddCommand(self, entries, self.lang["undo_add"].format(len(entries))))
+        self.status_bar.showMessage(self.lang["files_added"].format(len(entries)))
+    
+    def on_ingest_failed(self, message):
+        """Сообщает об ошибке чтения добавляемых файлов"""
+        QMessageBox.critical(self, "Error", f"Failed to add files:\n{message}")
+    
+    def on_ingest_cancelled(self):
+        """Обрабатывает отмену добавления файлов"""
+        self.status_bar.showMessage(self.lang["ingest_cancelled"])
     
     def delete_selected(self):
         """Удаляет выбранные файлы"""
-        selected_items = self.tree.selectedItems()
-        if not selected_items:
+        rows = self.selected_rows()
+        if not rows:
             QMessageBox.warning(self, "Warning", "Select files to delete")
             return
         
         reply = QMessageBox.question(
             self, "Confirm deletion",
-            self.lang["confirm_delete"].format(len(selected_items)),
+            self.lang["confirm_delete"].format(len(rows)),
             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
         )
         
@@ -1118,33 +2741,16 @@ class RPAExtractor(QMainWindow):
             return
         
         try:
-            # Сбор индексов для удаления (в обратном порядке)
-            indices_to_delete = []
-            for item in selected_items:
-                idx = self.tree.indexOfTopLevelItem(item)
-                if idx >= 0:
-                    indices_to_delete.append(idx)
-            
-            # Сортировка в обратном порядке для удаления с конца
-            indices_to_delete.sort(reverse=True)
-            
-            # Удаление из данных и дерева
-            for idx in indices_to_delete:
-                if 0 <= idx < len(self.chunks):
-                    del self.chunks[idx]
-                    self.tree.takeTopLevelItem(idx)
-            
-            self.is_modified = True
-            self.status_bar.showMessage(self.lang["files_deleted"].format(len(indices_to_delete)))
-            self.preview.clear()
+            self.undo_stack.push(DeleteCommand(self, rows, self.lang["undo_delete"].format(len(rows))))
+            self.status_bar.showMessage(self.lang["files_deleted"].format(len(rows)))
         
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to delete files:\n{str(e)}")
     
     def extract_selected(self):
         """Извлекает выбранные файлы"""
-        selected_items = self.tree.selectedItems()
-        if not selected_items:
+        rows = self.selected_rows()
+        if not rows:
             QMessageBox.warning(self, "Warning", "Select files to extract")
             return
         
@@ -1152,35 +2758,7 @@ class RPAExtractor(QMainWindow):
         if not dir_path:
             return
         
-        try:
-            extracted_count = 0
-            for item in selected_items:
-                blob = item.data(0, Qt.ItemDataRole.UserRole)
-                filename = item.text(0)
-                
-                # Безопасное имя файла
-                safe_name = "".join(c for c in filename if c.isalnum() or c in "._- ")
-                if not safe_name:
-                    safe_name = f"file_{extracted_count}"
-                
-                file_path = os.path.join(dir_path, safe_name)
-                
-                # Обработка дубликатов
-                counter = 1
-                base_name, ext = os.path.splitext(safe_name)
-                while os.path.exists(file_path):
-                    file_path = os.path.join(dir_path, f"{base_name}_{counter}{ext}")
-                    counter += 1
-                
-                with open(file_path, 'wb') as f:
-                    f.write(blob)
-                
-                extracted_count += 1
-            
-            self.status_bar.showMessage(self.lang["files_extracted"].format(extracted_count, dir_path))
-        
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Extraction error:\n{str(e)}")
+        self.start_extraction(rows, dir_path, all_files=False)
     
     def extract_all(self):
         """Извлекает все файлы"""
@@ -1192,45 +2770,142 @@ class RPAExtractor(QMainWindow):
         if not dir_path:
             return
         
-        try:
-            for i, blob in enumerate(self.chunks):
-                # Получение имени файла
-                if i < self.tree.topLevelItemCount():
-                    filename = self.tree.topLevelItem(i).text(0)
-                else:
-                    ext = guess_extension(blob)
-                    filename = f"chunk_{i}{ext}"
-                
-                # Безопасное имя файла
-                safe_name = "".join(c for c in filename if c.isalnum() or c in "._- ")
-                if not safe_name:
-                    safe_name = f"file_{i}"
-                
-                file_path = os.path.join(dir_path, safe_name)
-                
-                # Обработка дубликатов
-                counter = 1
-                base_name, ext = os.path.splitext(safe_name)
-                while os.path.exists(file_path):
-                    file_path = os.path.join(dir_path, f"{base_name}_{counter}{ext}")
-                    counter += 1
-                
-                with open(file_path, 'wb') as f:
-                    f.write(blob)
-            
-            self.status_bar.showMessage(self.lang["all_files_extracted"].format(dir_path))
+        self.start_extraction(list(range(len(self.chunks))), dir_path, all_files=True)
+    
+    def start_extraction(self, rows: list, dir_path: str, all_files: bool):
+        """Запускает фоновое извлечение фрагментов rows в каталог dir_path"""
+        self.extract_path = dir_path
+        self.extract_all_files = all_files
+        self.load_started = time.monotonic()
+        
+        # Извлечение занимает тот же слот фоновой задачи, что и загрузка
+        self.load_thread = QThread(self)
+        self.loader = ArchiveExtractor(self.chunks, rows, dir_path)
+        self.loader.moveToThread(self.load_thread)
+        self.load_thread.started.connect(self.loader.run)
+        self.loader.progress.connect(self.on_extract_progress)
+        self.loader.finished.connect(self.on_extract_finished)
+        self.loader.failed.connect(self.on_extract_failed)
+        self.loader.cancelled.connect(self.on_extract_cancelled)
+        for signal in (self.loader.finished, self.loader.failed, self.loader.cancelled):
+            signal.connect(self.load_thread.quit, Qt.ConnectionType.DirectConnection)
+        self.load_thread.finished.connect(self.on_load_thread_finished)
+        
+        self.set_busy(True)
+        self.load_thread.start()
+    
+    def on_extract_progress(self, done, total):
+        """Показывает прогресс и скорость извлечения"""
+        elapsed = max(time.monotonic() - self.load_started, 1e-6)
+        mb = 1024 * 1024
+        self.status_bar.showMessage(self.lang["extracting_progress"].format(done / mb, total / mb, done / mb / elapsed))
+    
+    def on_extract_finished(self, count):
+        """Сообщает о завершении извлечения"""
+        if self.extract_all_files:
+            self.status_bar.showMessage(self.lang["all_files_extracted"].format(self.extract_path))
+        else:
+            self.status_bar.showMessage(self.lang["files_extracted"].format(count, self.extract_path))
+    
+    def on_extract_failed(self, message):
+        """Сообщает об ошибке извлечения"""
+        QMessageBox.critical(self, "Error", f"Extraction error:\n{message}")
+    
+    def on_extract_cancelled(self):
+        """Обрабатывает отмену извлечения"""
+        self.status_bar.showMessage(self.lang["extraction_cancelled"])
+    
+    def create_patch(self):
+        """Записывает файл обновления от старой версии архива к текущему"""
+        if not self.chunks:
+            QMessageBox.warning(self, "Warning", "Open the new version of the archive first")
+            return
+        base_path, _ = QFileDialog.getOpenFileName(self, "Select the old version of the archive", "",
+                                                   "Ren'Py Archives (*.rpa);;All files (*.*)")
+        if not base_path:
+            return
+        patch_path, _ = QFileDialog.getSaveFileName(self, self.lang["create_patch"], "update.rpapatch",
+                                                    "Archive patches (*.rpapatch);;All files (*.*)")
+        if not patch_path:
+            return
         
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Extraction error:\n{str(e)}")
+        self.patch_path = patch_path
+        self.start_patch_task(PatchBuilder(base_path, self.chunks, patch_path, self.magic), self.on_patch_created)
+    
+    def apply_patch(self):
+        """Собирает новую версию архива из старой и файла обновления"""
+        base_path, _ = QFileDialog.getOpenFileName(self, "Select the old version of the archive", "",
+                                                   "Ren'Py Archives (*.rpa);;All files (*.*)")
+        if not base_path:
+            return
+        patch_path, _ = QFileDialog.getOpenFileName(self, self.lang["apply_patch"], "",
+                                                    "Archive patches (*.rpapatch);;All files (*.*)")
+        if not patch_path:
+            return
+        output_path, _ = QFileDialog.getSaveFileName(self, self.lang["save_as"], "patched.rpa",
+                                                     "Ren'Py Archives (*.rpa);;All files (*.*)")
+        if not output_path:
+            return
+        
+        self.patch_path = output_path
+        self.start_patch_task(PatchApplier(base_path, patch_path, output_path, self.magic), self.on_patch_applied)
+    
+    def start_patch_task(self, task: BackgroundTask, on_finished):
+        """Запускает создание или применение обновления в слоте фоновой задачи"""
+        self.load_thread = QThread(self)
+        self.loader = task
+        self.loader.moveToThread(self.load_thread)
+        self.load_thread.started.connect(self.loader.run)
+        self.loader.progress.connect(self.on_patch_progress)
+        self.loader.finished.connect(on_finished)
+        self.loader.failed.connect(self.on_patch_failed)
+        self.loader.cancelled.connect(self.on_patch_cancelled)
+        for signal in (self.loader.finished, self.loader.failed, self.loader.cancelled):
+            signal.connect(self.load_thread.quit, Qt.ConnectionType.DirectConnection)
+        self.load_thread.finished.connect(self.on_load_thread_finished)
+        
+        self.set_busy(True)
+        self.load_thread.start()
+    
+    def on_patch_progress(self, done, total):
+        """Показывает прогресс создания или применения обновления"""
+        self.status_bar.showMessage(self.lang["patch_progress"].format(100 * done // max(total, 1)))
+    
+    def on_patch_created(self, diff, size):
+        """Сообщает, что изменилось и сколько весит обновление"""
+        self.status_bar.showMessage(self.lang["patch_created"].format(
+            self.patch_path, len(diff.added), len(diff.removed), len(diff.moved), len(diff.changed),
+            size / (1024 * 1024)))
+    
+    def on_patch_applied(self, count):
+        """Сообщает о сборке новой версии архива"""
+        self.status_bar.showMessage(self.lang["patch_applied"].format(self.patch_path, count))
+    
+    def on_patch_failed(self, message):
+        """Сообщает об ошибке обновления"""
+        QMessageBox.critical(self, "Error", f"Patch error:\n{message}")
+    
+    def on_patch_cancelled(self):
+        """Обрабатывает отмену обновления"""
+        self.status_bar.showMessage(self.lang["patch_cancelled"])
+    
+    def show_batch_dialog(self):
+        """Открывает диалог пакетной обработки архивов"""
+        dialog = BatchDialog(self.lang, self)
+        dialog.exec()
     
     def show_file_info(self):
         """Показывает информацию о файле"""
-        selected_items = self.tree.selectedItems()
-        if not selected_items:
+        rows = self.selected_rows()
+        if not rows:
             QMessageBox.warning(self, "Warning", "Select files to view info")
             return
         
-        info_dialog = FileInfoDialog(selected_items, self.lang, self)
+        entries = [
+            (self.chunks.names[row], self.chunks.exts[row], self.chunks.view(row), self.chunks.identity(row))
+            for row in rows
+        ]
+        info_dialog = FileInfoDialog(entries, self.lang, self.hash_service, self)
         info_dialog.exec()
     
     def open_settings(self):
@@ -1278,6 +2953,9 @@ class RPAExtractor(QMainWindow):
                 event.ignore()
                 return
         
+        self.cancel_loading()
+        self.hash_service.shutdown()
+        self.thumbnails.shutdown()
         event.accept()
 
 def main():
@@ -1285,7 +2963,7 @@ def main():
     app = QApplication([])
     
     # Загрузка конфигурации
-    config = load_json_file(CONFIG_FILE, DEFAULT_CONFIG)
+    config = get_config_data()
     
     # Установка стиля
     app.setStyle(config["icon_style"])
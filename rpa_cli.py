@@ -0,0 +1,236 @@
+"""Консольный интерфейс к архивам Ren'Py RPA, работающий без Qt.
+
+Примеры:
+    python -m rpa_cli list game/archive.rpa
+    python -m rpa_cli extract game/archive.rpa -o out
+    python -m rpa_cli pack new.rpa images/ script.rpy
+    python -m rpa_cli replace game/archive.rpa images/bg.png new_bg.png
+    python -m rpa_cli bulk-replace game/archive.rpa translated/ -o game/archive_ru.rpa
+    python -m rpa_cli batch verify games/ -j 8
+    python -m rpa_cli diff old/archive.rpa new/archive.rpa -o update.rpapatch
+    python -m rpa_cli patch old/archive.rpa update.rpapatch -o archive.rpa
+"""
+import os
+import sys
+import time
+import argparse
+from rpa_engine import (
+    RENPY_MAGIC, ArchiveDiff, ChunkIndex, FileBlob, IndexCache, apply_archive_patch, extract_chunks,
+    find_archives, ingest_files, process_archives, read_replace_mapping, resolve_replacements
+)
+
+def get_cache(args):
+    """Возвращает кэш индексов, если он не отключён ключом --no-cache"""
+    return None if args.no_cache else IndexCache()
+
+def iter_classified(chunks: ChunkIndex, cache: IndexCache = None):
+    """Перечисляет номера фрагментов, определяя типы тех, что не взяты из кэша"""
+    cached = None not in chunks.exts
+    for i in range(len(chunks)):
+        if not cached:
+            chunks.classify(i)
+        yield i
+    if cache is not None and not cached:
+        cache.store(chunks, RENPY_MAGIC)
+
+def open_archive(path: str, cache: IndexCache = None, recover: bool = False) -> ChunkIndex:
+    """Открывает архив и даёт имена фрагментам, у которых их нет; recover - для команд, меняющих архив"""
+    chunks = ChunkIndex.open(path, RENPY_MAGIC, cache=cache, recover=recover)
+    for _ in iter_classified(chunks, cache):
+        pass
+    return chunks
+
+def find_rows(chunks: ChunkIndex, members: list) -> list:
+    """Возвращает номера фрагментов с указанными именами"""
+    rows_by_name = {name: i for i, name in enumerate(chunks.names)}
+    missing = [name for name in members if name not in rows_by_name]
+    if missing:
+        raise ValueError(f"not in archive: {', '.join(missing)}")
+    return [rows_by_name[name] for name in members]
+
+def cmd_list(args) -> int:
+    """Выводит файлы архивов построчно: [архив,] имя, размер, тип через табуляцию"""
+    out = sys.stdout
+    cache = get_cache(args)
+    for path in args.archives:
+        chunks = ChunkIndex.open(path, RENPY_MAGIC, cache=cache)
+        try:
+            for i in iter_classified(chunks, cache):
+                fields = [chunks.names[i], str(chunks.length(i)), chunks.exts[i]]
+                if len(args.archives) > 1:
+                    fields.insert(0, path)
+                out.write("\t".join(fields) + "\n")
+        finally:
+            chunks.close()
+    return 0
+
+def cmd_extract(args) -> int:
+    """Извлекает все или перечисленные файлы архива в каталог"""
+    chunks = open_archive(args.archive, get_cache(args))
+    try:
+        rows = find_rows(chunks, args.members) if args.members else list(range(len(chunks)))
+        count = extract_chunks(chunks, rows, args.output, workers=args.jobs)
+    finally:
+        chunks.close()
+    print(f"Extracted {count} files to {args.output}")
+    return 0
+
+def cmd_pack(args) -> int:
+    """Собирает новый архив RPA-3.0 из файлов и каталогов"""
+    chunks = ChunkIndex()
+    # Файлы регистрируются по пути и читаются только при записи архива
+    for blob, name, ext in ingest_files(args.inputs):
+        chunks.append(blob, name, ext)
+    chunks.save(args.output, RENPY_MAGIC)
+    chunks.close()
+    print(f"Packed {len(chunks)} files into {args.output}")
+    return 0
+
+def cmd_replace(args) -> int:
+    """Заменяет файл внутри архива содержимым файла с диска"""
+    chunks = open_archive(args.archive, get_cache(args), recover=True)
+    try:
+        row = find_rows(chunks, [args.member])[0]
+        chunks[row] = FileBlob(args.file)
+        chunks.save(args.output or args.archive, RENPY_MAGIC)
+    finally:
+        chunks.close()
+    print(f"Replaced {args.member} in {args.output or args.archive}")
+    return 0
+
+def cmd_bulk_replace(args) -> int:
+    """Заменяет файлы архива по каталогу или манифесту за один проход записи"""
+    output = args.output or args.archive
+    chunks = open_archive(args.archive, get_cache(args), recover=True)
+    try:
+        replacements = resolve_replacements(chunks, read_replace_mapping(args.mapping), output,
+                                            extracted_first=os.path.isdir(args.mapping))
+        delta = sum(len(blob) - chunks.length(row) for row, blob in replacements.items())
+        for row, blob in replacements.items():
+            chunks[row] = blob
+        chunks.save(output, RENPY_MAGIC)
+    finally:
+        chunks.close()
+    print(f"Replaced {len(replacements)} files in {output} ({delta / 2**20:+.2f} MB)")
+    return 0
+
+def cmd_batch(args) -> int:
+    """Обрабатывает все архивы дерева каталогов пулом процессов и печатает сводку"""
+    if args.action == "extract" and not args.output:
+        raise ValueError("batch extract needs an output directory (-o)")
+    paths = find_archives(args.root)
+    start = time.monotonic()
+    files = failed = 0
+    total_bytes = 0
+    results = process_archives(paths, args.action, root=args.root, output=args.output,
+                               workers=args.jobs, use_cache=not args.no_cache)
+    for done, (path, count, size, types, error) in enumerate(results, 1):
+        files += count
+        total_bytes += size
+        status = f"ERROR {error}" if error else "ok"
+        summary = ", ".join(f"{ext} {n}" for ext, n in sorted(types.items()))
+        print(f"[{done}/{len(paths)}] {path}\t{count} files\t{size / 2**20:.1f} MB\t{status}\t{summary}", flush=True)
+        failed += bool(error)
+    elapsed = max(time.monotonic() - start, 1e-6)
+    print(f"Processed {len(paths)} archives: {files} files, {total_bytes / 2**20:.1f} MB "
+          f"in {elapsed:.2f} s ({total_bytes / 2**20 / elapsed:.1f} MB/s), {failed} failed")
+    return 1 if failed else 0
+
+def cmd_diff(args) -> int:
+    """Сравнивает две версии архива и при необходимости записывает файл обновления"""
+    cache = get_cache(args)
+    old = open_archive(args.old, cache)
+    try:
+        new = open_archive(args.new, cache)
+        try:
+            diff = ArchiveDiff(old, new)
+            for mark, names in (("A", diff.added), ("D", diff.removed), ("M", diff.moved), ("C", diff.changed)):
+                for name in names:
+                    print(f"{mark}\t{name}")
+            summary = (f"{len(diff.added)} added, {len(diff.removed)} removed, {len(diff.moved)} moved, "
+                       f"{len(diff.changed)} changed, {diff.unchanged} unchanged")
+            if args.output:
+                size = diff.write_patch(args.output)
+                summary += f"; patch {args.output}: {size / 2**20:.2f} MB"
+            print(summary)
+        finally:
+            new.close()
+    finally:
+        old.close()
+    return 0
+
+def cmd_patch(args) -> int:
+    """Собирает новую версию архива из старой и файла обновления"""
+    count = apply_archive_patch(args.base, args.patch, args.output)
+    print(f"Wrote {count} files to {args.output}")
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    """Описывает команды и аргументы утилиты"""
+    parser = argparse.ArgumentParser(prog="rpa_cli", description="Ren'Py RPA archive tool")
+    parser.add_argument("--no-cache", action="store_true", help="do not use the index cache")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help="list archive contents")
+    list_parser.add_argument("archives", nargs="+", metavar="ARCHIVE")
+    list_parser.set_defaults(func=cmd_list)
+
+    extract_parser = commands.add_parser("extract", help="extract files from an archive")
+    extract_parser.add_argument("archive")
+    extract_parser.add_argument("members", nargs="*", metavar="MEMBER", help="files to extract (default: all)")
+    extract_parser.add_argument("-o", "--output", default=".", help="output directory")
+    extract_parser.add_argument("-j", "--jobs", type=int, default=None, help="number of writer threads")
+    extract_parser.set_defaults(func=cmd_extract)
+
+    pack_parser = commands.add_parser("pack", help="create an archive from files and directories")
+    pack_parser.add_argument("output")
+    pack_parser.add_argument("inputs", nargs="+", metavar="INPUT")
+    pack_parser.set_defaults(func=cmd_pack)
+
+    replace_parser = commands.add_parser("replace", help="replace a file inside an archive")
+    replace_parser.add_argument("archive")
+    replace_parser.add_argument("member")
+    replace_parser.add_argument("file")
+    replace_parser.add_argument("-o", "--output", default=None, help="write to a new archive instead")
+    replace_parser.set_defaults(func=cmd_replace)
+
+    bulk_parser = commands.add_parser("bulk-replace", help="replace many files from a directory or manifest")
+    bulk_parser.add_argument("archive")
+    bulk_parser.add_argument("mapping", help="directory of extracted (or same-named) files, or a MEMBER<TAB>FILE manifest")
+    bulk_parser.add_argument("-o", "--output", default=None, help="write to a new archive instead")
+    bulk_parser.set_defaults(func=cmd_bulk_replace)
+    
+    batch_parser = commands.add_parser("batch", help="list, extract or verify every archive under a directory")
+    batch_parser.add_argument("action", choices=["list", "extract", "verify"])
+    batch_parser.add_argument("root", help="directory tree to search for .rpa files")
+    batch_parser.add_argument("-o", "--output", default=None, help="output directory for extract")
+    batch_parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes")
+    batch_parser.set_defaults(func=cmd_batch)
+
+    diff_parser = commands.add_parser("diff", help="compare two versions of an archive by file content")
+    diff_parser.add_argument("old")
+    diff_parser.add_argument("new")
+    diff_parser.add_argument("-o", "--output", default=None, help="write a patch that turns OLD into NEW")
+    diff_parser.set_defaults(func=cmd_diff)
+
+    patch_parser = commands.add_parser("patch", help="rebuild the new version of an archive from a patch")
+    patch_parser.add_argument("base", help="the archive the patch was made against")
+    patch_parser.add_argument("patch")
+    patch_parser.add_argument("-o", "--output", required=True, help="output archive")
+    patch_parser.set_defaults(func=cmd_patch)
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except BrokenPipeError:
+        # Читатель закрыл канал (например, head): глушим вывод, чтобы Python не ругался при выходе
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    except (OSError, ValueError) as e:
+        print(f"rpa_cli: error: {e}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
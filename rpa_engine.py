@@ -0,0 +1,2166 @@
+"""Движок архивов Ren'Py RPA без зависимости от Qt: чтение, запись и извлечение"""
+import os
+import io
+import codecs
+import struct
+import time
+import hashlib
+import marshal
+import itertools
+import mmap
+import bisect
+import pickle
+import zlib
+from array import array
+from contextlib import closing
+
+# Разделитель, который Ren'Py пишет перед каждым файлом архива
+RENPY_MAGIC = b"Made with Ren'Py."
+
+def split_by_magic(data, magic: bytes) -> tuple[array, array]:
+    """Находит фрагменты, разделённые magic, и возвращает массивы их смещений и длин"""
+    offsets = array('Q')
+    lengths = array('Q')
+    start = 0
+    while True:
+        idx = data.find(magic, start)
+        if idx == -1:
+            offsets.append(start)
+            lengths.append(len(data) - start)
+            break
+        offsets.append(start)
+        lengths.append(idx - start)
+        start = idx + len(magic)
+    return offsets, lengths
+
+class OperationCancelled(Exception):
+    """Операция прервана пользователем через обратный вызов прогресса"""
+
+# Размер блока при потоковом поиске разделителей
+SCAN_BLOCK_SIZE = 4 * 1024 * 1024
+
+def iter_split_by_magic(f, magic: bytes, block_size: int = SCAN_BLOCK_SIZE, progress=None):
+    """Потоково ищет разделители magic в файле и выдаёт границы фрагментов (смещение, длина).
+    
+    Файл читается блоками фиксированного размера, а последние len(magic)-1 байт
+    блока переносятся в следующий, поэтому разделитель на стыке блоков не теряется.
+    Результат совпадает с split_by_magic для всего содержимого файла.
+    progress(прочитано_байт) вызывается после каждого блока.
+    """
+    tail = b""
+    tail_pos = 0  # Абсолютное смещение начала tail
+    start = 0     # Начало текущего фрагмента
+    while True:
+        block = f.read(block_size)
+        data = tail + block
+        if progress is not None:
+            progress(tail_pos + len(data))
+        pos = max(start - tail_pos, 0)
+        while True:
+            idx = data.find(magic, pos)
+            if idx == -1:
+                break
+            yield start, tail_pos + idx - start
+            start = tail_pos + idx + len(magic)
+            pos = idx + len(magic)
+        if not block:
+            yield start, tail_pos + len(data) - start
+            return
+        # Оставляем только байты, с которых может начаться ещё не найденный разделитель
+        keep = max(len(data) - len(magic) + 1, start - tail_pos)
+        tail = data[keep:]
+        tail_pos += keep
+
+# Архивы меньше этого размера сканируются в одном процессе
+PARALLEL_SCAN_THRESHOLD = 256 * 1024 * 1024
+# Минимальный размер сегмента для параллельного поиска
+PARALLEL_SCAN_MIN_SEGMENT = 16 * 1024 * 1024
+
+def _find_magic_in_segment(path: str, start: int, end: int, magic: bytes) -> array:
+    """Находит все вхождения magic, начинающиеся в [start, end), через собственный mmap файла"""
+    found = array('Q')
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # Сегмент перекрывается со следующим на len(magic)-1 байт
+        stop = min(end + len(magic) - 1, len(mm))
+        idx = mm.find(magic, start, stop)
+        while idx != -1:
+            found.append(idx)
+            idx = mm.find(magic, idx + 1, stop)
+    return found
+
+def process_pool(workers: int):
+    """Создаёт пул процессов, не использующий fork.
+    
+    Пулы запускаются и из многопоточного интерфейса Qt: fork копирует
+    блокировки, захваченные другими потоками, и ребёнок может зависнуть.
+    Задачи пула получают только пути и числа, так что forkserver (или spawn
+    там, где его нет) ничего не стоит, кроме запуска процессов.
+    """
+    # Импортируется по месту: консольная утилита должна запускаться быстро
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+
+def parallel_split_by_magic(path: str, magic: bytes, workers: int = None,
+                            segment_size: int = None, progress=None) -> tuple[array, array]:
+    """Параллельно ищет разделители magic в файле пулом процессов.
+    
+    Файл делится на сегменты, каждый процесс ищет в своём сегменте по общему
+    (страничному кэшу) mmap, а найденные смещения сливаются по порядку с тем же
+    правилом непересечения, что и в split_by_magic, поэтому результат идентичен.
+    progress(просканировано_байт) вызывается после каждого сегмента.
+    """
+    size = os.path.getsize(path)
+    workers = workers or os.cpu_count() or 1
+    if segment_size is None:
+        segment_size = max(PARALLEL_SCAN_MIN_SEGMENT, -(-size // (workers * 4)))
+    segments = [(start, min(start + segment_size, size)) for start in range(0, size, segment_size)]
+    
+    offsets = array('Q')
+    lengths = array('Q')
+    start = 0
+    if segments:
+        pool = process_pool(workers)
+        try:
+            results = pool.map(
+                _find_magic_in_segment,
+                [path] * len(segments),
+                [seg[0] for seg in segments],
+                [seg[1] for seg in segments],
+                [magic] * len(segments)
+            )
+            for (_, segment_end), found in zip(segments, results):
+                for idx in found:
+                    # Вхождения, перекрывающие уже принятый разделитель, пропускаются
+                    if idx < start:
+                        continue
+                    offsets.append(start)
+                    lengths.append(idx - start)
+                    start = idx + len(magic)
+                if progress is not None:
+                    progress(segment_end)
+        finally:
+            # При отмене или ошибке не начатые сегменты снимаются с очереди, а уже
+            # сканируемые дожидаются, чтобы не оставлять процессы с открытым архивом
+            pool.shutdown(wait=True, cancel_futures=True)
+    offsets.append(start)
+    lengths.append(size - start)
+    return offsets, lengths
+
+# Счётчик версий содержимого: по нему кэши в памяти отличают данные фрагментов
+_content_serial = itertools.count()
+# Счётчик постоянных номеров фрагментов (столбец ChunkIndex.ids)
+_chunk_ids = itertools.count()
+
+class ArchiveSource:
+    """Файл архива, отображённый в память только для чтения"""
+    def __init__(self, path: str):
+        self.path = path
+        # Меняется при каждой записи в файл поверх отображения
+        self.serial = next(_content_serial)
+        self.file = open(path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        # Пустой файл нельзя отобразить через mmap
+        if self.size:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.mmap)
+        else:
+            self.mmap = None
+            self.view = memoryview(b"")
+    
+    def pread(self, offset: int, length: int) -> bytes:
+        """Читает диапазон файла по смещению, не меняя позицию файла"""
+        if not hasattr(os, 'pread'):
+            return bytes(self.view[offset:offset + length])
+        parts = []
+        fd = self.file.fileno()
+        while length > 0:
+            data = os.pread(fd, length, offset)
+            if not data:
+                break
+            parts.append(data)
+            offset += len(data)
+            length -= len(data)
+        return b"".join(parts)
+    
+    def close(self):
+        """Закрывает отображение и файл"""
+        self.view.release()
+        if self.mmap is not None:
+            try:
+                self.mmap.close()
+            except BufferError:
+                # Снаружи ещё живут memoryview на фрагменты - mmap закроет сборщик мусора
+                pass
+        self.file.close()
+
+class FileBlob:
+    """Файл на диске, добавленный в индекс по пути: данные читаются только при обращении.
+    
+    Поддерживает len, индексы и срезы, как bytes, поэтому годится для
+    guess_extension и предпросмотра;
+    при сохранении copy_to переносит файл в архив средствами ядра. Если файл
+    изменил размер после добавления, чтение и копирование бросают IOError.
+    """
+    __slots__ = ("path", "size")
+    
+    def __init__(self, path: str, size: int = None):
+        self.path = path
+        self.size = os.stat(path).st_size if size is None else size
+    
+    def __len__(self):
+        return self.size
+    
+    def __getitem__(self, part):
+        if not isinstance(part, slice):
+            return byte_at(self, part)
+        start, stop, _ = part.indices(self.size)
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            return f.read(max(stop - start, 0))
+    
+    def __bytes__(self):
+        data = self[:]
+        if len(data) != self.size:
+            raise IOError(f"File changed on disk: {self.path}")
+        return data
+    
+    def copy_to(self, fd: int, offset: int = 0, length: int = None):
+        """Записывает length байт файла начиная с offset в текущую позицию fd"""
+        if length is None:
+            length = self.size - offset
+        source = ArchiveSource(self.path)
+        try:
+            if source.size != self.size:
+                raise IOError(f"File changed on disk: {self.path}")
+            copy_range(source, offset, length, fd)
+        finally:
+            source.close()
+
+class PrefixedView:
+    """Фрагмент с префиксом RPA, читаемый по частям без склейки префикса с данными.
+    
+    Поддерживает len, индексы и срезы, как bytes; срез копирует только
+    запрошенные байты из префикса и memoryview на архив.
+    """
+    __slots__ = ("prefix", "view")
+    
+    def __init__(self, prefix: bytes, view: memoryview):
+        self.prefix = prefix
+        self.view = view
+    
+    def __len__(self):
+        return len(self.prefix) + len(self.view)
+    
+    def __getitem__(self, part):
+        if not isinstance(part, slice):
+            return byte_at(self, part)
+        start, stop, _ = part.indices(len(self))
+        split = len(self.prefix)
+        head = self.prefix[start:stop]
+        tail = self.view[max(start - split, 0):max(stop - split, 0)]
+        return head + bytes(tail)
+    
+    def __bytes__(self):
+        return self.prefix + bytes(self.view)
+
+def byte_at(blob, i: int) -> int:
+    """Возвращает байт i читаемого по частям фрагмента, как индекс bytes"""
+    if i < 0:
+        i += len(blob)
+    if not 0 <= i < len(blob):
+        raise IndexError("chunk index out of range")
+    return blob[i:i + 1][0]
+
+class _RPAIndexUnpickler(pickle.Unpickler):
+    """Распаковщик индекса RPA, не позволяющий архиву создавать произвольные объекты"""
+    def find_class(self, module, name):
+        # Так протокол 2 записывает bytes из Python 3
+        if (module, name) == ("_codecs", "encode"):
+            return codecs.encode
+        if (module, name) in (("__builtin__", "bytes"), ("builtins", "bytes")):
+            return bytes
+        raise pickle.UnpicklingError(f"Forbidden object in RPA index: {module}.{name}")
+
+def read_rpa_index(source: ArchiveSource):
+    """Читает заголовок и индекс архива Ren'Py RPA-3.0/RPA-2.0.
+    
+    Возвращает (версия, {имя: (смещение, длина, префикс)}) или None, если файл
+    не является архивом RPA. Читаются только заголовок и сжатый индекс.
+    """
+    header = source.pread(0, 64).split(b"\n", 1)[0]
+    fields = header.split()
+    if not fields or fields[0] not in (b"RPA-3.0", b"RPA-2.0"):
+        return None
+    
+    version = fields[0].decode('ascii')
+    try:
+        index_offset = int(fields[1], 16)
+        key = int(fields[2], 16) if version == "RPA-3.0" else 0
+    except (IndexError, ValueError):
+        raise ValueError(f"Malformed {version} header")
+    
+    raw = zlib.decompress(source.pread(index_offset, source.size - index_offset))
+    # Индексы из Python 2 содержат str, поэтому строки читаются как bytes
+    entries = _RPAIndexUnpickler(io.BytesIO(raw), encoding='bytes').load()
+    
+    index = {}
+    for name, parts in entries.items():
+        if isinstance(name, bytes):
+            name = name.decode('utf-8', errors='surrogateescape')
+        offset, length, *rest = parts[0]
+        prefix = rest[0] if rest else b""
+        if isinstance(prefix, str):
+            prefix = prefix.encode('latin-1')
+        index[name] = (offset ^ key, length ^ key, prefix)
+    return version, index
+
+class ChunkIndex:
+    """Компактный индекс фрагментов архива.
+    
+    Фрагменты исходного архива хранятся парами (смещение, длина) в массивах
+    и отдаются как memoryview поверх mmap без копирования. Заменённые и
+    добавленные файлы лежат в разреженном словаре overlay (файлы с диска -
+    как FileBlob, без чтения до сохранения), префиксы RPA - в разреженном
+    словаре prefixes. Имена и типы хранятся списками names и
+    exts; фрагменты без имени в индексе получают имя chunk_N.ext в classify.
+    
+    Для заменённых фрагментов в offsets/lengths остаётся их исходный диапазон,
+    поэтому замена без изменения размера сохраняется записью поверх архива.
+    
+    Данные фрагментов не меняются на месте: замена кладёт в overlay новый
+    объект, а take_rows/insert_rows и content_state/restore_content переносят
+    строки и содержимое ссылками, без копирования байт. На этом строится
+    отмена правок. Столбец ids хранит постоянные номера фрагментов, не
+    меняющиеся при удалении, вставке и перестановке строк.
+    """
+    def __init__(self, source: ArchiveSource = None, offsets: array = None, lengths: array = None,
+                 names: list = None, prefixes: dict = None, format: str = None):
+        self.source = source
+        self.offsets = offsets if offsets is not None else array('Q')
+        self.lengths = lengths if lengths is not None else array('Q')
+        self.names = names if names is not None else [None] * len(self.lengths)
+        self.exts = [None] * len(self.lengths)
+        self.prefixes = prefixes if prefixes is not None else {}
+        self.overlay = {}
+        # Версии содержимого заменённых и добавленных фрагментов
+        self.overlay_ids = {}
+        self.ids = array('Q', itertools.islice(_chunk_ids, len(self.lengths)))
+        self.format = format
+        # Добавлены, удалены или переставлены фрагменты - раскладка архива изменилась
+        self.structure_changed = False
+    
+    @classmethod
+    def open(cls, path: str, magic: bytes, workers: int = None, progress=None,
+             cache: "IndexCache" = None, recover: bool = False) -> "ChunkIndex":
+        """Открывает архив через mmap и строит индекс фрагментов.
+        
+        Если архив есть в cache, индекс вместе с типами берётся оттуда. У архивов
+        RPA читаются только заголовок и индекс. Остальные файлы делятся
+        по magic: большие на многоядерных машинах сканируются параллельно,
+        прочие - потоковым поиском с ограниченным буфером. progress(байт)
+        сообщает о ходе сканирования и может прервать его, бросив OperationCancelled.
+        recover=True доигрывает журнал прерванного сохранения (запись в архив);
+        без него архив с полным журналом не открывается, чтобы чтение ничего не меняло.
+        """
+        # Доводим до конца сохранение, прерванное сбоем; только для чтения архив не трогаем
+        if recover:
+            recover_patch_journal(path)
+        elif has_pending_journal(path):
+            raise IOError(f"{path} has an unfinished save: open it for editing to complete it")
+        
+        source = ArchiveSource(path)
+        try:
+            if cache is not None:
+                chunks = cache.load(source, magic)
+                if chunks is not None:
+                    return chunks
+            
+            rpa = read_rpa_index(source)
+            if rpa is not None:
+                version, index = rpa
+                # Файлы перечисляются в порядке их расположения в архиве
+                members = sorted(index.items(), key=lambda entry: entry[1][0])
+                offsets = array('Q', [entry[0] for _, entry in members])
+                lengths = array('Q', [entry[1] for _, entry in members])
+                names = [name for name, _ in members]
+                prefixes = {i: entry[2] for i, (_, entry) in enumerate(members) if entry[2]}
+                return cls(source, offsets, lengths, names, prefixes, version)
+            
+            workers = workers or os.cpu_count() or 1
+            if workers > 1 and source.size >= PARALLEL_SCAN_THRESHOLD:
+                offsets, lengths = parallel_split_by_magic(path, magic, workers, progress=progress)
+            else:
+                offsets = array('Q')
+                lengths = array('Q')
+                with open(path, 'rb') as f:
+                    for offset, length in iter_split_by_magic(f, magic, progress=progress):
+                        offsets.append(offset)
+                        lengths.append(length)
+        except Exception:
+            source.close()
+            raise
+        return cls(source, offsets, lengths)
+    
+    def __len__(self):
+        return len(self.lengths)
+    
+    def __getitem__(self, i: int):
+        blob = self.overlay.get(i)
+        if blob is not None:
+            return bytes(blob) if isinstance(blob, FileBlob) else blob
+        offset = self.offsets[i]
+        view = self.source.view[offset:offset + self.lengths[i]]
+        prefix = self.prefixes.get(i)
+        return prefix + view if prefix else view
+    
+    def view(self, i: int):
+        """Возвращает фрагмент для чтения по частям, не копируя его целиком.
+        
+        Это memoryview на архив, bytes замены, FileBlob или PrefixedView -
+        все поддерживают len, индексы и срезы.
+        """
+        blob = self.overlay.get(i)
+        if blob is not None:
+            return blob
+        offset = self.offsets[i]
+        view = self.source.view[offset:offset + self.lengths[i]]
+        prefix = self.prefixes.get(i)
+        return PrefixedView(prefix, view) if prefix else view
+    
+    def __setitem__(self, i: int, blob: bytes):
+        self.overlay[i] = blob
+        self.overlay_ids[i] = next(_content_serial)
+        self.exts[i] = guess_extension(blob)
+    
+    def __delitem__(self, i: int):
+        self.take_rows([i])
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    def take_rows(self, rows: list) -> list:
+        """Удаляет фрагменты rows (номера по возрастанию) одним проходом и возвращает их записи.
+        
+        Столбцы собираются из отрезков между удаляемыми строками, разреженные
+        словари сдвигаются делением пополам, так что удаление k строк из n
+        стоит O(n + k log k), а не O(n * k).
+        """
+        rows = list(rows)
+        records = [(self.ids[i], self.offsets[i], self.lengths[i], self.names[i], self.exts[i],
+                    self.prefixes.get(i), self.overlay.get(i), self.overlay_ids.get(i)) for i in rows]
+        bounds = [-1] + rows + [len(self)]
+        segments = [(bounds[j] + 1, bounds[j + 1]) for j in range(len(bounds) - 1)]
+        for column in ("ids", "offsets", "lengths", "names", "exts"):
+            values = getattr(self, column)
+            kept = values[:0]
+            for start, end in segments:
+                kept += values[start:end]
+            setattr(self, column, kept)
+        removed = set(rows)
+        shift = lambda k: k - bisect.bisect_left(rows, k)
+        for column in ("prefixes", "overlay", "overlay_ids"):
+            setattr(self, column, {shift(k): v for k, v in getattr(self, column).items() if k not in removed})
+        self.structure_changed = True
+        return records
+    
+    def insert_rows(self, rows: list, records: list):
+        """Вставляет одним проходом фрагменты, снятые take_rows; rows - их номера после вставки по возрастанию"""
+        rows = list(rows)
+        # Перед какой прежней строкой встаёт каждая запись
+        anchors = [row - j for j, row in enumerate(rows)]
+        columns = list(zip(*records)) if records else [()] * 8
+        for position, column in enumerate(("ids", "offsets", "lengths", "names", "exts")):
+            values = getattr(self, column)
+            merged = values[:0]
+            start = 0
+            for anchor, value in zip(anchors, columns[position]):
+                merged += values[start:anchor]
+                merged.append(value)
+                start = anchor
+            merged += values[start:]
+            setattr(self, column, merged)
+        shift = lambda k: k + bisect.bisect_right(anchors, k)
+        for position, column in ((5, "prefixes"), (6, "overlay"), (7, "overlay_ids")):
+            shifted = {shift(k): v for k, v in getattr(self, column).items()}
+            shifted.update((row, value) for row, value in zip(rows, columns[position]) if value is not None)
+            setattr(self, column, shifted)
+        self.structure_changed = True
+    
+    def reorder(self, order):
+        """Переставляет фрагменты: order - прежние номера строк в новом порядке"""
+        position = array('Q', [0]) * len(order)
+        for new, old in enumerate(order):
+            position[old] = new
+        for column in ("ids", "offsets", "lengths", "names", "exts"):
+            values = getattr(self, column)
+            reordered = [values[i] for i in order]
+            setattr(self, column, array(values.typecode, reordered) if isinstance(values, array) else reordered)
+        for column in ("prefixes", "overlay", "overlay_ids"):
+            setattr(self, column, {position[k]: v for k, v in getattr(self, column).items()})
+        self.structure_changed = True
+    
+    def move_order(self, rows: list, destination: int) -> array:
+        """Порядок для reorder, переносящий строки rows (по возрастанию) перед строкой destination"""
+        moving = set(rows)
+        before = [i for i in range(destination) if i not in moving]
+        after = [i for i in range(destination, len(self)) if i not in moving]
+        return array('Q', before + list(rows) + after)
+    
+    def rows_of(self, ids) -> list:
+        """Возвращает по возрастанию номера строк фрагментов с постоянными номерами ids"""
+        wanted = set(ids)
+        return [i for i, chunk_id in enumerate(self.ids) if chunk_id in wanted]
+    
+    def content_state(self, i: int) -> tuple:
+        """Возвращает содержимое, тип и имя фрагмента i для restore_content"""
+        return self.overlay.get(i), self.overlay_ids.get(i), self.exts[i], self.names[i]
+    
+    def restore_content(self, i: int, state: tuple):
+        """Возвращает фрагменту i содержимое, тип и имя, снятые content_state"""
+        blob, blob_id, self.exts[i], self.names[i] = state
+        if blob is None:
+            self.overlay.pop(i, None)
+            self.overlay_ids.pop(i, None)
+        else:
+            self.overlay[i] = blob
+            self.overlay_ids[i] = blob_id
+    
+    def identity(self, i: int) -> tuple:
+        """Возвращает ключ содержимого фрагмента, неизменный, пока не меняются его данные"""
+        serial = self.overlay_ids.get(i)
+        if serial is not None:
+            return ("blob", serial)
+        return ("source", self.source.serial, self.offsets[i], self.lengths[i], self.prefixes.get(i))
+    
+    def length(self, i: int) -> int:
+        """Возвращает размер фрагмента без обращения к данным"""
+        blob = self.overlay.get(i)
+        if blob is not None:
+            return len(blob)
+        return self.lengths[i] + len(self.prefixes.get(i, b""))
+    
+    def head(self, i: int, size: int) -> bytes:
+        """Возвращает первые size байт фрагмента"""
+        blob = self.overlay.get(i)
+        if blob is not None:
+            return bytes(blob[:size])
+        prefix = self.prefixes.get(i, b"")
+        offset = self.offsets[i]
+        rest = min(max(size - len(prefix), 0), self.lengths[i])
+        return (prefix + bytes(self.source.view[offset:offset + rest]))[:size]
+    
+    def classify(self, i: int) -> str:
+        """Определяет тип фрагмента по его началу и даёт имя безымянному фрагменту"""
+        ext = guess_extension(self.head(i, 1024), self.length(i))
+        self.exts[i] = ext
+        if self.names[i] is None:
+            self.names[i] = f"chunk_{i}{ext}"
+        return ext
+    
+    def read(self, i: int) -> bytes:
+        """Читает фрагмент целиком через pread по его смещению"""
+        blob = self.overlay.get(i)
+        if blob is not None:
+            return bytes(blob)
+        return self.prefixes.get(i, b"") + self.source.pread(self.offsets[i], self.lengths[i])
+    
+    def append(self, blob, name: str = None, ext: str = None):
+        """Добавляет в конец индекса файл из памяти или FileBlob; ext - уже определённый тип"""
+        # У добавленного файла нет диапазона в исходном архиве
+        self.offsets.append(0)
+        self.lengths.append(0)
+        self.names.append(name)
+        self.exts.append(ext or guess_extension(blob))
+        self.ids.append(next(_chunk_ids))
+        self.overlay[len(self.lengths) - 1] = blob
+        self.overlay_ids[len(self.lengths) - 1] = next(_content_serial)
+        self.structure_changed = True
+    
+    def extract(self, i: int, path: str):
+        """Записывает фрагмент целиком (вместе с префиксом RPA) в новый файл path"""
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o666)
+        try:
+            length = self.length(i)
+            if length and hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(fd, 0, length)
+                except OSError:
+                    # Файловая система не поддерживает предвыделение
+                    pass
+            prefix = self.prefixes.get(i)
+            if prefix and i not in self.overlay:
+                write_all(fd, prefix)
+            self.copy_to(i, fd)
+        finally:
+            os.close(fd)
+    
+    def is_source_file(self, path: str) -> bool:
+        """Проверяет, отображён ли указанный файл в память этим индексом"""
+        if self.source is None or not os.path.exists(path):
+            return False
+        return os.path.samefile(self.source.path, path)
+    
+    def copy_to(self, i: int, fd: int):
+        """Записывает данные фрагмента (без префикса RPA) в текущую позицию файла fd"""
+        blob = self.overlay.get(i)
+        if isinstance(blob, FileBlob):
+            blob.copy_to(fd)
+        elif blob is not None:
+            write_all(fd, blob)
+        else:
+            copy_range(self.source, self.offsets[i], self.lengths[i], fd)
+    
+    def copy_part_to(self, i: int, offset: int, length: int, fd: int):
+        """Записывает length байт содержимого фрагмента (вместе с префиксом) начиная с offset"""
+        blob = self.overlay.get(i)
+        if isinstance(blob, FileBlob):
+            blob.copy_to(fd, offset, length)
+            return
+        if blob is not None:
+            write_all(fd, memoryview(blob)[offset:offset + length])
+            return
+        prefix = self.prefixes.get(i, b"")
+        if offset < len(prefix):
+            part = prefix[offset:offset + length]
+            write_all(fd, part)
+            offset += len(part)
+            length -= len(part)
+        if length > 0:
+            copy_range(self.source, self.offsets[i] + offset - len(prefix), length, fd)
+    
+    def can_patch_in_place(self, path: str, names: list = None, replacements: dict = None) -> bool:
+        """Проверяет, можно ли сохранить изменения записью поверх исходного архива RPA.
+        
+        Это возможно, если фрагменты не добавлялись, не удалялись и не
+        переименовывались, а каждый заменённый сохранил размер и не имеет префикса.
+        replacements - ещё не применённые замены {номер: данные}, учитываемые вместе с overlay.
+        """
+        if self.format is None or self.structure_changed or not self.is_source_file(path):
+            return False
+        if names is not None and list(names) != self.names:
+            return False
+        return all(
+            i not in self.prefixes and len(blob) == self.lengths[i]
+            for i, blob in {**self.overlay, **(replacements or {})}.items()
+        )
+    
+    def patch_in_place(self):
+        """Записывает заменённые фрагменты поверх их диапазонов в исходном архиве"""
+        patches = [(self.offsets[i], bytes(blob) if isinstance(blob, FileBlob) else blob)
+                   for i, blob in sorted(self.overlay.items())]
+        apply_patches(self.source.path, patches)
+        # Данные теперь в архиве, а mmap видит их через общий страничный кэш
+        self.overlay = {}
+        self.overlay_ids = {}
+        self.source.serial = next(_content_serial)
+    
+    def save(self, path: str, magic: bytes, names: list = None):
+        """Сохраняет архив в формате RPA-3.0 и переключает индекс на новый файл.
+        
+        Если изменились только содержимое фрагментов без смены размера,
+        исходный архив обновляется на месте под защитой журнала.
+        """
+        if names is None:
+            names = self.names
+        if self.can_patch_in_place(path, names):
+            self.patch_in_place()
+            return
+        
+        offsets, lengths, names = write_rpa_archive(self, path, names, magic)
+        prefixes = {i: prefix for i, prefix in self.prefixes.items() if i not in self.overlay}
+        self.close()
+        self.source = ArchiveSource(path)
+        self.offsets = offsets
+        self.lengths = lengths
+        self.names = names
+        self.prefixes = prefixes
+        self.overlay = {}
+        self.overlay_ids = {}
+        self.format = "RPA-3.0"
+        self.structure_changed = False
+    
+    def close(self):
+        """Освобождает отображение исходного архива"""
+        if self.source is not None:
+            self.source.close()
+            self.source = None
+
+def drop_positions(values, positions: list):
+    """Возвращает копию списка или массива values без элементов с номерами positions.
+    
+    Результат собирается из отрезков между удаляемыми элементами, как в
+    ChunkIndex.take_rows: O(n) копирований в C, а не сдвиг на каждое удаление.
+    """
+    kept = values[:0]
+    start = 0
+    for position in sorted(positions):
+        kept += values[start:position]
+        start = position + 1
+    kept += values[start:]
+    return kept
+
+def merge_sorted(keys, values, pairs: list) -> tuple:
+    """Вставляет пары (ключ, значение), упорядоченные по ключу, в упорядоченные keys и values.
+    
+    Места находятся делением пополам, а столбцы собираются из отрезков,
+    так что вставка k пар в n стоит O(n + k log n). Возвращает новые keys и values.
+    """
+    merged_keys = keys[:0]
+    merged_values = values[:0]
+    start = 0
+    for key, value in pairs:
+        position = bisect.bisect_right(keys, key, start)
+        merged_keys += keys[start:position]
+        merged_values += values[start:position]
+        merged_keys.append(key)
+        merged_values.append(value)
+        start = position
+    merged_keys += keys[start:]
+    merged_values += values[start:]
+    return merged_keys, merged_values
+
+class ChunkSearch:
+    """Индексы для поиска фрагментов по имени, типу, размеру и контрольной сумме.
+    
+    Строится по классифицированному ChunkIndex. Каждый фрагмент получает в
+    индексе постоянную ячейку (slots: ChunkIndex.ids -> ячейка); ячейки
+    разложены по типам, упорядочены по размеру для поиска диапазона делением
+    пополам и отсортированы по началам имени и каждого компонента пути для
+    поиска по префиксу. Индексы хранят ячейки, а не строки, поэтому удаление,
+    вставка и перестановка строк меняют только столбец slot_rows, а update
+    переносит в индексы лишь новые и изменившиеся фрагменты. Удалённые
+    фрагменты остаются в индексах со строкой -1 и отсеиваются при запросе,
+    так что отмена удаления ничего не перестраивает. Суммы считаются только
+    по запросу (index_digests) и запоминаются по ключу содержимого в словаре
+    digests, который можно передать следующему индексу, чтобы не хешировать
+    заново неизменившиеся фрагменты.
+    """
+    def __init__(self, chunks: ChunkIndex, digests: dict = None):
+        self.chunks = chunks
+        count = len(chunks)
+        # Столбец ids, по которому разложены ячейки; сверяется с ChunkIndex в update
+        self.ids = array('Q', chunks.ids)
+        self.slots = dict(zip(self.ids, range(count)))
+        self.slot_rows = array('q', range(count))
+        
+        self.by_ext = {}
+        for slot, ext in enumerate(chunks.exts):
+            self.by_ext.setdefault(ext, array('Q')).append(slot)
+        
+        # Размеры берутся из столбца длин с поправкой на разреженные префиксы и замены
+        sizes = list(chunks.lengths)
+        for i, prefix in chunks.prefixes.items():
+            sizes[i] += len(prefix)
+        for i, blob in chunks.overlay.items():
+            sizes[i] = len(blob)
+        # Размер, тип и имя, под которыми ячейка разложена по индексам
+        self.slot_sizes = array('Q', sizes)
+        self.slot_exts = list(chunks.exts)
+        self.slot_names = list(chunks.names)
+        self.size_slots = array('Q', sorted(range(count), key=sizes.__getitem__))
+        self.sizes = array('Q', [sizes[i] for i in self.size_slots])
+        
+        # Ключ - имя в нижнем регистре, начиная с начала или с любого компонента пути
+        keys = []
+        key_slots = array('Q')
+        for slot, name in enumerate(chunks.names):
+            for key in self.path_keys(name):
+                keys.append(key)
+                key_slots.append(slot)
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.name_keys = [keys[k] for k in order]
+        self.name_slots = array('Q', [key_slots[k] for k in order])
+        
+        # Суммы по ключу содержимого и обратный словарь сумма -> ячейки фрагментов
+        self.digests = digests if digests is not None else {}
+        self.by_digest = None
+    
+    @staticmethod
+    def path_keys(name: str) -> list:
+        """Ключи поиска по имени: имя в нижнем регистре и его хвосты после каждого '/'"""
+        name = (name or "").lower()
+        keys = [name]
+        start = name.find("/") + 1
+        while start:
+            keys.append(name[start:])
+            start = name.find("/", start) + 1
+        return keys
+    
+    def update(self, rows=()):
+        """Переносит в индексы правки ChunkIndex, не строя их заново.
+        
+        rows - строки, у которых могли смениться содержимое, тип или имя;
+        добавленные, удалённые и переставленные строки находятся по столбцу ids.
+        Правка k фрагментов стоит O(n) копирований массивов в C и O(k log n)
+        поисков делением пополам. Словарь сумм сбрасывается, если содержимое
+        хоть одного фрагмента сменилось или он добавлен: index_digests
+        досчитает суммы только для них.
+        """
+        chunks = self.chunks
+        added = []
+        if self.ids != chunks.ids:
+            self.ids = array('Q', chunks.ids)
+            slot_rows = array('q', [-1]) * len(self.slot_rows)
+            for row, slot in enumerate(map(self.slots.get, self.ids)):
+                if slot is None:
+                    added.append(row)
+                else:
+                    slot_rows[slot] = row
+            self.slot_rows = slot_rows
+        changed = []
+        for row in set(rows):
+            slot = self.slots.get(chunks.ids[row])
+            if slot is not None and (self.slot_sizes[slot], self.slot_exts[slot], self.slot_names[slot]) != (
+                    chunks.length(row), chunks.exts[row], chunks.names[row]):
+                changed.append(slot)
+        if rows or added:
+            self.by_digest = None
+        self.remove(changed)
+        for row in added:
+            slot = self.slots[chunks.ids[row]] = len(self.slot_rows)
+            self.slot_rows.append(row)
+            self.slot_sizes.append(0)
+            self.slot_exts.append(None)
+            self.slot_names.append(None)
+            changed.append(slot)
+        self.add(changed)
+    
+    def remove(self, slots: list):
+        """Убирает ячейки slots из индексов размера, имени и типа"""
+        if not slots:
+            return
+        size_positions = []
+        name_positions = []
+        gone = {}
+        for slot in slots:
+            size = self.slot_sizes[slot]
+            lo = bisect.bisect_left(self.sizes, size)
+            hi = bisect.bisect_right(self.sizes, size, lo)
+            size_positions.append(lo + self.size_slots[lo:hi].index(slot))
+            for key in self.path_keys(self.slot_names[slot]):
+                lo, hi = self.name_range(key, exact=True)
+                name_positions.append(lo + self.name_slots[lo:hi].index(slot))
+            gone.setdefault(self.slot_exts[slot], set()).add(slot)
+        self.sizes = drop_positions(self.sizes, size_positions)
+        self.size_slots = drop_positions(self.size_slots, size_positions)
+        self.name_keys = drop_positions(self.name_keys, name_positions)
+        self.name_slots = drop_positions(self.name_slots, name_positions)
+        for ext, removed in gone.items():
+            bucket = array('Q', [slot for slot in self.by_ext[ext] if slot not in removed])
+            if bucket:
+                self.by_ext[ext] = bucket
+            else:
+                del self.by_ext[ext]
+    
+    def add(self, slots: list):
+        """Раскладывает по индексам ячейки slots по текущему состоянию их строк"""
+        if not slots:
+            return
+        chunks = self.chunks
+        sizes = []
+        keys = []
+        for slot in slots:
+            row = self.slot_rows[slot]
+            size = self.slot_sizes[slot] = chunks.length(row)
+            ext = self.slot_exts[slot] = chunks.exts[row]
+            name = self.slot_names[slot] = chunks.names[row]
+            sizes.append((size, slot))
+            keys.extend((key, slot) for key in self.path_keys(name))
+            self.by_ext.setdefault(ext, array('Q')).append(slot)
+        self.sizes, self.size_slots = merge_sorted(self.sizes, self.size_slots, sorted(sizes))
+        self.name_keys, self.name_slots = merge_sorted(self.name_keys, self.name_slots, sorted(keys))
+    
+    def name_range(self, prefix: str, exact: bool = False) -> tuple:
+        """Возвращает границы ключей имени, начинающихся с prefix или, при exact, равных ему"""
+        lo = bisect.bisect_left(self.name_keys, prefix)
+        if exact:
+            return lo, bisect.bisect_right(self.name_keys, prefix, lo)
+        hi = bisect.bisect_left(self.name_keys, prefix + "\U0010ffff", lo)
+        return lo, hi
+    
+    def size_range(self, min_size: int = None, max_size: int = None) -> tuple:
+        """Возвращает границы фрагментов с размером в [min_size, max_size]"""
+        lo = 0 if min_size is None else bisect.bisect_left(self.sizes, min_size)
+        hi = len(self.sizes) if max_size is None else bisect.bisect_right(self.sizes, max_size)
+        return lo, max(lo, hi)
+    
+    def match_name(self, slot: int, prefix: str) -> bool:
+        """Проверяет, начинается ли с prefix имя ячейки slot или один из компонентов его пути"""
+        name = (self.slot_names[slot] or "").lower()
+        return name.startswith(prefix) or "/" + prefix in name
+    
+    def index_digests(self, progress=None):
+        """Считает недостающие суммы MD5 и SHA-1 и строит словарь сумма -> ячейки фрагментов.
+        
+        progress(готово, всего) может прервать работу, бросив OperationCancelled.
+        """
+        chunks = self.chunks
+        by_digest = {}
+        for i in range(len(chunks)):
+            key = chunks.identity(i)
+            digests = self.digests.get(key)
+            if digests is None:
+                digests = self.digests[key] = compute_digests(chunks[i])
+            slot = self.slots[chunks.ids[i]]
+            for digest in digests.values():
+                by_digest.setdefault(digest, []).append(slot)
+            if progress is not None:
+                progress(i + 1, len(chunks))
+        self.by_digest = by_digest
+    
+    def query(self, name: str = "", ext: str = None, min_size: int = None, max_size: int = None,
+              digest: str = None) -> array:
+        """Возвращает по возрастанию номера строк фрагментов, подходящих под все заданные условия.
+        
+        Кандидаты берутся из самого узкого индекса, остальные условия
+        проверяются только для них. Поиск по сумме требует index_digests.
+        """
+        name = name.lower()
+        candidates = []
+        if name:
+            lo, hi = self.name_range(name)
+            candidates.append((hi - lo, "name", lo, hi))
+        if ext is not None:
+            bucket = self.by_ext.get(ext, array('Q'))
+            candidates.append((len(bucket), "ext", 0, len(bucket)))
+        if min_size is not None or max_size is not None:
+            lo, hi = self.size_range(min_size, max_size)
+            candidates.append((hi - lo, "size", lo, hi))
+        if digest:
+            slots = self.by_digest.get(digest.lower(), ())
+            candidates.append((len(slots), "digest", 0, len(slots)))
+        if not candidates:
+            return array('Q', range(len(self.chunks)))
+        
+        _, source, lo, hi = min(candidates)
+        if source == "name":
+            slots = self.name_slots[lo:hi]
+            # Одно имя может совпасть и целиком, и по компоненту пути
+            slots = set(slots) if hi - lo > 1 else slots
+        elif source == "ext":
+            slots = self.by_ext[ext]
+        elif source == "size":
+            slots = self.size_slots[lo:hi]
+        else:
+            slots = self.by_digest.get(digest.lower(), ())
+        
+        # Остальные условия проверяются от дешёвых к дорогим
+        if ext is not None and source != "ext":
+            exts = self.slot_exts
+            slots = [i for i in slots if exts[i] == ext]
+        if (min_size is not None or max_size is not None) and source != "size":
+            sizes = self.slot_sizes
+            low = 0 if min_size is None else min_size
+            high = (self.sizes[-1] if self.sizes else 0) if max_size is None else max_size
+            slots = [i for i in slots if low <= sizes[i] <= high]
+        if digest and source != "digest":
+            matches = set(self.by_digest.get(digest.lower(), ()))
+            slots = [i for i in slots if i in matches]
+        if name and source != "name":
+            slots = [i for i in slots if self.match_name(i, name)]
+        # Удалённые фрагменты остаются в индексах со строкой -1 и после сортировки идут первыми
+        rows = sorted(map(self.slot_rows.__getitem__, slots))
+        return array('Q', rows[bisect.bisect_left(rows, 0):])
+
+def default_cache_dir() -> str:
+    """Каталог кэша приложения в профиле пользователя"""
+    base = os.environ.get("LOCALAPPDATA") if os.name == "nt" else os.environ.get("XDG_CACHE_HOME")
+    return os.path.join(base or os.path.join(os.path.expanduser("~"), ".cache"), "rpa_archiver")
+
+# Размер кэша индексов по умолчанию
+INDEX_CACHE_LIMIT = 64 * 1024 * 1024
+# Сколько байт с начала и с конца архива входит в его отпечаток
+FINGERPRINT_SIZE = 4096
+
+def source_fingerprint(source: ArchiveSource) -> bytes:
+    """Отпечаток архива по его первым и последним FINGERPRINT_SIZE байтам"""
+    view = source.view
+    fingerprint = hashlib.blake2b(view[:FINGERPRINT_SIZE], digest_size=16)
+    fingerprint.update(view[max(len(view) - FINGERPRINT_SIZE, 0):])
+    return fingerprint.digest()
+
+class IndexCache:
+    """Кэш индексов архивов в файле SQLite.
+    
+    Запись привязана к пути архива и действительна, пока совпадают размер,
+    mtime, отпечаток начала и конца файла и magic. В ней хранятся смещения,
+    длины, имена, префиксы и типы фрагментов, поэтому повторное открытие
+    обходится без сканирования и классификации. Если данные превышают limit
+    байт, вытесняются давно не открывавшиеся архивы.
+    
+    Соединение открывается на каждую операцию, поэтому кэшем можно
+    пользоваться из любого потока. Ошибки кэша не мешают открыть архив.
+    """
+    def __init__(self, path: str = None, limit: int = INDEX_CACHE_LIMIT):
+        self.path = path or os.path.join(default_cache_dir(), "index_cache.sqlite")
+        self.limit = limit
+    
+    def connect(self):
+        """Открывает базу кэша, создавая её при необходимости"""
+        import sqlite3
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=5)
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS archives ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, fingerprint BLOB, "
+            "magic BLOB, data BLOB, last_used REAL)"
+        )
+        return db
+    
+    @staticmethod
+    def key(source: ArchiveSource) -> tuple:
+        """Возвращает (путь, размер, mtime, отпечаток) открытого архива"""
+        st = os.fstat(source.file.fileno())
+        return os.path.abspath(source.path), st.st_size, st.st_mtime_ns, source_fingerprint(source)
+    
+    def load(self, source: ArchiveSource, magic: bytes):
+        """Возвращает ChunkIndex поверх source из кэша или None"""
+        import sqlite3
+        try:
+            path, size, mtime_ns, fingerprint = self.key(source)
+            with closing(self.connect()) as db, db:
+                row = db.execute(
+                    "SELECT data FROM archives WHERE path = ? AND size = ? AND mtime_ns = ? "
+                    "AND fingerprint = ? AND magic = ?",
+                    (path, size, mtime_ns, fingerprint, magic)
+                ).fetchone()
+                if row is None:
+                    return None
+                db.execute("UPDATE archives SET last_used = ? WHERE path = ?", (time.time(), path))
+            format, offsets, lengths, names, exts, prefixes = marshal.loads(zlib.decompress(row[0]))
+        except (sqlite3.Error, OSError, ValueError, EOFError, TypeError, zlib.error):
+            return None
+        chunks = ChunkIndex(source, array('Q', offsets), array('Q', lengths), names, prefixes, format)
+        chunks.exts = exts
+        return chunks
+    
+    def store(self, chunks: "ChunkIndex", magic: bytes):
+        """Сохраняет классифицированный индекс архива и вытесняет старые записи"""
+        import sqlite3
+        if chunks.source is None or chunks.overlay or chunks.structure_changed:
+            return
+        try:
+            path, size, mtime_ns, fingerprint = self.key(chunks.source)
+            data = zlib.compress(marshal.dumps((
+                chunks.format, chunks.offsets.tobytes(), chunks.lengths.tobytes(),
+                chunks.names, chunks.exts, chunks.prefixes
+            )), 1)
+            if len(data) > self.limit:
+                return
+            with closing(self.connect()) as db, db:
+                db.execute(
+                    "INSERT OR REPLACE INTO archives VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (path, size, mtime_ns, fingerprint, magic, data, time.time())
+                )
+                self.evict(db)
+        except (sqlite3.Error, OSError, ValueError):
+            pass
+    
+    def evict(self, db):
+        """Удаляет давно не открывавшиеся архивы, пока кэш больше limit"""
+        total = db.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM archives").fetchone()[0]
+        if total <= self.limit:
+            return
+        stale = []
+        for path, length in db.execute("SELECT path, LENGTH(data) FROM archives ORDER BY last_used"):
+            if total <= self.limit:
+                break
+            stale.append((path,))
+            total -= length
+        db.executemany("DELETE FROM archives WHERE path = ?", stale)
+
+# Заглушка заголовка RPA-3.0, перезаписываемая после записи индекса
+RPA3_HEADER_PLACEHOLDER = b"RPA-3.0 XXXXXXXXXXXXXXXX XXXXXXXX\n"
+# Ключ, которым маскируются смещения и длины в индексе RPA-3.0
+RPA3_KEY = 0xDEADBEEF
+# Размер блока при копировании без системных вызовов ядра
+COPY_BLOCK_SIZE = 1024 * 1024
+
+def write_all(fd: int, data):
+    """Записывает данные в файл fd целиком, повторяя частичные записи"""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+def copy_range(source: ArchiveSource, offset: int, length: int, fd: int):
+    """Копирует диапазон исходного архива в текущую позицию файла fd.
+    
+    Используются copy_file_range или sendfile, если ОС их поддерживает,
+    иначе данные копируются блоками из mmap без промежуточных копий.
+    Если файл короче диапазона (архив усечён), бросает IOError.
+    """
+    src_fd = source.file.fileno()
+    for syscall in ("copy_file_range", "sendfile"):
+        if length <= 0 or not hasattr(os, syscall):
+            continue
+        try:
+            while length > 0:
+                if syscall == "copy_file_range":
+                    copied = os.copy_file_range(src_fd, fd, length, offset)
+                else:
+                    copied = os.sendfile(fd, src_fd, offset, length)
+                if not copied:
+                    break
+                offset += copied
+                length -= copied
+        except OSError:
+            # Например, разные файловые системы или sendfile только для сокетов
+            continue
+    # Ядро копирует 0 байт за концом файла, а чтение mmap там падает - ловим это заранее
+    if length > 0 and offset + length > os.fstat(src_fd).st_size:
+        raise IOError(f"{source.path} is shorter than expected: "
+                      f"{offset + length - os.fstat(src_fd).st_size} bytes past the end at offset {offset}")
+    while length > 0:
+        block = min(length, COPY_BLOCK_SIZE)
+        write_all(fd, source.view[offset:offset + block])
+        offset += block
+        length -= block
+
+def pwrite_all(fd: int, data, offset: int):
+    """Записывает данные в файл fd по смещению, не полагаясь на позицию файла"""
+    view = memoryview(data)
+    if not hasattr(os, 'pwrite'):
+        os.lseek(fd, offset, os.SEEK_SET)
+        write_all(fd, view)
+        return
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+def fsync_directory(directory: str):
+    """Фиксирует на диске изменения записей каталога (создание, удаление, переименование)"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+# Журнал изменений, записываемых поверх архива
+JOURNAL_SUFFIX = ".journal"
+JOURNAL_MAGIC = b"RPAJOURNAL1\n"
+_JOURNAL_RECORD = struct.Struct('<QQ')
+
+def apply_patches(path: str, patches: list):
+    """Записывает (смещение, данные) поверх файла path, защищая запись журналом.
+    
+    Сначала все изменения вместе с контрольной суммой записываются в журнал
+    рядом с архивом и фиксируются fsync. Сбой до этого момента оставляет архив
+    нетронутым, а после - журнал доигрывается при следующем открытии.
+    """
+    journal_path = path + JOURNAL_SUFFIX
+    directory = os.path.dirname(os.path.abspath(path))
+    
+    with open(journal_path, 'wb') as journal:
+        crc = 0
+        journal.write(JOURNAL_MAGIC + struct.pack('<Q', len(patches)))
+        for offset, data in patches:
+            record = _JOURNAL_RECORD.pack(offset, len(data))
+            journal.write(record)
+            journal.write(data)
+            crc = zlib.crc32(data, zlib.crc32(record, crc))
+        journal.write(struct.pack('<I', crc))
+        journal.flush()
+        os.fsync(journal.fileno())
+    fsync_directory(directory)
+    
+    _replay_patches(path, patches)
+    os.remove(journal_path)
+    fsync_directory(directory)
+
+def _replay_patches(path: str, patches):
+    """Записывает изменения в файл и дожидается их попадания на диск"""
+    fd = os.open(path, os.O_WRONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        for offset, data in patches:
+            pwrite_all(fd, data, offset)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def read_patch_journal(journal_path: str):
+    """Читает журнал изменений; возвращает список (смещение, данные) или None, если журнал неполон"""
+    with open(journal_path, 'rb') as journal:
+        if journal.read(len(JOURNAL_MAGIC)) != JOURNAL_MAGIC:
+            return None
+        raw_count = journal.read(8)
+        if len(raw_count) != 8:
+            return None
+        patches = []
+        crc = 0
+        for _ in range(struct.unpack('<Q', raw_count)[0]):
+            record = journal.read(_JOURNAL_RECORD.size)
+            if len(record) != _JOURNAL_RECORD.size:
+                return None
+            offset, length = _JOURNAL_RECORD.unpack(record)
+            data = journal.read(length)
+            if len(data) != length:
+                return None
+            crc = zlib.crc32(data, zlib.crc32(record, crc))
+            patches.append((offset, data))
+        raw_crc = journal.read(4)
+        if len(raw_crc) != 4 or struct.unpack('<I', raw_crc)[0] != crc:
+            return None
+    return patches
+
+def has_pending_journal(path: str) -> bool:
+    """Проверяет, лежит ли рядом с архивом полный журнал прерванного сохранения"""
+    journal_path = path + JOURNAL_SUFFIX
+    return os.path.exists(journal_path) and read_patch_journal(journal_path) is not None
+
+def recover_patch_journal(path: str) -> bool:
+    """Доигрывает журнал прерванного сохранения; возвращает True, если архив был исправлен"""
+    journal_path = path + JOURNAL_SUFFIX
+    if not os.path.exists(journal_path):
+        return False
+    patches = read_patch_journal(journal_path)
+    # Неполный журнал означает, что архив ещё не трогали
+    if patches is not None:
+        _replay_patches(path, patches)
+    os.remove(journal_path)
+    fsync_directory(os.path.dirname(os.path.abspath(path)))
+    return patches is not None
+
+def unique_member_names(names: list) -> list:
+    """Делает имена файлов архива уникальными, добавляя к повторам суффикс _N"""
+    used = set()
+    # Следующий суффикс для каждого повторяющегося имени, чтобы не перебирать занятые заново
+    counters = {}
+    result = []
+    for name in names:
+        candidate = name
+        if candidate in used:
+            base_name, ext = os.path.splitext(name)
+            counter = counters.get(name, 1)
+            while candidate in used:
+                candidate = f"{base_name}_{counter}{ext}"
+                counter += 1
+            counters[name] = counter
+        used.add(candidate)
+        result.append(candidate)
+    return result
+
+def write_rpa_archive(chunks: ChunkIndex, path: str, names: list, magic: bytes):
+    """Потоково записывает архив RPA-3.0 и атомарно заменяет им файл path.
+    
+    Неизменённые диапазоны копируются из исходного архива средствами ядра,
+    в памяти держится только индекс. Возвращает новые смещения, длины и имена файлов.
+    """
+    names = unique_member_names(names)
+    
+    def members():
+        for i in range(len(chunks)):
+            blob = chunks.overlay.get(i)
+            length = len(blob) if blob is not None else chunks.lengths[i]
+            prefix = b"" if blob is not None else chunks.prefixes.get(i, b"")
+            yield names[i], prefix, length, lambda fd, i=i: chunks.copy_to(i, fd)
+    
+    offsets, lengths = write_rpa_members(path, members(), magic, chunks)
+    return offsets, lengths, names
+
+def write_rpa_members(path: str, members, magic: bytes, source_index: ChunkIndex = None):
+    """Потоково записывает архив RPA-3.0 из members и атомарно заменяет им файл path.
+    
+    members перечисляет (имя, префикс, длина данных, write(fd)); write дописывает
+    данные файла без префикса в текущую позицию fd. Файлы пишутся по одному во
+    временный файл рядом с path, после fsync он переименовывается в path.
+    source_index - индекс, отображающий path в память: он закрывается перед
+    заменой файла. Возвращает смещения и длины данных файлов.
+    """
+    import tempfile
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        offsets = array('Q')
+        lengths = array('Q')
+        index = {}
+        write_all(fd, RPA3_HEADER_PLACEHOLDER)
+        position = len(RPA3_HEADER_PLACEHOLDER)
+        for name, prefix, length, write in members:
+            write_all(fd, magic)
+            position += len(magic)
+            write(fd)
+            offsets.append(position)
+            lengths.append(length)
+            if prefix:
+                index[name] = [(position ^ RPA3_KEY, length ^ RPA3_KEY, prefix)]
+            else:
+                index[name] = [(position ^ RPA3_KEY, length ^ RPA3_KEY)]
+            position += length
+        
+        # Файл мог остаться короче, если исходный архив был усечён
+        if os.lseek(fd, 0, os.SEEK_END) != position:
+            raise IOError("Source archive changed while saving")
+        
+        write_all(fd, zlib.compress(pickle.dumps(index, 2)))
+        os.lseek(fd, 0, os.SEEK_SET)
+        write_all(fd, b"RPA-3.0 %016x %08x\n" % (position, RPA3_KEY))
+        os.fsync(fd)
+        os.close(fd)
+        fd = None
+        
+        # mkstemp создаёт файл с правами 0600 - берём права заменяемого файла
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_path, 0o666 & ~umask)
+        
+        # На Windows нельзя заменить файл, который отображён в память
+        if source_index is not None and source_index.is_source_file(path):
+            source_path = source_index.source.path
+            source_index.close()
+            try:
+                os.replace(tmp_path, path)
+            except BaseException:
+                source_index.source = ArchiveSource(source_path)
+                raise
+        else:
+            os.replace(tmp_path, path)
+    except BaseException:
+        if fd is not None:
+            os.close(fd)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    
+    # Фиксируем переименование на диске
+    fsync_directory(directory)
+    return offsets, lengths
+
+def safe_relative_path(name: str, fallback: str) -> str:
+    """Превращает имя файла из архива в безопасный относительный путь"""
+    parts = []
+    for part in name.replace("\\", "/").split("/"):
+        part = "".join(c for c in part if c.isalnum() or c in "._- ").strip()
+        if part and part not in (".", ".."):
+            parts.append(part)
+    return os.path.join(*parts) if parts else fallback
+
+# Число потоков извлечения: запись упирается в диск, а не в процессор
+EXTRACT_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+def resolve_output_paths(directory: str, relative_paths: list, check_disk: bool = True) -> list:
+    """Назначает файлам уникальные пути внутри directory, не затирая существующие.
+    
+    Содержимое каждого каталога читается один раз, занятые имена хранятся в
+    множестве, а для повторов запоминается следующий суффикс _N. С
+    check_disk=False каталог считается пустым и диск не читается.
+    """
+    taken = {}
+    counters = {}
+    result = []
+    for relative in relative_paths:
+        parent, filename = os.path.split(os.path.join(directory, relative))
+        used = taken.get(parent)
+        if used is None and not check_disk:
+            used = set()
+            taken[parent] = used
+        elif used is None:
+            try:
+                used = {os.path.normcase(entry) for entry in os.listdir(parent)}
+            except OSError:
+                # Каталога ещё нет
+                used = set()
+            taken[parent] = used
+        candidate = filename
+        if os.path.normcase(candidate) in used:
+            base_name, ext = os.path.splitext(filename)
+            key = (parent, os.path.normcase(filename))
+            counter = counters.get(key, 1)
+            while os.path.normcase(candidate) in used:
+                candidate = f"{base_name}_{counter}{ext}"
+                counter += 1
+            counters[key] = counter
+        used.add(os.path.normcase(candidate))
+        result.append(os.path.join(parent, candidate))
+    return result
+
+def extract_chunks(chunks: ChunkIndex, rows: list, directory: str, workers: int = None, progress=None) -> int:
+    """Параллельно извлекает фрагменты rows в каталог directory.
+    
+    Пути назначаются заранее, после чего файлы пишутся пулом потоков
+    напрямую из исходного архива (copy_file_range/sendfile). progress(done, total)
+    получает число записанных байт и может прервать работу исключением.
+    Возвращает число извлечённых файлов.
+    """
+    relative_paths = [safe_relative_path(chunks.names[row] or "", f"file_{row}") for row in rows]
+    paths = resolve_output_paths(directory, relative_paths)
+    for parent in {os.path.dirname(path) for path in paths}:
+        os.makedirs(parent, exist_ok=True)
+    
+    total = sum(chunks.length(row) for row in rows)
+    done = 0
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    pool = ThreadPoolExecutor(max_workers=workers or EXTRACT_WORKERS)
+    try:
+        futures = {pool.submit(chunks.extract, row, path): row for row, path in zip(rows, paths)}
+        for future in as_completed(futures):
+            future.result()
+            done += chunks.length(futures[future])
+            if progress is not None:
+                progress(done, total)
+    finally:
+        # При ошибке или отмене недошедшие до записи файлы не создаются
+        pool.shutdown(wait=True, cancel_futures=True)
+    return len(paths)
+
+# Потоков определения типов добавляемых файлов: работа упирается в открытие и чтение с диска
+INGEST_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+# Файлов в одном задании пула: меньше накладных расходов на 30 тысячах мелких файлов
+INGEST_BATCH_SIZE = 256
+
+def walk_files(paths: list, progress=None) -> list:
+    """Перечисляет (путь, имя в архиве, размер) для файлов и содержимого каталогов.
+    
+    Каталоги обходятся через os.scandir без рекурсии, имена внутри них берутся
+    относительно самого каталога, файлы идут раньше подкаталогов в порядке
+    имён. Ссылки на каталоги не раскрываются. progress(найдено, 0) вызывается
+    после каждого каталога и может прервать обход исключением.
+    """
+    files = []
+    for item in paths:
+        if not os.path.isdir(item):
+            files.append((item, os.path.basename(item), os.stat(item).st_size))
+            continue
+        stack = [(item, "")]
+        while stack:
+            directory, prefix = stack.pop()
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+            subdirs = []
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append((entry.path, prefix + entry.name + "/"))
+                elif entry.is_file():
+                    files.append((entry.path, prefix + entry.name, entry.stat().st_size))
+            stack.extend(reversed(subdirs))
+            if progress is not None:
+                progress(len(files), 0)
+    return files
+
+def _classify_files(batch: list) -> list:
+    """Определяет типы пачки файлов по их началу и возвращает (FileBlob, имя, тип)"""
+    result = []
+    for path, name, size in batch:
+        blob = FileBlob(path, size)
+        result.append((blob, name, guess_extension(blob)))
+    return result
+
+def ingest_files(paths: list, workers: int = None, progress=None) -> list:
+    """Готовит файлы и каталоги к добавлению в архив без чтения их содержимого.
+    
+    Дерево обходится walk_files, типы определяются пулом потоков по первым
+    килобайтам каждого файла. Возвращает (FileBlob, имя в архиве, тип) в порядке
+    обхода для ChunkIndex.append. progress(done, total) получает число
+    обработанных файлов и может прервать работу исключением.
+    """
+    files = walk_files(paths, progress)
+    batches = [files[start:start + INGEST_BATCH_SIZE] for start in range(0, len(files), INGEST_BATCH_SIZE)]
+    results = [None] * len(batches)
+    done = 0
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    pool = ThreadPoolExecutor(max_workers=workers or INGEST_WORKERS)
+    try:
+        futures = {pool.submit(_classify_files, batch): k for k, batch in enumerate(batches)}
+        for future in as_completed(futures):
+            k = futures[future]
+            results[k] = future.result()
+            done += len(batches[k])
+            if progress is not None:
+                progress(done, len(files))
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    return [entry for batch in results for entry in batch]
+
+def read_replace_mapping(source: str) -> list:
+    """Читает соответствие (фрагмент, файл замены) из каталога или файла-манифеста.
+    
+    В каталоге каждый файл заменяет фрагмент с тем же путём относительно
+    каталога (или с путём, под которым фрагмент извлекается). Манифест - текст UTF-8 со строками "ФРАГМЕНТ<TAB>ФАЙЛ", где
+    фрагмент задаётся именем или номером строки; пустые строки и строки с #
+    пропускаются, относительные пути файлов берутся от каталога манифеста.
+    """
+    if os.path.isdir(source):
+        return [(name, path) for path, name, _ in walk_files([source])]
+    base = os.path.dirname(os.path.abspath(source))
+    mapping = []
+    with open(source, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip("\r\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            member, sep, path = line.partition("\t")
+            if not sep or not path:
+                raise ValueError(f"{source}:{number}: expected MEMBER<TAB>FILE")
+            mapping.append((member, os.path.join(base, path)))
+    return mapping
+
+def resolve_replacements(chunks: ChunkIndex, mapping: list, output: str = None,
+                         extracted_first: bool = False) -> dict:
+    """Проверяет соответствие до записи и возвращает {номер фрагмента: FileBlob}.
+    
+    Фрагмент ищется по имени и по пути, под которым его записывает извлечение
+    всего архива (safe_relative_path и суффиксы _N), а затем по номеру строки:
+    так каталог с извлечёнными и переведёнными файлами подходит для замены как
+    есть. extracted_first ставит путь извлечения впереди имени - для каталогов,
+    где файл ab.txt мог получиться из фрагмента a+b.txt.
+    Размеры всех файлов замены берутся заранее; если задан output, проверяется,
+    что новый архив поместится на диск рядом с ним. Все найденные ошибки
+    собираются в одно исключение ValueError, так что архив не меняется наполовину.
+    """
+    rows_by_name = {name: i for i, name in enumerate(chunks.names)}
+    # Пути, под которыми извлечение всего архива в пустой каталог записывает фрагменты
+    relative_paths = [safe_relative_path(name or "", f"file_{i}") for i, name in enumerate(chunks.names)]
+    extracted = resolve_output_paths("", relative_paths, check_disk=False)
+    rows_by_path = {path.replace(os.sep, "/"): i for i, path in enumerate(extracted)}
+    replacements = {}
+    problems = []
+    for member, path in mapping:
+        lookups = (rows_by_path, rows_by_name) if extracted_first else (rows_by_name, rows_by_path)
+        row = lookups[0].get(member)
+        if row is None:
+            row = lookups[1].get(member)
+        if row is None and member.isdigit() and int(member) < len(chunks):
+            row = int(member)
+        if row is None:
+            problems.append(f"not in archive: {member}")
+            continue
+        if row in replacements:
+            problems.append(f"replaced twice: {member}")
+            continue
+        try:
+            if os.path.isdir(path):
+                raise IsADirectoryError(f"is a directory: {path}")
+            replacements[row] = FileBlob(path)
+        except OSError as e:
+            problems.append(f"{member}: {e}")
+    if problems:
+        raise ValueError("\n".join(problems))
+    
+    # Сохранение поверх исходного архива места не займёт - по тому же условию, что и save
+    if output is not None and not chunks.can_patch_in_place(output, replacements=replacements):
+        import shutil
+        # Новый архив пишется во временный файл рядом с output, старый живёт до переименования
+        size = sum(chunks.length(i) for i in range(len(chunks)))
+        size += sum(len(blob) - chunks.length(i) for i, blob in replacements.items())
+        size += len(chunks) * len(RENPY_MAGIC) + len(RPA3_HEADER_PLACEHOLDER)
+        free = shutil.disk_usage(os.path.dirname(os.path.abspath(output))).free
+        if size > free:
+            raise ValueError(f"not enough disk space for {output}: need {format_size(size)}, "
+                             f"{format_size(free)} free")
+    return replacements
+
+# Расширение архивов Ren'Py, которые ищет пакетная обработка
+ARCHIVE_EXTENSION = ".rpa"
+# Потоков записи на один архив при пакетном извлечении: параллельность даёт пул процессов
+BATCH_EXTRACT_WORKERS = 4
+
+def find_archives(root: str) -> list:
+    """Находит все архивы .rpa в дереве каталогов root"""
+    found = []
+    for directory, dirs, files in os.walk(root):
+        dirs.sort()
+        found.extend(os.path.join(directory, name) for name in sorted(files)
+                     if name.lower().endswith(ARCHIVE_EXTENSION))
+    return found
+
+def verify_chunks(chunks: ChunkIndex) -> str:
+    """Проверяет, что фрагменты лежат в пределах файла, не перекрываются и читаются.
+    
+    Возвращает описание первой найденной проблемы или пустую строку.
+    """
+    size = chunks.source.size if chunks.source is not None else 0
+    previous_end = 0
+    for i in range(len(chunks)):
+        offset, length = chunks.offsets[i], chunks.lengths[i]
+        if offset + length > size:
+            return f"{chunks.names[i]}: range {offset}+{length} is past the end of the file"
+        if chunks.format is not None and offset < previous_end:
+            return f"{chunks.names[i]}: overlaps the previous file"
+        previous_end = offset + length
+        # Чтение всех байт фрагмента выявляет ошибки ввода-вывода
+        zlib.crc32(chunks.source.view[offset:offset + length])
+    return ""
+
+def process_archive(path: str, action: str, root: str = None, output: str = None,
+                    magic: bytes = RENPY_MAGIC, use_cache: bool = True) -> tuple:
+    """Выполняет над одним архивом действие "list", "extract" или "verify".
+    
+    Функция запускается в процессах пула, поэтому принимает и возвращает только
+    простые значения: (путь, число файлов, байт, {тип: число файлов}, ошибка).
+    Архив извлекается в output/<путь архива относительно root без .rpa>.
+    """
+    try:
+        cache = IndexCache() if use_cache and action != "verify" else None
+        chunks = ChunkIndex.open(path, magic, workers=1, cache=cache)
+        try:
+            cached = None not in chunks.exts
+            for i in range(len(chunks)):
+                if not cached:
+                    chunks.classify(i)
+            if cache is not None and not cached:
+                cache.store(chunks, magic)
+            
+            count = len(chunks)
+            types = {}
+            for ext in chunks.exts:
+                types[ext] = types.get(ext, 0) + 1
+            total = sum(chunks.length(i) for i in range(len(chunks)))
+            error = ""
+            if action == "extract":
+                relative = os.path.relpath(path, root) if root else os.path.basename(path)
+                directory = os.path.join(output, os.path.splitext(relative)[0])
+                extract_chunks(chunks, list(range(len(chunks))), directory, workers=BATCH_EXTRACT_WORKERS)
+            elif action == "verify":
+                error = verify_chunks(chunks)
+        finally:
+            chunks.close()
+        return path, count, total, types, error
+    except Exception as e:
+        return path, 0, 0, {}, str(e) or type(e).__name__
+
+def process_archives(paths: list, action: str, root: str = None, output: str = None,
+                     workers: int = None, progress=None, use_cache: bool = True):
+    """Параллельно обрабатывает архивы пулом процессов и перечисляет результаты по мере готовности.
+    
+    Каждый архив - отдельная задача, так что время масштабируется с числом
+    ядер. progress(готово архивов, всего, байт) может прервать работу исключением.
+    """
+    from concurrent.futures import as_completed
+    pool = process_pool(workers or os.cpu_count() or 1)
+    try:
+        futures = [pool.submit(process_archive, path, action, root, output, use_cache=use_cache)
+                   for path in paths]
+        done = 0
+        total_bytes = 0
+        for future in as_completed(futures):
+            result = future.result()
+            done += 1
+            total_bytes += result[2]
+            if progress is not None:
+                progress(done, len(paths), total_bytes)
+            yield result
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+# Файл обновления архива: заголовок с отпечатком базового архива и записи
+# о каждом файле нового архива по порядку
+PATCH_MAGIC = b"RPAPATCH1\n"
+# Размер и отпечаток базового архива, число его фрагментов, число записей
+_PATCH_HEADER = struct.Struct('<Q16sQQ')
+# Операция и длина имени файла в UTF-8, за которыми следует имя
+_PATCH_RECORD = struct.Struct('<BI')
+# Файл взят из базового архива целиком: номер фрагмента, длина
+_PATCH_COPY = struct.Struct('<QQ')
+# Файл собран из блоков фрагмента базы и новых данных: номер фрагмента, длина, число операций
+_PATCH_DELTA = struct.Struct('<QQQ')
+# Операция сборки: вид и два числа (смещение и длина в базе либо длина данных до и после сжатия)
+_PATCH_OP = struct.Struct('<BQQ')
+PATCH_COPY, PATCH_DELTA, PATCH_DATA = range(3)
+DELTA_COPY, DELTA_RAW, DELTA_ZLIB = range(3)
+
+# Блоки дельты режутся по содержимому рулящим хешем: бит каждой позиции -
+# XOR однобитных таблиц gear от DELTA_GEAR_WINDOW последних байт, граница ставится
+# после DELTA_BLOCK_BITS нулевых бит подряд. Концы строк роли не играют, так что
+# двоичные файлы тоже делятся на блоки
+DELTA_BLOCK_BITS = 9
+DELTA_GEAR_WINDOW = 4
+# Больше блоков в одном фрагменте не нужно: для крупных файлов блоки укрупняются
+DELTA_MAX_BLOCKS = 65536
+DELTA_MAX_BLOCK = 64 * 1024
+# Таблицы gear для байта на расстоянии k от позиции: половина значений даёт 0
+GEAR_TABLES = [bytes(zlib.crc32(bytes([b, k])) & 1 for b in range(256)) for k in range(DELTA_GEAR_WINDOW)]
+# Сколько байт данных читается и переводится в биты gear за раз
+DELTA_SEGMENT = 4 * 1024 * 1024
+# Новые данные сжимаются, если их начало сжимается хотя бы до этой доли
+PATCH_COMPRESS_RATIO = 0.9
+PATCH_COMPRESS_SAMPLE = 64 * 1024
+
+def delta_block_bits(size: int) -> int:
+    """Число бит маски gear для данных размера size: средний блок около 2**bits байт"""
+    return max(DELTA_BLOCK_BITS, min(16, (size // DELTA_MAX_BLOCKS).bit_length()))
+
+def gear_bits(raw: bytes, lookback: int) -> bytes:
+    """Биты хеша для позиций raw[lookback:]; raw начинается с lookback предыдущих байт.
+    
+    Таблицы применяются через bytes.translate, а XOR сдвинутых строк
+    считается длинной арифметикой, так что цикла по байтам в Python нет.
+    """
+    raw = bytes(DELTA_GEAR_WINDOW - 1 - lookback) + raw
+    count = len(raw) - (DELTA_GEAR_WINDOW - 1)
+    result = 0
+    for k, table in enumerate(GEAR_TABLES):
+        start = DELTA_GEAR_WINDOW - 1 - k
+        result ^= int.from_bytes(raw[start:start + count].translate(table), 'big')
+    return result.to_bytes(count, 'big')
+
+def content_blocks(data, bits: int = None) -> list:
+    """Делит данные на блоки по содержимому и возвращает концы блоков.
+    
+    data - bytes, memoryview или ChunkIndex.view: читается отрезками по
+    DELTA_SEGMENT, так что память не зависит от размера данных. Байты
+    переводятся gear_bits в биты хеша, и граница блока ставится после bits
+    нулевых бит подряд - это ищет bytes.find, а не цикл Python.
+    Блок не короче 2**(bits-1) и не длиннее max(DELTA_MAX_BLOCK, 2**(bits+3))
+    байт, где бы ни стояли концы строк. Граница зависит только от байт перед
+    ней, поэтому вставка в начало файла сдвигает блоки, но не меняет их.
+    """
+    size = len(data)
+    if bits is None:
+        bits = delta_block_bits(size)
+    min_block = 1 << (bits - 1)
+    max_block = max(DELTA_MAX_BLOCK, 8 << bits)
+    pattern = bytes(bits)
+    ends = []
+    # Биты gear для байт [buffer_start, buffer_start + len(buffer))
+    buffer = b""
+    buffer_start = 0
+    start = 0
+    while start < size:
+        limit = min(start + max_block, size)
+        cut = limit
+        first = start + min_block - bits
+        if first + bits <= limit:
+            if buffer_start + len(buffer) < limit:
+                buffer = buffer[start - buffer_start:]
+                buffer_start = start
+                position = buffer_start + len(buffer)
+                read = max(limit - position, DELTA_SEGMENT)
+                lookback = min(position, DELTA_GEAR_WINDOW - 1)
+                buffer += gear_bits(bytes(data[position - lookback:position + read]), lookback)
+            found = buffer.find(pattern, first - buffer_start, limit - buffer_start)
+            if found >= 0:
+                cut = buffer_start + found + bits
+        ends.append(cut)
+        start = cut
+    return ends
+
+def block_digest(data) -> bytes:
+    """Ключ блока для сопоставления: хранится вместо самих байт блока"""
+    return hashlib.sha1(data).digest()
+
+def delta_ops(base, target) -> list:
+    """Описывает target блоками base и новыми данными.
+    
+    base и target - bytes, memoryview или ChunkIndex.view; блоки базы
+    запоминаются по SHA-1, а не байтами, так что в памяти не держится ни
+    одна версия целиком. Возвращает операции (DELTA_COPY, смещение в base,
+    длина) и (DELTA_RAW, начало, конец в target); соседние операции склеиваются.
+    """
+    bits = delta_block_bits(max(len(base), len(target)))
+    blocks = {}
+    start = 0
+    for end in content_blocks(base, bits):
+        blocks.setdefault(block_digest(base[start:end]), start)
+        start = end
+    ops = []
+    start = 0
+    for end in content_blocks(target, bits):
+        offset = blocks.get(block_digest(target[start:end]))
+        last = ops[-1] if ops else None
+        if offset is None:
+            if last is not None and last[0] == DELTA_RAW:
+                ops[-1] = (DELTA_RAW, last[1], end)
+            else:
+                ops.append((DELTA_RAW, start, end))
+        elif last is not None and last[0] == DELTA_COPY and last[1] + last[2] == offset:
+            ops[-1] = (DELTA_COPY, last[1], last[2] + end - start)
+        else:
+            ops.append((DELTA_COPY, offset, end - start))
+        start = end
+    return ops
+
+def view_digest(data) -> bytes:
+    """SHA-1 данных, прочитанных отрезками по DELTA_SEGMENT"""
+    digest = hashlib.sha1()
+    for position in range(0, len(data), DELTA_SEGMENT):
+        digest.update(data[position:position + DELTA_SEGMENT])
+    return digest.digest()
+
+def chunk_digests(chunks: ChunkIndex, progress=None) -> list:
+    """Считает SHA-1 содержимого каждого фрагмента вместе с префиксом.
+    
+    progress(байт, всего) может прервать работу, бросив OperationCancelled.
+    """
+    total = sum(chunks.length(i) for i in range(len(chunks)))
+    done = 0
+    digests = []
+    for i in range(len(chunks)):
+        digests.append(view_digest(chunks.view(i)))
+        done += chunks.length(i)
+        if progress is not None:
+            progress(done, total)
+    return digests
+
+class ArchiveDiff:
+    """Сопоставление файлов двух версий архива по содержимому.
+    
+    plan - по записи на каждый файл нового архива: (PATCH_COPY, номер в старом)
+    для неизменённых и перемещённых, (PATCH_DELTA, номер в старом) для
+    изменённых файлов с тем же именем и (PATCH_DATA, None) для добавленных.
+    Списки added, removed, moved и changed содержат имена файлов.
+    """
+    def __init__(self, old: ChunkIndex, new: ChunkIndex, progress=None):
+        self.old = old
+        self.new = new
+        old_digests = chunk_digests(old, progress)
+        new_digests = chunk_digests(new, progress)
+        
+        by_digest = {}
+        for i, digest in enumerate(old_digests):
+            by_digest.setdefault(digest, []).append(i)
+        old_rows = {name: i for i, name in enumerate(old.names)}
+        new_names = set(new.names)
+        
+        self.plan = []
+        self.added = []
+        self.moved = []
+        self.changed = []
+        self.unchanged = 0
+        reused = set()
+        for j, name in enumerate(new.names):
+            same_name = old_rows.get(name)
+            candidates = by_digest.get(new_digests[j])
+            if candidates:
+                # Из одинаковых копий берём ту, что лежит под тем же именем
+                row = same_name if same_name in candidates else candidates[0]
+                self.plan.append((PATCH_COPY, row))
+                reused.add(row)
+                if row == same_name:
+                    self.unchanged += 1
+                else:
+                    self.moved.append(name)
+            elif same_name is not None:
+                self.plan.append((PATCH_DELTA, same_name))
+                self.changed.append(name)
+            else:
+                self.plan.append((PATCH_DATA, None))
+                self.added.append(name)
+        self.removed = [name for i, name in enumerate(old.names) if name not in new_names and i not in reused]
+    
+    def write_patch(self, path: str, progress=None) -> int:
+        """Записывает файл обновления и возвращает его размер.
+        
+        В файл попадают только байты, которых нет в старом архиве: изменённые
+        файлы описываются блоками старой версии и новыми данными.
+        progress(готово, всего) может прервать работу, бросив OperationCancelled.
+        """
+        old, new = self.old, self.new
+        with open(path, 'wb') as f:
+            f.write(PATCH_MAGIC)
+            f.write(_PATCH_HEADER.pack(old.source.size, source_fingerprint(old.source), len(old), len(new)))
+            for j, (op, row) in enumerate(self.plan):
+                name = new.names[j].encode("utf-8", errors="surrogateescape")
+                ops = None
+                if op == PATCH_DELTA:
+                    # Версии читаются отрезками: изменённое видео не копируется в память целиком
+                    target = new.view(j)
+                    ops = delta_ops(old.view(row), target)
+                    # Без общих блоков дельта ничего не даёт
+                    if not any(kind == DELTA_COPY for kind, _, _ in ops):
+                        op = PATCH_DATA
+                f.write(_PATCH_RECORD.pack(op, len(name)))
+                f.write(name)
+                if op == PATCH_COPY:
+                    f.write(_PATCH_COPY.pack(row, old.length(row)))
+                elif op == PATCH_DELTA:
+                    f.write(_PATCH_DELTA.pack(row, len(target), len(ops)))
+                    for kind, a, b in ops:
+                        if kind == DELTA_COPY:
+                            f.write(_PATCH_OP.pack(DELTA_COPY, a, b))
+                        else:
+                            write_patch_data(f, target, a, b)
+                else:
+                    data = new.view(j)
+                    write_patch_data(f, data, 0, len(data))
+                if progress is not None:
+                    progress(j + 1, len(self.plan))
+            return f.tell()
+
+def write_patch_data(f, data, start: int, end: int):
+    """Записывает байты data[start:end] в файл обновления, сжимая их, если это выгодно.
+    
+    Данные читаются и сжимаются отрезками; размер сжатых данных дописывается
+    в заголовок операции после них.
+    """
+    size = end - start
+    sample = bytes(data[start:start + min(size, PATCH_COMPRESS_SAMPLE)])
+    compress = sample and len(zlib.compress(sample, 1)) < len(sample) * PATCH_COMPRESS_RATIO
+    header = f.tell()
+    f.write(_PATCH_OP.pack(DELTA_ZLIB if compress else DELTA_RAW, size, size))
+    compressor = zlib.compressobj(6) if compress else None
+    stored = 0
+    for position in range(start, end, DELTA_SEGMENT):
+        block = data[position:min(position + DELTA_SEGMENT, end)]
+        if compressor is not None:
+            block = compressor.compress(block)
+        f.write(block)
+        stored += len(block)
+    if compressor is not None:
+        block = compressor.flush()
+        f.write(block)
+        stored += len(block)
+        f.seek(header)
+        f.write(_PATCH_OP.pack(DELTA_ZLIB, size, stored))
+        f.seek(0, os.SEEK_END)
+
+def read_exact(f, size: int) -> bytes:
+    """Читает ровно size байт файла обновления"""
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Patch file is truncated")
+    return data
+
+def copy_patch_data(f, fd: int, kind: int, size: int, stored: int):
+    """Переносит блоками новые данные из файла обновления в текущую позицию fd"""
+    if kind not in (DELTA_RAW, DELTA_ZLIB) or (kind == DELTA_RAW and stored != size):
+        raise ValueError("Patch file is corrupt")
+    decompressor = zlib.decompressobj() if kind == DELTA_ZLIB else None
+    written = 0
+    while stored > 0:
+        block = read_exact(f, min(stored, COPY_BLOCK_SIZE))
+        stored -= len(block)
+        if decompressor is not None:
+            block = decompressor.decompress(block)
+        write_all(fd, block)
+        written += len(block)
+    if decompressor is not None:
+        block = decompressor.flush()
+        write_all(fd, block)
+        written += len(block)
+    if written != size:
+        raise ValueError("Patch file is corrupt")
+
+def apply_delta(f, fd: int, base: ChunkIndex, row: int, op_count: int, size: int):
+    """Собирает изменённый файл из блоков фрагмента row базы и новых данных"""
+    base_length = base.length(row)
+    written = 0
+    for _ in range(op_count):
+        kind, a, b = _PATCH_OP.unpack(read_exact(f, _PATCH_OP.size))
+        if kind == DELTA_COPY:
+            if a + b > base_length:
+                raise ValueError("Patch file is corrupt")
+            base.copy_part_to(row, a, b, fd)
+            written += b
+        else:
+            copy_patch_data(f, fd, kind, a, b)
+            written += a
+    if written != size:
+        raise ValueError("Patch file is corrupt")
+
+def apply_archive_patch(base_path: str, patch_path: str, output_path: str, magic: bytes = RENPY_MAGIC,
+                        progress=None) -> int:
+    """Собирает новую версию архива из базового архива и файла обновления.
+    
+    Файл обновления читается последовательно, новый архив RPA-3.0 пишется
+    потоком: неизменённые файлы копируются из базы средствами ядра.
+    progress(готово, всего) может прервать работу, бросив OperationCancelled.
+    Возвращает число файлов нового архива.
+    """
+    base = ChunkIndex.open(base_path, magic)
+    try:
+        with open(patch_path, 'rb') as f:
+            if f.read(len(PATCH_MAGIC)) != PATCH_MAGIC:
+                raise ValueError("Not an archive patch file")
+            size, fingerprint, base_count, count = _PATCH_HEADER.unpack(read_exact(f, _PATCH_HEADER.size))
+            if (size, fingerprint, base_count) != (base.source.size, source_fingerprint(base.source), len(base)):
+                raise ValueError("The patch was made for a different version of the archive")
+            
+            def base_row(row: int) -> int:
+                if row >= len(base):
+                    raise ValueError("Patch file is corrupt")
+                return row
+            
+            def members():
+                # Каждая запись читается непосредственно перед записью её данных
+                for j in range(count):
+                    op, name_length = _PATCH_RECORD.unpack(read_exact(f, _PATCH_RECORD.size))
+                    name = read_exact(f, name_length).decode("utf-8", errors="surrogateescape")
+                    if op == PATCH_COPY:
+                        row, length = _PATCH_COPY.unpack(read_exact(f, _PATCH_COPY.size))
+                        if base.length(base_row(row)) != length:
+                            raise ValueError("Patch file is corrupt")
+                        yield name, base.prefixes.get(row, b""), base.lengths[row], lambda fd, row=row: base.copy_to(row, fd)
+                    elif op == PATCH_DELTA:
+                        row, length, op_count = _PATCH_DELTA.unpack(read_exact(f, _PATCH_DELTA.size))
+                        yield name, b"", length, lambda fd, row=base_row(row), op_count=op_count, length=length: \
+                            apply_delta(f, fd, base, row, op_count, length)
+                    elif op == PATCH_DATA:
+                        kind, length, stored = _PATCH_OP.unpack(read_exact(f, _PATCH_OP.size))
+                        yield name, b"", length, lambda fd, kind=kind, length=length, stored=stored: \
+                            copy_patch_data(f, fd, kind, length, stored)
+                    else:
+                        raise ValueError("Patch file is corrupt")
+                    if progress is not None:
+                        progress(j + 1, count)
+            
+            write_rpa_members(output_path, members(), magic, base)
+    finally:
+        base.close()
+    return count
+
+# Файл сигнатур
+SIGNATURES_FILE = "signatures.json"
+
+# Стандартные сигнатуры файлов (если файл не существует)
+DEFAULT_SIGNATURES = {
+    "signatures": [
+        {"magic": "89504E47", "extension": ".png", "description": "PNG Image"},
+        {"magic": "FFD8FF", "extension": ".jpg", "description": "JPEG Image"},
+        {"magic": "4F676753", "extension": ".ogg", "description": "Ogg Vorbis Audio"},
+        {"magic": "52494646", "extension": ".wav", "description": "WAV Audio"},
+        {"magic": "494433", "extension": ".mp3", "description": "MP3 Audio"},
+        {"magic": "664C6143", "extension": ".flac", "description": "FLAC Audio"},
+        {"magic": "1A45DFA3", "extension": ".mkv", "description": "Matroska Video"},
+        {"magic": "0000002066747970", "extension": ".mp4", "description": "MP4 Video"},
+        {"magic": "25504446", "extension": ".pdf", "description": "PDF Document"},
+        {"magic": "7B5C727466", "extension": ".rtf", "description": "Rich Text Format"},
+        {"magic": "504B0304", "extension": ".zip", "description": "ZIP Archive"},
+        {"magic": "7F454C46", "extension": ".elf", "description": "ELF Executable"},
+        {"magic": "4D5A", "extension": ".exe", "description": "Windows Executable"},
+        {"magic": "2321", "extension": ".sh", "description": "Shell Script"},
+        {"magic": "47494638", "extension": ".gif", "description": "GIF Image"},
+        {"magic": "52617221", "extension": ".rar", "description": "RAR Archive"},
+        {"magic": "1F8B08", "extension": ".gz", "description": "GZIP Archive"},
+        {"magic": "57454250", "offset": 8, "extension": ".webp", "description": "WebP Image"},
+        {"magic": "57415645", "offset": 8, "extension": ".wav", "description": "WAV Audio"},
+        {"magic": "41564920", "offset": 8, "extension": ".avi", "description": "AVI Video"},
+        {"magic": "66747970", "offset": 4, "extension": ".mp4", "description": "MP4/ISO Media Video"}
+    ]
+}
+
+def load_signatures() -> dict:
+    """Читает таблицу сигнатур из файла, не создавая его, или возвращает стандартную"""
+    import json
+    try:
+        if os.path.exists(SIGNATURES_FILE):
+            with open(SIGNATURES_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+    except Exception as e:
+        print(f"[ERROR] Failed to load {SIGNATURES_FILE}: {str(e)}")
+    return DEFAULT_SIGNATURES
+
+class SignatureMatcher:
+    """Таблица сигнатур, один раз скомпилированная для поиска по первым байтам.
+    
+    Сигнатуры группируются по смещению (поле "offset", по умолчанию 0) и
+    раскладываются по словарям с ключом из первых KEY_SIZE байт, поэтому
+    проверка фрагмента стоит несколько поисков в словаре. Из совпавших
+    побеждает сигнатура, заканчивающаяся дальше от начала файла (WEBP на +8
+    точнее RIFF на 0), а при равенстве - стоящая раньше в списке.
+    """
+    KEY_SIZE = 2
+    
+    def __init__(self, signatures: list):
+        tables = {}
+        for order, sig in enumerate(signatures):
+            magic = bytes.fromhex(sig["magic"])
+            if not magic:
+                continue
+            offset = sig.get("offset", 0)
+            key_size = min(len(magic), self.KEY_SIZE)
+            priority = (-(offset + len(magic)), order)
+            table = tables.setdefault((offset, key_size), {})
+            table.setdefault(magic[:key_size], []).append((priority, magic, sig["extension"]))
+        for table in tables.values():
+            for candidates in table.values():
+                candidates.sort()
+        # (смещение, конец ключа, словарь ключ -> кандидаты по убыванию приоритета)
+        self.tables = [(offset, offset + key_size, table) for (offset, key_size), table in sorted(tables.items())]
+    
+    def match(self, head: bytes):
+        """Возвращает расширение по сигнатуре или None"""
+        best = None
+        for offset, key_end, table in self.tables:
+            candidates = table.get(head[offset:key_end])
+            if not candidates:
+                continue
+            for priority, magic, ext in candidates:
+                if head.startswith(magic, offset):
+                    if best is None or priority < best[0]:
+                        best = (priority, ext)
+                    break
+        return best[1] if best is not None else None
+
+_signature_matcher = None
+
+def get_signature_matcher() -> SignatureMatcher:
+    """Возвращает скомпилированную таблицу сигнатур, собирая её при первом обращении"""
+    global _signature_matcher
+    if _signature_matcher is None:
+        _signature_matcher = SignatureMatcher(load_signatures()["signatures"])
+    return _signature_matcher
+
+# Печатные ASCII-символы, табуляция/переводы строк и все байты старше 0x7F,
+# из которых состоят многобайтовые символы UTF-8
+TEXT_BYTES = bytes(range(0x20, 0x7F)) + b"\t\n\r" + bytes(range(0x80, 0x100))
+
+def is_text_sample(head: bytes, complete: bool = True) -> bool:
+    """Проверяет, похоже ли начало фрагмента на текст в ASCII или UTF-8.
+    
+    Вместо перебора байтов в Python удаляем допустимые байты через
+    bytes.translate: если что-то осталось, это управляющие символы. Выборку
+    не из чистого ASCII дополнительно проверяет декодер UTF-8.
+    complete=False означает, что выборка обрезана и последний символ UTF-8
+    может быть неполным.
+    """
+    if head.translate(None, TEXT_BYTES):
+        return False
+    if head.isascii():
+        return True
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # Обрезанный на границе выборки символ текстом не мешает
+        return not complete and e.reason == "unexpected end of data"
+    return True
+
+def guess_extension(blob, size: int = None) -> str:
+    """Определяет расширение файла на основе его сигнатуры.
+    
+    blob может быть уже обрезанным началом файла - тогда size задаёт полный
+    размер, чтобы символ UTF-8 на границе выборки не сделал текст двоичным.
+    """
+    # Берём только начало фрагмента: blob может быть memoryview на весь файл
+    head = bytes(blob[:1024])
+    ext = get_signature_matcher().match(head)
+    if ext is not None:
+        return ext
+    
+    if size is None:
+        size = len(blob)
+    if is_text_sample(head, complete=size <= len(head)):
+        return ".txt"
+    
+    return ".bin"
+
+def compute_digests(blob, algorithms=("md5", "sha1")) -> dict:
+    """Считает контрольные суммы фрагмента; hashlib отпускает GIL, поэтому годится для пула потоков"""
+    if isinstance(blob, (FileBlob, PrefixedView)):
+        blob = bytes(blob)
+    return {name: hashlib.new(name, blob).hexdigest() for name in algorithms}
+
+def format_size(size: int) -> str:
+    """Форматирует размер файла для отображения в дереве"""
+    return f"{size} bytes" if size < 1024 else f"{size/1024:.1f} KB"
+
+# Множители суффиксов размера для parse_size
+SIZE_UNITS = {"": 1, "B": 1, "K": 1024, "KB": 1024, "M": 1024 ** 2, "MB": 1024 ** 2, "G": 1024 ** 3, "GB": 1024 ** 3}
+
+def parse_size(text: str) -> int:
+    """Разбирает размер вида 1500, 10K или 2.5 MB; пустая строка даёт None"""
+    text = text.strip().upper()
+    if not text:
+        return None
+    number = text.rstrip("BKMG ").strip()
+    unit = text[len(number):].strip()
+    if unit not in SIZE_UNITS:
+        raise ValueError(f"unknown size unit: {unit}")
+    return int(float(number) * SIZE_UNITS[unit])